@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Render-Benchmark ohne Hardware (DM_BACKEND=soft): loop() aus dm_tomatrixled mit festen Abfahrten/Meldungen
+# für mehrere Darstellungskonfigurationen, pro Frame p50/p95/p99 und Allokationen, Vergleich mit golden frames.
+#
+#   python3 bench/dm_bench.py [-c CONFIG ...] [--frames N] [--report bench.json] [--update-golden]
+#
+# Alle Konfigurationen laufen nacheinander in diesem Prozess, jede mit eigenem dm_tomatrixled.makecontext().
+from argparse import ArgumentParser
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from json import dumps
+from os import chdir, environ, makedirs, path
+from platform import machine, python_version
+from time import perf_counter, struct_time
+import sys
+import tracemalloc
+
+benchdir = path.dirname(path.abspath(__file__))
+repodir = path.dirname(benchdir)
+goldendir = path.join(benchdir, "golden")
+
+# Name: Kommandozeilenparameter für dm_tomatrixled.py
+configs = {
+    "default": [],
+    "top": ["-t"],
+    "r1": ["-r1"],
+    "r2": ["-r2"],
+    "r3-top": ["-r3", "-t"],
+    "prop-r1": ["-p", "-r1", "-l8", "-f8"],
+    "prop-top-progress": ["-p", "-t", "--show-progress"],
+    "christmas": ["-t", "--christmas"],
+    "small": ["--small", "-t"],
+    "small-r1-progress": ["--small", "-r1", "--show-progress"],
+    "tall-top-r1": ["--led-rows", "64", "-t", "-r1", "-l8", "-f8"],
+    # muss genau wie r3-top aussehen
+    "r3-top-strips": ["-r3", "-t", "--scroll-strips"],
+}
+
+golden_frames = (0, 30, 75)
+warmup_frames = 5
+benchtime = struct_time((2019, 3, 1, 12, 34, 56, 4, 60, 0))
+
+
+class BenchDone(Exception):
+    pass
+
+
+def canned_data(tz):
+    from dm_depdata import Departure, MOT
+    now = datetime(*benchtime[:6], tzinfo=tz).replace(second=0)
+
+    def dep(linenum, direction, countdown, realtime=True, delay=0, mot=MOT.BUS, messages=(), **kwargs):
+        return Departure(linenum=linenum, direction=direction, direction_planned=kwargs.pop("direction_planned", direction),
+                         deptime=now+timedelta(minutes=countdown), deptime_planned=now+timedelta(minutes=countdown-delay),
+                         realtime=realtime, delay=delay, messages=list(messages), mot=mot, stopname="Hagen Hauptbahnhof",
+                         disp_countdown=countdown, **kwargs)
+
+    longmsg = ("Wegen einer Baustelle in der Eckeseyer Straße werden die Haltestellen Eckesey Kirche, Eckeseyer Brücke und "
+               "Sonderburgstraße in beiden Richtungen nicht bedient. Bitte nutzen Sie die Ersatzhaltestellen in der "
+               "Droste-Hülshoff-Straße. Wir bitten um Ihr Verständnis.")
+    deps = [dep("512", "Hohenlimburg Bahnhof", 0, messages=[longmsg]),
+            dep("ICE 612", "Berlin Hbf (tief)", 0, delay=6, mot=MOT.HISPEED),
+            dep("RE16", "Iserlohn", 2, delay=2, mot=MOT.TRAIN),
+            dep("SB71", "Dortmund Hbf", 4, cancelled=True),
+            dep("542", "Wetter, Vorhalle Bahnhof", 6, direction_planned="Wetter Bahnhof", earlytermination=True, delay=1),
+            dep("CE 12", "Altenhagen Brücke", 9, realtime=False, messages=["Umleitung wegen Sperrung"]),
+            dep("S5", "Dortmund Hbf", 11, delay=-1, mot=MOT.TRAIN),
+            dep("518", "Emst Reher Weg", 15, messages=[longmsg]),
+            dep("ICE 1234", "München Hbf über Frankfurt (Main) Hbf", 75, mot=MOT.HISPEED),
+            dep("H-Bahn", "Campus Nord", 90, mot=MOT.HANGING),
+            ]
+    return deps
+
+
+class CannedExecutor:
+    # statt ProcessPoolExecutor: getdeps synchron mit festen Abfahrten ausführen
+    def __init__(self, tz):
+        import dm_depdata
+        self.tz = tz
+        # wie ein neuer Abrufprozess: das erste Ergebnis ist nie DepsUnchanged
+        dm_depdata._lastreturned = None
+
+    def submit(self, fn, **kwargs):
+        from copy import deepcopy
+        deps = canned_data(self.tz)
+        kwargs["depfunctions"] = {("bench", True): [(lambda: (deepcopy(deps), [], {}), [{}])]}
+        f = Future()
+        f.set_result(fn(**kwargs))
+        return f
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(p/100*(len(values)-1))))]
+
+
+def readppm(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    header = data.split(maxsplit=4)
+    return int(header[1]), int(header[2]), header[4]
+
+
+def setup():
+    environ["DM_BACKEND"] = "soft"
+    chdir(repodir)
+    sys.path.insert(0, repodir)
+    import dm_tomatrixled as dm
+    from loguru import logger
+    logger.remove()
+    dm.localtime = lambda *_: benchtime
+    return dm
+
+
+def runconfig(dm, name, frames, update_golden):
+    import dm_backend
+    # jedes Bild zeichnen, sonst stimmen die Bildnummern (golden frames) nicht mehr
+    # ohne --last-good, sonst hinge das erste Bild vom vorherigen Lauf ab
+    ctx = dm.makecontext(["--sleep-interval", "0", "--redraw-unchanged", "--last-good", "", *configs[name]])
+
+    def run_frames(n, measure_alloc):
+        matrix = dm_backend.RGBMatrix(options=ctx.options)
+        times = []
+        allocs = []
+        goldens = {}
+        _swap = matrix.SwapOnVSync
+        last = [perf_counter()]
+
+        def swap(canvas, *args):
+            now = perf_counter()
+            i = len(times)
+            times.append(now - last[0])
+            if measure_alloc:
+                current, peak = tracemalloc.get_traced_memory()
+                allocs.append(peak - current)
+                # setzt auch peak zurück (reset_peak() erst ab Python 3.9), gezählt wird dann ab diesem Bild
+                tracemalloc.clear_traces()
+            elif i in golden_frames:
+                goldens[i] = bytes(canvas.buffer)
+            if len(times) >= n:
+                raise BenchDone()
+            result = _swap(canvas, *args)
+            last[0] = perf_counter()
+            return result
+
+        matrix.SwapOnVSync = swap
+        try:
+            dm.loop(ctx, matrix, CannedExecutor(ctx.tz))
+        except BenchDone:
+            pass
+        return times, allocs, goldens, (matrix.width, matrix.height)
+
+    times, _, goldens, (width, height) = run_frames(frames, False)
+    tracemalloc.start()
+    _, allocs, _, _ = run_frames(min(frames, 100), True)
+    tracemalloc.stop()
+
+    golden = {"checked": 0, "mismatched": [], "missing": []}
+    for fi, buffer in sorted(goldens.items()):
+        filename = path.join(goldendir, f"{name}-{fi:04}.ppm")
+        if update_golden:
+            makedirs(goldendir, exist_ok=True)
+            with open(filename, "wb") as f:
+                f.write(f"P6 {width} {height} 255\n".encode() + buffer)
+            continue
+        if not path.exists(filename):
+            golden["missing"].append(path.basename(filename))
+            continue
+        golden["checked"] += 1
+        g_w, g_h, g_data = readppm(filename)
+        if (g_w, g_h) != (width, height) or g_data != buffer:
+            golden["mismatched"].append(path.basename(filename))
+
+    frametimes = [t*1000 for t in times[warmup_frames:]]
+    allocs = [a/1024 for a in allocs[warmup_frames:]]
+    return {"args": configs[name],
+            "frames": len(frametimes),
+            "first_ms": round(times[0]*1000, 3),
+            "mean_ms": round(sum(frametimes)/len(frametimes), 3),
+            "p50_ms": round(percentile(frametimes, 50), 3),
+            "p95_ms": round(percentile(frametimes, 95), 3),
+            "p99_ms": round(percentile(frametimes, 99), 3),
+            "alloc_peak_kib_p50": round(percentile(allocs, 50), 2),
+            "alloc_peak_kib_max": round(max(allocs), 2),
+            "golden": golden}
+
+
+def main():
+    parser = ArgumentParser(description="render benchmark with golden frames (software matrix)")
+    parser.add_argument("-c", "--config", action="append", choices=sorted(configs), help="configuration(s) to run. Default: all", default=[])
+    parser.add_argument("--frames", action="store", help="frames per configuration. Default: 300", default=300, type=int)
+    parser.add_argument("--report", action="store", help="write JSON report to this file. Default: stdout only", default="", type=str)
+    parser.add_argument("--update-golden", action="store_true", help="write golden frames instead of comparing")
+    args = parser.parse_args()
+
+    dm = setup()
+    results = {}
+    failed = False
+    for name in (args.config or configs):
+        results[name] = r = runconfig(dm, name, args.frames, args.update_golden)
+        g = r["golden"]
+        failed = failed or bool(g["mismatched"])
+        print(f"{name:20} p50 {r['p50_ms']:7.3f} ms  p95 {r['p95_ms']:7.3f} ms  p99 {r['p99_ms']:7.3f} ms  "
+              f"alloc {r['alloc_peak_kib_p50']:6.1f} KiB  golden {g['checked']-len(g['mismatched'])}/{g['checked']}"
+              + (f" MISMATCH {' '.join(g['mismatched'])}" if g["mismatched"] else "")
+              + (f" missing {len(g['missing'])}" if g["missing"] else ""), file=sys.stderr)
+
+    report = {"python": python_version(), "machine": machine(), "frames": args.frames, "configs": results}
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(dumps(report, indent=1))
+    else:
+        print(dumps(report, indent=1))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
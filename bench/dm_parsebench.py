@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Parser-Benchmark für EFA-Antworten: readefaxml (ganzer Baum) und readefaxml_iter (iterparse) auf gespeicherten
+# Antworten aus bench/responses (*.xml.gz), pro Variante p50/p95 und Speicherspitze, Ausgabe verglichen mit golden/*.txt
+# (eine Abfahrt pro Zeile als repr).
+#
+#   python3 bench/dm_parsebench.py [-r RESPONSE ...] [--runs N] [--report parsebench.json] [--update-golden]
+#
+# Die Antworten sind nachgebaute VRR-Antworten (XML_DM_REQUEST), kein Mitschnitt einer bestimmten Haltestelle.
+from argparse import ArgumentParser
+from datetime import timedelta, timezone
+from glob import glob
+from gzip import open as gzopen
+from io import BytesIO
+from json import dumps
+from os import makedirs, path
+from platform import machine, python_version
+from time import perf_counter
+import sys
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+benchdir = path.dirname(path.abspath(__file__))
+repodir = path.dirname(benchdir)
+responsedir = path.join(benchdir, "responses")
+goldendir = path.join(benchdir, "golden")
+sys.path.insert(0, repodir)
+
+import dm_depdata  # noqa: E402
+
+tz = timezone(timedelta(hours=1))
+ignore = ({"stopInfo"}, {"2"})
+
+# Name: (Funktion(bytes), golden-Suffix); horizon30 muss ein Anfang der golden-Ausgabe sein
+variants = {
+    "tree": (lambda b: dm_depdata.readefaxml(ET.fromstring(b), tz), ""),
+    "iter": (lambda b: dm_depdata.readefaxml_iter(BytesIO(b), tz), ""),
+    "tree-ignore": (lambda b: dm_depdata.readefaxml(ET.fromstring(b), tz, *ignore), "-ignore"),
+    "iter-ignore": (lambda b: dm_depdata.readefaxml_iter(BytesIO(b), tz, *ignore), "-ignore"),
+    "iter-horizon30": (lambda b: dm_depdata.readefaxml_iter(BytesIO(b), tz, maxcountdown=30), None),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(p/100*(len(values)-1))))]
+
+
+def dump(result):
+    deps, messages, data = result
+    return "".join(f"{dep!r}\n" for dep in deps) + "".join(f"{msg!r}\n" for msg in messages) + (f"{data!r}\n" if data else "")
+
+
+def bench(name, data, runs, update_golden):
+    results = {}
+    for vname, (fn, suffix) in variants.items():
+        times = []
+        for _ in range(runs):
+            t = perf_counter()
+            out = fn(data)
+            times.append(perf_counter() - t)
+        tracemalloc.start()
+        fn(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        golden = path.join(goldendir, f"parse-{name}{suffix or ''}.txt")
+        text = dump(out)
+        if suffix is None:
+            with open(path.join(goldendir, f"parse-{name}.txt"), encoding="utf-8") as f:
+                ok = f.read().startswith(text)
+        elif update_golden:
+            makedirs(goldendir, exist_ok=True)
+            with open(golden, "w", encoding="utf-8") as f:
+                f.write(text)
+            ok = True
+        else:
+            with open(golden, encoding="utf-8") as f:
+                ok = f.read() == text
+        ms = [t*1000 for t in times]
+        results[vname] = {"deps": len(out[0]),
+                          "p50_ms": round(percentile(ms, 50), 3),
+                          "p95_ms": round(percentile(ms, 95), 3),
+                          "peak_kib": round(peak/1024, 1),
+                          "golden": ok}
+    return results
+
+
+def main():
+    responses = {path.basename(f)[:-len(".xml.gz")]: f for f in sorted(glob(path.join(responsedir, "*.xml.gz")))}
+    parser = ArgumentParser(description="EFA parser benchmark on stored responses")
+    parser.add_argument("-r", "--response", action="append", choices=sorted(responses), help="response(s) to parse. Default: all", default=[])
+    parser.add_argument("--runs", action="store", help="runs per variant. Default: 50", default=50, type=int)
+    parser.add_argument("--report", action="store", help="write JSON report to this file. Default: stdout only", default="", type=str)
+    parser.add_argument("--update-golden", action="store_true", help="write golden output instead of comparing")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for name in (args.response or responses):
+        with gzopen(responses[name]) as f:
+            data = f.read()
+        results[name] = r = bench(name, data, args.runs, args.update_golden)
+        for vname, v in r.items():
+            failed = failed or not v["golden"]
+            print(f"{name:10} {vname:15} {v['deps']:4} deps  p50 {v['p50_ms']:7.3f} ms  p95 {v['p95_ms']:7.3f} ms  "
+                  f"peak {v['peak_kib']:7.1f} KiB  " + ("ok" if v["golden"] else "MISMATCH"), file=sys.stderr)
+
+    report = {"python": python_version(), "machine": machine(), "runs": args.runs, "responses": results}
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(dumps(report, indent=1))
+    else:
+        print(dumps(report, indent=1))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
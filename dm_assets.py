@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Alle ppm-Bilder (./ppm/) und BDF-Schriften (./bdf/, fertig für dm_bdf) in einer Datei, die beim Start
+# per mmap eingebunden wird, statt jede Datei einzeln zu öffnen bzw. zu parsen.
+#
+#   python3 dm_assets.py [-o assets.bundle]
+#
+# Aufbau: magic b"DMAB", version (H), Python major/minor (BB), Länge des Index (I), Index (marshal), Daten.
+# Index: Pfad -> (Art, Offset, Länge, Metadaten, (st_mtime_ns, st_size) der Quelldatei).
+# Bilder liegen roh (RGB) vor und werden mit Image.frombuffer direkt aus dem mmap verwendet,
+# Schriften als marshal von (height, baseline, glyphs) für dm_bdf, dahinter die BDF-Datei selbst für rgbmatrix
+# (Metadaten: Offset und Länge davon), die dort nur aus einer Datei laden kann: fontfile() schreibt sie dafür kurz auf tmpfs.
+# Hat sich eine Quelldatei geändert (mtime/Größe), wird für diese wieder die Quelldatei gelesen.
+from argparse import ArgumentParser
+from contextlib import contextmanager
+import marshal
+from mmap import mmap, ACCESS_READ
+from os import getpid, listdir, path, replace, stat, unlink
+from struct import Struct
+import sys
+from tempfile import gettempdir
+from time import perf_counter
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+from PIL import Image
+
+import dm_bdf
+
+MAGIC = b"DMAB"
+VERSION = 2
+HEADER = Struct("<4sHBBI")
+DEFAULT_BUNDLE = "./assets.bundle"
+SOURCES = (("./ppm/", ".ppm"), ("./bdf/", ".bdf"))
+
+
+def assetkey(filename: str) -> str:
+    return path.normpath(filename)
+
+
+def sourcestamp(filename: str) -> Tuple[int, int]:
+    st = stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+
+class AssetBundle:
+    def __init__(self, filename: str):
+        with open(filename, "rb") as f:
+            self.mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+        magic, version, py_major, py_minor, indexlen = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or (py_major, py_minor) != sys.version_info[:2]:
+            self.mm.close()
+            raise ValueError(f"{filename}: incompatible asset bundle (version {VERSION}, Python {sys.version_info[0]}.{sys.version_info[1]} needed)")
+        start = HEADER.size
+        self.index = marshal.loads(self.mm[start:start+indexlen])
+        self.dataoffset = start + indexlen
+        self.view = memoryview(self.mm)
+
+    def entry(self, filename: str, kind: str):
+        # None wenn nicht enthalten oder Quelldatei inzwischen geändert
+        e = self.index.get(assetkey(filename))
+        if e is None or e[0] != kind:
+            return None
+        try:
+            if sourcestamp(filename) != e[4]:
+                return None
+        except OSError:
+            pass
+        return e
+
+    def image(self, filename: str) -> Optional[Image.Image]:
+        e = self.entry(filename, "ppm")
+        if e is None:
+            return None
+        _, offset, length, (mode, size), _ = e
+        start = self.dataoffset + offset
+        return Image.frombuffer(mode, size, self.view[start:start+length], "raw", mode, 0, 1)
+
+    def font(self, filename: str) -> Optional[dm_bdf.Font]:
+        e = self.entry(filename, "bdf")
+        if e is None:
+            return None
+        _, offset, length, _, _ = e
+        start = self.dataoffset + offset
+        font = dm_bdf.Font()
+        font.height, font.baseline, font.glyphs = marshal.loads(self.mm[start:start+length])
+        return font
+
+    def fontsource(self, filename: str) -> Optional[memoryview]:
+        # Inhalt der BDF-Datei
+        e = self.entry(filename, "bdf")
+        if e is None:
+            return None
+        rawoffset, rawlength = e[3]
+        start = self.dataoffset + rawoffset
+        return self.view[start:start+rawlength]
+
+
+class Assets:
+    # Bilder und Schriften aus dem Bundle, ersatzweise aus den einzelnen Dateien
+    def __init__(self, bundlefile: str = DEFAULT_BUNDLE):
+        self.bundle: Optional[AssetBundle] = None
+        self.frombundle = 0
+        self.fromfiles = 0
+        self.loadtime = 0.0
+        t = perf_counter()
+        if bundlefile and path.exists(bundlefile):
+            try:
+                self.bundle = AssetBundle(bundlefile)
+            except Exception as e:
+                logger.warning(f"not using asset bundle: {e}")
+        self.loadtime += perf_counter() - t
+
+    def image(self, filename: str) -> Image.Image:
+        t = perf_counter()
+        im = self.bundle.image(filename) if self.bundle else None
+        if im is not None:
+            self.frombundle += 1
+        else:
+            im = Image.open(filename)
+            self.fromfiles += 1
+        self.loadtime += perf_counter() - t
+        return im
+
+    def font(self, filename: str, parse: bool = True) -> Optional[dm_bdf.Font]:
+        # parse=False: None, wenn nicht (aktuell) im Bundle
+        t = perf_counter()
+        font = self.bundle.font(filename) if self.bundle else None
+        if font is not None:
+            self.frombundle += 1
+        elif parse:
+            font = dm_bdf.Font()
+            font.LoadFont(filename)
+            self.fromfiles += 1
+        self.loadtime += perf_counter() - t
+        return font
+
+    @contextmanager
+    def fontfile(self, filename: str) -> Iterator[str]:
+        # Dateiname für rgbmatrix graphics.Font.LoadFont: BDF aus dem Bundle als temporäre Datei auf tmpfs
+        # (nach dem Laden gleich wieder gelöscht), sonst die Quelldatei
+        t = perf_counter()
+        source = self.bundle.fontsource(filename) if self.bundle else None
+        if source is None:
+            self.fromfiles += 1
+            yield filename
+        else:
+            self.frombundle += 1
+            tmpname = path.join("/dev/shm" if path.isdir("/dev/shm") else gettempdir(), f"dm_font-{getpid()}.bdf")
+            with open(tmpname, "wb") as f:
+                f.write(source)
+            try:
+                yield tmpname
+            finally:
+                unlink(tmpname)
+        self.loadtime += perf_counter() - t
+
+    def summary(self) -> str:
+        s = f"assets: {self.frombundle} from bundle, {self.fromfiles} from files, {self.loadtime*1000:.1f} ms"
+        if self.bundle is None:
+            s += " (no asset bundle, build with dm_assets.py)"
+        elif self.fromfiles:
+            s += " (asset bundle outdated, rebuild with dm_assets.py)"
+        return s
+
+
+def build(bundlefile: str = DEFAULT_BUNDLE) -> Dict[str, int]:
+    index = {}
+    data = bytearray()
+    counts = {"ppm": 0, "bdf": 0}
+    for directory, ext in SOURCES:
+        for name in sorted(listdir(directory)):
+            if not name.endswith(ext):
+                continue
+            filename = directory + name
+            stamp = sourcestamp(filename)
+            if ext == ".ppm":
+                with Image.open(filename) as im:
+                    im.load()
+                    blob = im.tobytes()
+                    meta = (im.mode, im.size)
+                kind = "ppm"
+            else:
+                font = dm_bdf.Font()
+                font.LoadFont(filename)
+                blob = marshal.dumps((font.height, font.baseline, font.glyphs))
+                with open(filename, "rb") as f:
+                    source = f.read()
+                meta = (len(data) + len(blob), len(source))
+                kind = "bdf"
+            index[assetkey(filename)] = (kind, len(data), len(blob), meta, stamp)
+            data += blob
+            if kind == "bdf":
+                data += source
+            counts[kind] += 1
+    indexblob = marshal.dumps(index)
+    tmpname = f"{bundlefile}.{getpid()}.tmp"
+    with open(tmpname, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sys.version_info[0], sys.version_info[1], len(indexblob)))
+        f.write(indexblob)
+        f.write(data)
+    replace(tmpname, bundlefile)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="build asset bundle (ppm images and bdf fonts) for dm_tomatrixled.py")
+    parser.add_argument("-o", "--output", action="store", help=f"Bundle file name. Default: {DEFAULT_BUNDLE}", default=DEFAULT_BUNDLE, type=str)
+    args = parser.parse_args()
+    counts = build(args.output)
+    print(f"{args.output}: {counts['ppm']} images, {counts['bdf']} fonts")
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Matrix-Backend: rgbmatrix (Hardware) oder dm_softmatrix (NumPy, ohne GPIO).
+# Auswahl über die Umgebungsvariable DM_BACKEND=hw|soft,
+# ohne Angabe wird rgbmatrix genommen, falls vorhanden.
+# Geladen wird erst beim ersten Zugriff auf RGBMatrix, RGBMatrixOptions, graphics, FrameCanvas oder backend,
+# so kostet z. B. import dm_lines noch nichts (dort dann dm_backend.graphics erst beim Zeichnen verwenden).
+from os import environ
+
+from loguru import logger
+
+_names = ("RGBMatrix", "RGBMatrixOptions", "graphics", "FrameCanvas", "backend")
+
+
+def load() -> str:
+    g = globals()
+    if "backend" in g:
+        return g["backend"]
+    backend = environ.get("DM_BACKEND", "")
+
+    if backend not in {"", "hw", "soft"}:
+        raise ValueError(f"unknown DM_BACKEND {backend}")
+
+    if backend != "soft":
+        try:
+            from rgbmatrix import RGBMatrix, RGBMatrixOptions, graphics
+            from rgbmatrix.core import FrameCanvas
+            backend = "hw"
+        except ImportError:
+            if backend == "hw":
+                raise
+            logger.warning("rgbmatrix not available, using software matrix (dm_softmatrix)")
+            backend = "soft"
+
+    if backend == "soft":
+        from dm_softmatrix import RGBMatrix, RGBMatrixOptions, graphics, FrameCanvas
+
+    g.update(RGBMatrix=RGBMatrix, RGBMatrixOptions=RGBMatrixOptions, graphics=graphics, FrameCanvas=FrameCanvas, backend=backend)
+    return backend
+
+
+def __getattr__(name: str):
+    if name in _names:
+        load()
+        return globals()[name]
+    raise AttributeError(f"module {__name__} has no attribute {name}")
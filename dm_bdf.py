@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# Nachbau von Font/DrawText/DrawLine aus rgbmatrix.graphics in Python,
+# zum Zeichnen auf alles, was SetPixel kann (z. B. ImageLayer)
+from typing import Any, Dict, List, Tuple, Union
+
+type_glyph = Tuple[int, Tuple[Tuple[int, int], ...]]  # (device_width, ((dx, dy), ...))
+
+REPLACEMENT_CODEPOINT = 65533
+
+
+class Font:
+    def __init__(self):
+        self.height = 0
+        self.baseline = 0
+        self.glyphs: Dict[int, type_glyph] = {}
+
+    def LoadFont(self, path: str) -> None:
+        glyphs: Dict[int, type_glyph] = {}
+        codepoint = -1
+        dwidth = 0
+        bbx = (0, 0, 0, 0)
+        rows: List[int] = []
+        inbitmap = False
+        with open(path, encoding="latin-1") as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                key = parts[0]
+                if inbitmap:
+                    if key == "ENDCHAR":
+                        inbitmap = False
+                        glyphs[codepoint] = (dwidth, _glyphpixels(rows, bbx, dwidth))
+                    else:
+                        rows.append(int(key, 16))
+                elif key == "FONTBOUNDINGBOX":
+                    self.height = int(parts[2])
+                    self.baseline = self.height + int(parts[4])
+                elif key == "ENCODING":
+                    codepoint = int(parts[1])
+                elif key == "DWIDTH":
+                    dwidth = int(parts[1])
+                elif key == "BBX":
+                    bbx = tuple(int(_) for _ in parts[1:5])
+                elif key == "BITMAP":
+                    inbitmap = True
+                    rows = []
+        self.glyphs = glyphs
+
+    def CharacterWidth(self, cp: int) -> int:
+        g = self.glyphs.get(cp)
+        return g[0] if g is not None else -1
+
+    def glyph(self, cp: int):
+        g = self.glyphs.get(cp)
+        if g is None:
+            g = self.glyphs.get(REPLACEMENT_CODEPOINT)
+        return g
+
+
+def _glyphpixels(rows: List[int], bbx: Tuple[int, ...], dwidth: int) -> Tuple[Tuple[int, int], ...]:
+    # wie bdf-font.cc: zeilen linksbuendig, um x_offset verschoben, nur innerhalb device_width
+    # dy relativ zur baseline
+    width, height, x_offset, y_offset = bbx
+    nbits = 8 * ((width + 7) // 8)
+    pixels = []
+    for row_i, row in enumerate(rows[:height]):
+        for p in range(nbits):
+            if row & (1 << (nbits - 1 - p)):
+                x = p + x_offset
+                if 0 <= x < dwidth:
+                    pixels.append((x, row_i - height - y_offset))
+    return tuple(pixels)
+
+
+# graphics.Font -> Font, damit dieselben Fontobjekte wie fuer rgbmatrix verwendet werden koennen
+# (erst bei Bedarf geladen)
+_registered: Dict[Any, Any] = {}
+
+
+def register(font: Any, path: Union[str, Font]) -> None:
+    # path: Datei oder schon geladener Font
+    _registered[font] = path
+
+
+def registered(font: Any) -> Union[str, Font, None]:
+    return _registered.get(font)
+
+
+def fontfor(font: Any) -> Font:
+    if isinstance(font, Font):
+        return font
+    bdffont = _registered[font]
+    if not isinstance(bdffont, Font):
+        bdffont = Font()
+        bdffont.LoadFont(_registered[font])
+        _registered[font] = bdffont
+    return bdffont
+
+
+def DrawGlyph(canvas, font: Font, x: int, y: int, color, cp: int) -> int:
+    g = font.glyph(cp)
+    if g is None:
+        return 0
+    r, gr, b = color.red, color.green, color.blue
+    for dx, dy in g[1]:
+        canvas.SetPixel(x + dx, y + dy, r, gr, b)
+    return g[0]
+
+
+def DrawText(canvas, font, x: int, y: int, color, text: str) -> int:
+    font = fontfor(font)
+    start_x = x
+    for c in text:
+        x += DrawGlyph(canvas, font, x, y, color, ord(c))
+    return x - start_x
+
+
+def VerticalDrawText(canvas, font, x: int, y: int, color, text: str) -> int:
+    font = fontfor(font)
+    start_y = y
+    for c in text:
+        DrawGlyph(canvas, font, x, y, color, ord(c))
+        y += font.height
+    return y - start_y
+
+
+def DrawLine(canvas, x0: int, y0: int, x1: int, y1: int, color) -> None:
+    r, g, b = color.red, color.green, color.blue
+    dy = y1 - y0
+    dx = x1 - x0
+    shift = 0x10
+    if abs(dx) > abs(dy):
+        if x1 < x0:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+        gradient = int((dy << shift) / dx)
+        y = 0x8000 + (y0 << shift)
+        for x in range(x0, x1 + 1):
+            canvas.SetPixel(x, y >> shift, r, g, b)
+            y += gradient
+    elif dy != 0:
+        if y1 < y0:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+        gradient = int((dx << shift) / dy)
+        x = 0x8000 + (x0 << shift)
+        for y in range(y0, y1 + 1):
+            canvas.SetPixel(x >> shift, y, r, g, b)
+            x += gradient
+    else:
+        canvas.SetPixel(x0, y0, r, g, b)
@@ -1,20 +1,25 @@
 # -*- coding: utf-8 -*-
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait as futures_wait
 from csv import reader
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta, timezone
 from enum import Enum
+from hashlib import sha1
+from itertools import count
+from io import BytesIO
+from os import getpid
 from re import compile as re_compile
-from requests import get
-from requests.exceptions import RequestException
 from subprocess import call
-from time import asctime, sleep
-from typing import Set, List, Dict, Callable, Union, Optional, Any, Tuple, Iterable
+from threading import Lock
+from time import asctime, monotonic, sleep
+from typing import Set, List, Dict, Callable, Deque, Union, Optional, Any, Tuple, Iterable, BinaryIO
 import xml.etree.ElementTree as ET
 
 from loguru import logger
 
+import dm_http
+
 
 @dataclass
 class Meldung:
@@ -70,6 +75,21 @@ class Departure:
     disp_direction: Optional[str] = None
 
 
+@dataclass
+class DepsUnchanged:
+    # Rückgabe von getdeps (mit getdeps_unchanged), wenn alles bis auf die countdowns so ist wie beim letzten Mal:
+    # dann nur die neuen countdowns, in der Reihenfolge der zuletzt gelieferten Abfahrten
+    countdowns: List[Optional[int]]
+
+    def apply(self, deps: List[Departure]) -> bool:
+        changed = False
+        for dep, countdown in zip(deps, self.countdowns):
+            if dep.disp_countdown != countdown:
+                dep.disp_countdown = countdown
+                changed = True
+        return changed
+
+
 linenumpattern = re_compile('([a-zA-Z]+) *([0-9]+)')
 
 type_getpayload = Dict[str, Union[str, int, Iterable[Union[str, int]]]]
@@ -144,153 +164,279 @@ def readefaxml(root: ET.Element, tz: timezone,
     # treten (alle?) auch bei einzelnen Abfahrten auf.. erstmal keine daten hierbei
     # evtl. auslesen und schauen, was wirklich haltbezogen ist und nicht anderswo dabei ist
 
-    _itdOdv = root.find('itdDepartureMonitorRequest').find('itdOdv')
-    _itdOdvPlace = _itdOdv.find('itdOdvPlace')
-    if _itdOdvPlace.get('state') != "identified":
+    _odv = _readefaodv(root.find('itdDepartureMonitorRequest').find('itdOdv'))
+    if _odv is None:
         return deps, stop_messages, {}
+    place, stopname = _odv
+
+    for dep in root.iter('itdDeparture'):
+        deps.append(_readefadep(dep, tz, place, stopname, ignore_infoTypes, ignore_infoIDs, content_for_short_titles))
+    return deps, stop_messages, {}
+
+
+def readefaxml_iter(source: Union[str, BinaryIO], tz: timezone,
+                    ignore_infoTypes: Optional[Set] = None, ignore_infoIDs: Optional[Set] = None,
+                    content_for_short_titles: bool = True, maxcountdown: Optional[int] = None) -> type_depmsgdata:
+    # wie readefaxml, aber direkt beim Parsen (iterparse): jede itdDeparture wird verarbeitet, sobald sie vollständig ist,
+    # und danach geleert, der ganze Baum wird nie aufgebaut (ebenso itdServingLines).
+    # maxcountdown: nach 3 Abfahrten in Folge mit größerem countdown aufhören (EFA liefert zeitlich sortiert)
+    deps: List[Departure] = []
+    stop_messages: List[Meldung] = []
+    place: Optional[str] = None
+    stopname: Optional[str] = None
+    odvseen = False
+    beyond = 0
+    # nur end-Events, jedes geht einmal durch Python
+    for _, elem in ET.iterparse(source):
+        tag = elem.tag
+        if tag == 'itdDeparture':
+            if not odvseen:
+                raise ValueError("itdDeparture before itdOdv")
+            dep = _readefadep(elem, tz, place, stopname, ignore_infoTypes, ignore_infoIDs, content_for_short_titles)
+            deps.append(dep)
+            elem.clear()
+            if maxcountdown is not None:
+                beyond = beyond + 1 if dep.disp_countdown > maxcountdown else 0
+                if beyond >= 3:
+                    break
+        elif tag == 'itdOdv' and not odvseen:
+            odvseen = True
+            _odv = _readefaodv(elem)
+            if _odv is None:
+                return deps, stop_messages, {}
+            place, stopname = _odv
+        elif tag == 'itdServingLines':
+            elem.clear()
+    if not odvseen:
+        raise ValueError("no itdOdv in itdDepartureMonitorRequest")
+    return deps, stop_messages, {}
+
+
+def _readefaodv(itdOdv: ET.Element) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    # (place, stopname) oder None, wenn die Haltestelle nicht eindeutig ist
+    _itdOdvPlace = itdOdv.find('itdOdvPlace')
+    if _itdOdvPlace.get('state') != "identified":
+        return None
     place = _itdOdvPlace.findtext('odvPlaceElem')
 
-    _itdOdvName = _itdOdv.find('itdOdvName')
+    _itdOdvName = itdOdv.find('itdOdvName')
     if _itdOdvName.get('state') != "identified":
-        return deps, stop_messages, {}
+        return None
     _itdOdvNameElem = _itdOdvName.find('odvNameElem')
     stopname = _itdOdvNameElem.text or _itdOdvNameElem[0].tail or next((t.tail for t in _itdOdvNameElem if t is not None), None)
+    return place, stopname
 
-    for dep in root.iter('itdDeparture'):
-        servingline = dep.find('itdServingLine')
-        _itdNoTrain = servingline.find('itdNoTrain')
-        _itdNoTrainName = _itdNoTrain.get('name', '')
-        linenum = servingline.attrib['number']
-        if linenum.endswith(" "+_itdNoTrainName):
-            linenum = linenum.replace(" "+_itdNoTrainName, "")
-        countdown = int(dep.attrib['countdown'])
-
-        isrealtime = bool(int(servingline.attrib['realtime']))
-        if isrealtime:
-            delay = int(_itdNoTrain.attrib['delay'])
-        else:
-            delay = 0
-        cancelled = delay == -9999
-
-        messages: List[str] = []
-        genAttrList = dep.find('genAttrList')
-
-        direction_planned = servingline.get('direction')
-        direction_actual = direction_planned
-        earlytermination = False
-        _earlytermv = genAttrList.findtext("./genAttrElem[name='EarlyTermination']/value") if genAttrList else None
-        if (not cancelled) and _earlytermv:
-            direction_actual = _earlytermv
-            earlytermination = True
-        # Beobachtungen bzgl. Steigänderung:
-        # genAttrElem mit name platformChange und value changed
-        # platform bei itdDeparture entspricht originaler, platformName der neuen..
-        # haben aber eigentlich unterschiedliche Bedeutungen
-        # (bei Bussen steht dann da z. B. "Bstg. 1" in platformName
-        # Auseinanderhalten eigentlich sinnvoll, bei platformChange muss aber wohl ne Ausnahme gemacht werden
-        # weiter beobachten, wie sowas in weiteren Fällen aussieht..
-
-        # Sowas wie "Aachen, Hbf,Aachen" verbessern
-        _ds = direction_actual.split(",")
-        if len(_ds) > 1 and direction_actual.startswith(_ds[-1].strip()):
-            disp_direction = ",".join(_ds[:-1])
-        else:
-            disp_direction = direction_actual
-
-        itddatetime = dep.find('itdDateTime')
-        itddatea = itddatetime.find('itdDate').attrib
-        itdtimea = itddatetime.find('itdTime').attrib
-        deptime_planned = datetime(int(itddatea['year']), int(itddatea['month']), int(itddatea['day']), int(itdtimea['hour']), int(itdtimea['minute']), tzinfo=tz)
-        deptime = deptime_planned
-        if isrealtime and not cancelled:
-            itdrtdatetime = dep.find('itdRTDateTime')
-            itdrtdatea = itdrtdatetime.find('itdDate').attrib
-            itdrttimea = itdrtdatetime.find('itdTime').attrib
-            deptime = datetime(int(itdrtdatea['year']), int(itdrtdatea['month']), int(itdrtdatea['day']), int(itdrttimea['hour']), int(itdrttimea['minute']), tzinfo=tz)
-
-        for _infoLink in dep.iter('infoLink'):
-            if ((ignore_infoTypes and _infoLink.findtext("./paramList/param[name='infoType']/value") in ignore_infoTypes)
-                    or (ignore_infoIDs and _infoLink.findtext("./paramList/param[name='infoID']/value") in ignore_infoIDs)):
+
+def _readefadep(dep: ET.Element, tz: timezone, place: Optional[str], stopname: Optional[str],
+               ignore_infoTypes: Optional[Set], ignore_infoIDs: Optional[Set], content_for_short_titles: bool) -> Departure:
+    # eine itdDeparture (für readefaxml und readefaxml_iter)
+    # find/findtext nur mit einfachen Tags (schneller Weg in C), statt Pfaden mit Prädikaten
+    # werden genAttrElem und infoLink-Parameter einmal durchgegangen (dict name -> value)
+    servingline = dep.find('itdServingLine')
+    _itdNoTrain = servingline.find('itdNoTrain')
+    _itdNoTrainName = _itdNoTrain.get('name', '')
+    linenum = servingline.attrib['number']
+    if linenum.endswith(" "+_itdNoTrainName):
+        linenum = linenum.replace(" "+_itdNoTrainName, "")
+    countdown = int(dep.attrib['countdown'])
+
+    isrealtime = bool(int(servingline.attrib['realtime']))
+    if isrealtime:
+        delay = int(_itdNoTrain.attrib['delay'])
+    else:
+        delay = 0
+    cancelled = delay == -9999
+
+    messages: List[str] = []
+    genAttrList = dep.find('genAttrList')
+    genAttrValues: Set[Optional[str]] = set()
+    genAttrs = _namedvalues(genAttrList.findall('genAttrElem'), genAttrValues) if genAttrList else {}
+
+    direction_planned = servingline.get('direction')
+    direction_actual = direction_planned
+    earlytermination = False
+    _earlytermv = genAttrs.get('EarlyTermination')
+    if (not cancelled) and _earlytermv:
+        direction_actual = _earlytermv
+        earlytermination = True
+    # Beobachtungen bzgl. Steigänderung:
+    # genAttrElem mit name platformChange und value changed
+    # platform bei itdDeparture entspricht originaler, platformName der neuen..
+    # haben aber eigentlich unterschiedliche Bedeutungen
+    # (bei Bussen steht dann da z. B. "Bstg. 1" in platformName
+    # Auseinanderhalten eigentlich sinnvoll, bei platformChange muss aber wohl ne Ausnahme gemacht werden
+    # weiter beobachten, wie sowas in weiteren Fällen aussieht..
+
+    # Sowas wie "Aachen, Hbf,Aachen" verbessern
+    _ds = direction_actual.split(",")
+    if len(_ds) > 1 and direction_actual.startswith(_ds[-1].strip()):
+        disp_direction = ",".join(_ds[:-1])
+    else:
+        disp_direction = direction_actual
+
+    itddatetime = dep.find('itdDateTime')
+    itddatea = itddatetime.find('itdDate').attrib
+    itdtimea = itddatetime.find('itdTime').attrib
+    deptime_planned = datetime(int(itddatea['year']), int(itddatea['month']), int(itddatea['day']), int(itdtimea['hour']), int(itdtimea['minute']), tzinfo=tz)
+    deptime = deptime_planned
+    if isrealtime and not cancelled:
+        itdrtdatetime = dep.find('itdRTDateTime')
+        itdrtdatea = itdrtdatetime.find('itdDate').attrib
+        itdrttimea = itdrtdatetime.find('itdTime').attrib
+        deptime = datetime(int(itdrtdatea['year']), int(itdrtdatea['month']), int(itdrtdatea['day']), int(itdrttimea['hour']), int(itdrttimea['minute']), tzinfo=tz)
+
+    for _infoLink in dep.iter('infoLink'):
+        if ignore_infoTypes or ignore_infoIDs:
+            _iLparams = _namedvalues(p for pl in _infoLink.findall('paramList') for p in pl.findall('param'))
+            if ((ignore_infoTypes and _iLparams.get('infoType') in ignore_infoTypes)
+                    or (ignore_infoIDs and _iLparams.get('infoID') in ignore_infoIDs)):
                 continue
-            _iLTtext = _infoLink.findtext('infoLinkText')
-            if _iLTtext:
-                # kurze, inhaltslose (DB-)Meldungstitel
-                if content_for_short_titles and _iLTtext in {"Störung.", "Bauarbeiten.", "Information."}:
-                    _infoLink_infoText = _infoLink.find('infoText')
-                    if _infoLink_infoText is None: continue
-                    _iLiTcontent = _infoLink_infoText.findtext('content')
-                    if _iLiTcontent:
-                        messages.append(f"{_iLTtext[:-1]}: {_iLiTcontent}")
-                        continue
-                    # else: weiter, nächste Zeile
-                messages.append(_iLTtext)
-            else:
+        _iLTtext = _infoLink.findtext('infoLinkText')
+        if _iLTtext:
+            # kurze, inhaltslose (DB-)Meldungstitel
+            if content_for_short_titles and _iLTtext in {"Störung.", "Bauarbeiten.", "Information."}:
                 _infoLink_infoText = _infoLink.find('infoText')
                 if _infoLink_infoText is None: continue
-                _iLiTsubject = _infoLink_infoText.findtext('subject')
-                _iLiTsubtitle = _infoLink_infoText.findtext('subtitle')
-                _msg = ""
-                if _iLiTsubject: _msg += (_iLiTsubject + (" " if _iLiTsubject.endswith(":") else ": "))
-                if _iLiTsubtitle: _msg += _iLiTsubtitle
-                if _msg: messages.append(_msg)
-
-        itdNoTrainText = servingline.findtext('itdNoTrain')
-        if itdNoTrainText:
-            messages.append(f"{linenum}: {itdNoTrainText}")
-
-        mot = None
-        motType = int(servingline.get('motType'))
-        if motType in {5, 6, 7, 10, 17, 19}:
-            mot = MOT.BUS
-        elif motType in {0, 1, 13, 14, 15, 16, 18}:
-            if motType in {15, 16} or (genAttrList and any(s in {"HIGHSPEEDTRAIN", "LONG_DISTANCE_TRAINS"} for s in (x.findtext('value') for x in genAttrList.findall('genAttrElem')))):
-                mot = MOT.HISPEED
-            else:
-                mot = MOT.TRAIN
-        elif motType in {2, 3, 4, 8}:
-            mot = MOT.TRAM
-        elif motType == 11:
-            mot = MOT.HANGING
+                _iLiTcontent = _infoLink_infoText.findtext('content')
+                if _iLiTcontent:
+                    messages.append(f"{_iLTtext[:-1]}: {_iLiTcontent}")
+                    continue
+                # else: weiter, nächste Zeile
+            messages.append(_iLTtext)
+        else:
+            _infoLink_infoText = _infoLink.find('infoText')
+            if _infoLink_infoText is None: continue
+            _iLiTsubject = _infoLink_infoText.findtext('subject')
+            _iLiTsubtitle = _infoLink_infoText.findtext('subtitle')
+            _msg = ""
+            if _iLiTsubject: _msg += (_iLiTsubject + (" " if _iLiTsubject.endswith(":") else ": "))
+            if _iLiTsubtitle: _msg += _iLiTsubtitle
+            if _msg: messages.append(_msg)
+
+    itdNoTrainText = servingline.findtext('itdNoTrain')
+    if itdNoTrainText:
+        messages.append(f"{linenum}: {itdNoTrainText}")
+
+    mot = None
+    motType = int(servingline.get('motType'))
+    if motType in {5, 6, 7, 10, 17, 19}:
+        mot = MOT.BUS
+    elif motType in {0, 1, 13, 14, 15, 16, 18}:
+        if motType in {15, 16} or (genAttrList and not genAttrValues.isdisjoint({"HIGHSPEEDTRAIN", "LONG_DISTANCE_TRAINS"})):
+            mot = MOT.HISPEED
+        else:
+            mot = MOT.TRAIN
+    elif motType in {2, 3, 4, 8}:
+        mot = MOT.TRAM
+    elif motType == 11:
+        mot = MOT.HANGING
+
+    return Departure(linenum=linenum,
+                     direction=direction_actual,
+                     direction_planned=direction_planned,
+                     deptime=deptime,
+                     deptime_planned=deptime_planned,
+                     realtime=isrealtime,
+                     delay=delay,
+                     messages=messages,
+                     coursesummary=servingline.findtext('itdRouteDescText'),
+                     mot=mot,
+                     platformno=dep.get('platform'),
+                     platformtype=dep.get('pointType', ""),
+                     stopname=(dep.get('nameWO') or stopname),
+                     stopid=dep.get('gid'),
+                     place=place,
+                     cancelled=cancelled,
+                     earlytermination=earlytermination,
+                     disp_countdown=countdown,
+                     disp_direction=disp_direction)
 
-        deps.append(Departure(linenum=linenum,
-                              direction=direction_actual,
-                              direction_planned=direction_planned,
-                              deptime=deptime,
-                              deptime_planned=deptime_planned,
-                              realtime=isrealtime,
-                              delay=delay,
-                              messages=messages,
-                              coursesummary=servingline.findtext('itdRouteDescText'),
-                              mot=mot,
-                              platformno=dep.get('platform'),
-                              platformtype=dep.get('pointType', ""),
-                              stopname=(dep.get('nameWO') or stopname),
-                              stopid=dep.get('gid'),
-                              place=place,
-                              cancelled=cancelled,
-                              earlytermination=earlytermination,
-                              disp_countdown=countdown,
-                              disp_direction=disp_direction))
-    return deps, stop_messages, {}
+
+def _namedvalues(elems: Iterable[ET.Element], allvalues: Optional[Set[Optional[str]]] = None) -> Dict[str, str]:
+    # name -> value wie findtext("./...[name='<name>']/value") für alle Namen auf einmal,
+    # allvalues bekommt dazu findtext('value') jedes Elements
+    values: Dict[str, str] = {}
+    for elem in elems:
+        value = elem.findtext('value')
+        if allvalues is not None:
+            allvalues.add(value)
+        name = elem.find('name')
+        if name is not None and value is not None:
+            values.setdefault("".join(name.itertext()), value)
+    return values
+
+
+@dataclass
+class _Response:
+    validators: Dict[str, str]
+    fingerprint: bytes
+    minute: datetime  # Abrufzeit (volle Minute), auf die sich die countdowns beziehen
+    result: type_depmsgdata
+
+
+# letzte ausgewertete Antwort je Anfrage (bleibt im Abrufprozess erhalten)
+_responses: Dict[Tuple[str, str, str], _Response] = {}
+_efacountdown = re_compile(rb' countdown="-?[0-9]+"')
+
+
+def _efafingerprint(content: bytes) -> bytes:
+    # ohne countdowns und ohne alles vor itdDepartureList (Anfragezeit, Session, ...), das ändert sich jede Minute
+    start = content.find(b"<itdDepartureList")
+    return sha1(_efacountdown.sub(b"", content[start:] if start != -1 else content)).digest()
+
+
+def _fingerprint(content: bytes) -> bytes:
+    return sha1(content).digest()
+
+
+def _copyresult(result: type_depmsgdata, minutes: int = 0) -> type_depmsgdata:
+    # getdeps verändert die Abfahrten, deswegen immer Kopien herausgeben, countdowns ggf. um minutes verschoben
+    deps, messages, data = result
+    return ([replace(dep, messages=list(dep.messages),
+                     disp_countdown=(dep.disp_countdown - minutes if dep.disp_countdown is not None else None)) for dep in deps],
+            list(messages), dict(data))
+
+
+def _fetchparsed(url: str, timeout: Union[int, float], params: type_getpayload,
+                 read: Callable[[Any], type_depmsgdata], options: Any = None,
+                 fingerprint: Callable[[bytes], bytes] = _fingerprint) -> type_depmsgdata:
+    # Anfrage (bedingt, falls der Server ETag/Last-Modified liefert) und Auswertung mit read(response).
+    # Bei 304 oder gleichem Fingerabdruck wird das letzte Ergebnis übernommen statt neu geparst,
+    # die countdowns um die seitdem vergangenen Minuten verschoben.
+    key = (url, repr(sorted(params.items())), repr(options))
+    cached = _responses.get(key)
+    r = dm_http.get(url, timeout=timeout, params=params, headers=cached.validators if cached is not None else None)
+    minute = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    if cached is not None and r.status_code == 304:
+        logger.trace(f"{url} not modified, reusing data")
+        return _copyresult(cached.result, int((minute - cached.minute).total_seconds() // 60))
+    r.raise_for_status()
+    fp = fingerprint(r.content)
+    if cached is not None and fp == cached.fingerprint:
+        logger.trace(f"{url} unchanged, reusing data")
+        cached.validators = dm_http.validators(r)
+        return _copyresult(cached.result, int((minute - cached.minute).total_seconds() // 60))
+    try:
+        result = read(r)
+    except Exception:
+        logger.debug(f"request data:\n{r.content}")
+        raise
+    _responses[key] = _Response(dm_http.validators(r), fp, minute, _copyresult(result))
+    return result
 
 
 def getefadeps(serverurl: str, timeout: Union[int, float], ifopt: str, limit: int, tz: timezone,
         userealtime: bool = True, exclMOT: Optional[Set[int]] = None, inclMOT: Optional[Set[int]] = None,
-        ignore_infoTypes: Optional[Set] = None, ignore_infoIDs: Optional[Set] = None, content_for_short_titles: bool = True) -> type_depmsgdata:
+        ignore_infoTypes: Optional[Set] = None, ignore_infoIDs: Optional[Set] = None, content_for_short_titles: bool = True,
+        maxcountdown: Optional[int] = None) -> type_depmsgdata:
     payload: type_getpayload = {'name_dm': ifopt, 'type_dm': 'any', 'mode': 'direct', 'useRealtime': int(userealtime), 'limit': str(limit)}
     if inclMOT:
         payload['includedMeans'] = inclMOT
     elif exclMOT:
         payload['excludedMeans'] = exclMOT
-    r = get(serverurl, timeout=timeout, params=payload)
-    r.raise_for_status()
-    try:
-        root = ET.fromstring(r.content)
-        result = readefaxml(root, tz, ignore_infoTypes, ignore_infoIDs, content_for_short_titles)
-    except Exception:
-        logger.debug(f"request data:\n{r.content}")
-        raise
-    return result
+    return _fetchparsed(serverurl, timeout, payload,
+                        lambda r: readefaxml_iter(BytesIO(r.content), tz, ignore_infoTypes, ignore_infoIDs, content_for_short_titles, maxcountdown),
+                        (tz, ignore_infoTypes, ignore_infoIDs, content_for_short_titles, maxcountdown), _efafingerprint)
 
 
 # basiert hauptsächlich auf db-rest. code insgesamt noch kaum getestet
@@ -382,21 +528,14 @@ def getdbrestdeps(serverurl: str, timeout: Union[int, float], ibnr: str, limit:
         inclMOT: Optional[Set[MOT]] = None, exclMOT: Optional[Set[MOT]] = None,
         duration: int = 120, language: str = "de") -> type_depmsgdata:
     payload: type_getpayload = {'language': language, 'duration': duration}
-    r = get(f"{serverurl}/stations/{ibnr}/departures", timeout=timeout, params=payload)
-    r.raise_for_status()
-    try:
-        requestdata = r.json()
-        result = readfptfjson(requestdata, limit, inclMOT, exclMOT)
-    except Exception:
-        logger.debug(f"request data:\n{r.content}")
-        raise
-    return result
+    return _fetchparsed(f"{serverurl}/stations/{ibnr}/departures", timeout, payload,
+                        lambda r: readfptfjson(r.json(), limit, inclMOT, exclMOT), (limit, inclMOT, exclMOT))
 
 
 def getd3d9msgdata(serverurl: str, dfi_id: str, timeout: Union[int, float]) -> type_depmsgdata:
     messages: List[Meldung] = []
     data: type_data = {}
-    r = get(f"{serverurl}/{dfi_id}", timeout=timeout)
+    r = dm_http.get(f"{serverurl}/{dfi_id}", timeout=timeout)
     if r.status_code == 404:
         logger.warning(f"ignoring 404 for {serverurl}/{dfi_id}, returning nothing")
     else:
@@ -457,32 +596,251 @@ def getd3d9msgdata(serverurl: str, dfi_id: str, timeout: Union[int, float]) -> t
     return [], messages, data
 
 
+class ServerStats:
+    # rollierende Latenz (erfolgreiche Abrufe) und Fehlerquote je Server,
+    # bleibt im Abrufprozess über alle getdeps-Aufrufe bestehen
+    def __init__(self, window: int = 50):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool) -> None:
+        if ok:
+            self.latencies.append(latency)
+        self.outcomes.append(ok)
+
+    def percentile(self, p: float, minsamples: int = 5) -> Optional[float]:
+        if len(self.latencies) < minsamples:
+            return None
+        _sorted = sorted(self.latencies)
+        return _sorted[min(len(_sorted) - 1, int(p * len(_sorted)))]
+
+    def score(self) -> float:
+        # kleiner ist besser: mittlere Latenz, mit Fehlerquote aufgeschlagen
+        errorrate = self.outcomes.count(False) / len(self.outcomes)
+        median = self.percentile(0.5, 1) or 0.0
+        return median * (1 + 4 * errorrate)
+
+
+breaker_maxcooldown = 900.0
+
+
+class CircuitBreaker:
+    # je Server: nach maxfailures fehlgeschlagenen getdeps-Aufrufen in Folge offen, der Server wird dann übersprungen
+    # (innerhalb eines Aufrufs zählen Wiederholungen nicht extra, cycle = laufende Nummer des Aufrufs).
+    # Nach der Wartezeit wird mit einer einzelnen Anfrage geprüft (half-open), bei Erfolg wieder geschlossen,
+    # sonst wieder offen mit doppelter Wartezeit (höchstens breaker_maxcooldown)
+    def __init__(self, name: str, maxfailures: int = 3, basecooldown: float = 60.0):
+        self.name = name
+        self.maxfailures = maxfailures
+        self.basecooldown = basecooldown
+        self.state = "closed"
+        self.failures = 0
+        self.failedcycle: Optional[int] = None
+        self.cooldown = 0.0
+        self.openuntil = 0.0
+        self.probing = False
+        self.lock = Lock()
+
+    def allow(self, force: bool = False) -> bool:
+        # force: trotzdem durchlassen (wenn alle Server offen sind), ändert den Zustand nicht;
+        # Erfolg schließt, Fehler verlängern die Wartezeit nicht
+        with self.lock:
+            if self.state == "closed" or force:
+                return True
+            if self.state == "open":
+                if monotonic() < self.openuntil:
+                    return False
+                self._set("half-open")
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok: bool, cycle: int) -> None:
+        with self.lock:
+            if ok:
+                self.probing = False
+                self.failures = 0
+                self.failedcycle = None
+                self.cooldown = 0.0
+                if self.state != "closed":
+                    self._set("closed")
+            else:
+                if cycle != self.failedcycle:
+                    self.failures += 1
+                    self.failedcycle = cycle
+                if self.state == "half-open" and self.probing or (self.state == "closed" and self.failures >= self.maxfailures):
+                    self.probing = False
+                    self.cooldown = min(breaker_maxcooldown, self.cooldown * 2 if self.cooldown else self.basecooldown)
+                    self.openuntil = monotonic() + self.cooldown
+                    self._set("open")
+
+    def _set(self, state: str) -> None:
+        _msg = f"circuit breaker {self.name}: {self.state} -> {state}"
+        if state == "open":
+            logger.warning(f"{_msg} for {self.cooldown:.0f}s after {self.failures} failures")
+        else:
+            logger.info(_msg)
+        self.state = state
+
+
+_serverstats: Dict[str, ServerStats] = defaultdict(ServerStats)
+_breakers: Dict[str, CircuitBreaker] = {}
+_cycles = count(1)
+_attemptpool: Optional[ThreadPoolExecutor] = None
+_attemptpoolpid = 0
+_attemptpoollock = Lock()
+
+
+def _serverkey(kwa: Dict[str, Any]) -> str:
+    return str(kwa.get('serverurl'))
+
+
+def _breaker(kwa: Dict[str, Any], maxfailures: int, cooldown: float) -> CircuitBreaker:
+    key = _serverkey(kwa)
+    b = _breakers.get(key)
+    if b is None:
+        b = _breakers.setdefault(key, CircuitBreaker(key, maxfailures, cooldown))
+    return b
+
+
+def _attempts() -> ThreadPoolExecutor:
+    # Threads für die einzelnen Versuche (auch die, die nach einem Hedge im Hintergrund weiterlaufen),
+    # erst beim ersten Abruf und je Prozess eigene (nach fork hätte der Pool keine Threads mehr)
+    global _attemptpool, _attemptpoolpid
+    if _attemptpool is None or _attemptpoolpid != getpid():
+        with _attemptpoollock:
+            if _attemptpool is None or _attemptpoolpid != getpid():
+                _attemptpool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="getdeps-attempt")
+                _attemptpoolpid = getpid()
+    return _attemptpool
+
+
+def _rankservers(depf_kwarg_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # zuletzt erfolgreiche Server nach score, dann unbekannte, dann zuletzt fehlgeschlagene (jeweils sonst in Konfigurationsreihenfolge)
+    def key(ikwa):
+        i, kwa = ikwa
+        st = _serverstats.get(_serverkey(kwa))
+        if st is None or not st.outcomes:
+            return (1, 0.0, i)
+        return (0 if st.outcomes[-1] else 2, st.score(), i)
+    return [kwa for i, kwa in sorted(enumerate(depf_kwarg_list), key=key)]
+
+
+def _attempt(depf: Callable[..., type_depmsgdata], kwa: Dict[str, Any], breaker: CircuitBreaker, cycle: int) -> type_depmsgdata:
+    st = _serverstats[_serverkey(kwa)]
+    t = monotonic()
+    try:
+        result = depf(**kwa)
+    except BaseException:
+        st.record(monotonic() - t, False)
+        breaker.record(False, cycle)
+        raise
+    st.record(monotonic() - t, result is not None)
+    breaker.record(result is not None, cycle)
+    return result
+
+
 def _getdeps_depf_list(depf_list: type_depfnlist,
-        path_name: str, max_retries: int, sleep_on_retry_factor: float) -> Optional[type_depmsgdata]:
+        path_name: str, max_retries: int, sleep_on_retry_factor: float,
+        hedge_percentile: Optional[float] = 0.9,
+        breaker_failures: int = 3, breaker_cooldown: float = 60.0, cycle: int = 0) -> Optional[type_depmsgdata]:
+    # je depf: Server nach bisheriger Latenz/Fehlern sortiert, nach einem Fehler gleich der nächste,
+    # danach die Wiederholungen (mit Pause). Braucht ein Server länger als hedge_percentile seiner bisherigen Antwortzeiten
+    # (ohne genug Messwerte: ein Drittel des Timeouts), wird der nächste parallel gefragt, das erste gültige Ergebnis zählt.
+    # Server mit offenem CircuitBreaker werden übersprungen, sind alle offen, wird der beste trotzdem einmal gefragt.
     for depf, depf_kwarg_list in depf_list:
-        _result = None
-        for kwa in depf_kwarg_list:
-            retryc = 0
-            while retryc <= max_retries:
-                if retryc and sleep_on_retry_factor:
-                    sleep(retryc * sleep_on_retry_factor)
-                try:
-                    _result = depf(**kwa)
-                    break  # while
-                except Exception as e:
-                    if isinstance(e, RequestException):
-                        logger.warning(f"'{path_name}'{depf}{kwa} retry{retryc}\n{e.__class__.__name__}, {e}")
-                    else:
-                        logger.exception(f"'{path_name}'{depf}{kwa} retry{retryc}")
-                    retryc += 1
-            if _result is not None:
-                break  # wir wollen aus der depf loop damit komplett raus, deswegen erstmal break und dann danach nochmal check
-            else:
-                logger.warning(f"'{path_name}'{depf}{kwa} failed {max_retries+1} times, continuing with next if exists")
+        attempts = [(kwa, retryc) for retryc in range(max_retries + 1) for kwa in _rankservers(depf_kwarg_list)]
+        breakers = {_serverkey(kwa): _breaker(kwa, breaker_failures, breaker_cooldown) for kwa in depf_kwarg_list}
+        _result = _hedged(depf, attempts, path_name, sleep_on_retry_factor, hedge_percentile, breakers, cycle)
         if _result is not None:
             return _result
         else:
-            logger.warning(f"'{path_name}'{depf} failed all kwargs, continuing with next if exists")
+            logger.warning(f"'{path_name}'{depf} failed all kwargs ({max_retries+1} times each), continuing with next if exists")
+    return None
+
+
+def _hedged(depf: Callable[..., type_depmsgdata], attempts: List[Tuple[Dict[str, Any], int]],
+        path_name: str, sleep_on_retry_factor: float, hedge_percentile: Optional[float],
+        breakers: Dict[str, CircuitBreaker], cycle: int) -> Optional[type_depmsgdata]:
+    pending: Dict[Future, Tuple[Dict[str, Any], int, float]] = {}
+    # übersprungene Versuche (offener CircuitBreaker), der erste davon ist der bestbewertete Server
+    skipped: List[Tuple[Dict[str, Any], int]] = []
+    started = False
+    # Server -> Zeitpunkt des letzten Fehlers, für die Pause vor Wiederholungen, die als Hedge starten
+    failedat: Dict[str, float] = {}
+
+    def candidate() -> Optional[int]:
+        # nächster Versuch an einen Server, bei dem gerade keine Anfrage läuft (nie zweimal parallel an denselben)
+        busy = {_serverkey(kwa) for kwa, _, _ in pending.values()}
+        for k, (kwa, _) in enumerate(attempts):
+            if _serverkey(kwa) not in busy:
+                return k
+        return None
+
+    def start(retrysleep: bool = False) -> bool:
+        # nächster Versuch, dessen Server gerade gefragt werden darf
+        nonlocal started
+        while True:
+            k = candidate()
+            if k is None:
+                if started or not skipped:
+                    return False
+                # alle Server offen: den besten trotzdem einmal fragen
+                kwa, retryc = skipped[0]
+                logger.warning(f"'{path_name}'{depf} all servers skipped, circuit open, probing {_serverkey(kwa)} anyway")
+                breaker = breakers[_serverkey(kwa)]
+                breaker.allow(force=True)
+            else:
+                kwa, retryc = attempts.pop(k)
+                breaker = breakers[_serverkey(kwa)]
+                if not breaker.allow():
+                    logger.debug(f"'{path_name}'{depf} skipping {_serverkey(kwa)}, circuit open")
+                    skipped.append((kwa, retryc))
+                    continue
+                if retrysleep and retryc and sleep_on_retry_factor:
+                    sleep(retryc * sleep_on_retry_factor)
+            pending[_attempts().submit(_attempt, depf, kwa, breaker, cycle)] = (kwa, retryc, monotonic())
+            started = True
+            return True
+
+    start()
+    while pending:
+        timeout = None
+        hedge = candidate() if hedge_percentile and len(pending) == 1 else None
+        if hedge is not None:
+            (kwa, retryc, started), = pending.values()
+            hedge_after = _serverstats[_serverkey(kwa)].percentile(hedge_percentile)
+            if hedge_after is None:
+                hedge_after = kwa.get('timeout', 30) / 3
+            hedge_at = started + hedge_after
+            h_kwa, h_retryc = attempts[hedge]
+            if h_retryc and _serverkey(h_kwa) in failedat:
+                # Wiederholung: nicht früher als mit der üblichen Pause
+                hedge_at = max(hedge_at, failedat[_serverkey(h_kwa)] + h_retryc * sleep_on_retry_factor)
+            timeout = max(0.0, hedge_at - monotonic())
+        done, _ = futures_wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            if start():
+                logger.info(f"'{path_name}'{depf} {_serverkey(kwa)} slower than {hedge_after:.1f}s, also asking {_serverkey(list(pending.values())[-1][0])}")
+            continue
+        for f in done:
+            kwa, retryc, _ = pending.pop(f)
+            try:
+                _result = f.result()
+            except Exception as e:
+                from requests.exceptions import RequestException
+                if isinstance(e, RequestException):
+                    logger.warning(f"'{path_name}'{depf}{kwa} retry{retryc}\n{e.__class__.__name__}, {e}")
+                else:
+                    logger.exception(f"'{path_name}'{depf}{kwa} retry{retryc}")
+            else:
+                if _result is not None:
+                    # noch laufende Anfragen laufen im Hintergrund zu Ende (zählen noch für die Statistik)
+                    return _result
+            failedat[_serverkey(kwa)] = monotonic()
+        if not pending:
+            start(retrysleep=True)
     return None
 
 
@@ -494,20 +852,34 @@ def getdeps(
         getdeps_mincountdown: int = -9,
         getdeps_max_retries: int = 2,
         getdeps_sleep_on_retry_factor: float = 0.5,
+        getdeps_hedge_percentile: Optional[float] = 0.9,
+        getdeps_breaker_failures: int = 3,
+        getdeps_breaker_cooldown: float = 60.0,
         extramsg_messageexists: Optional[bool] = None,
         delaymsg_enable: bool = True,
         delaymsg_mindelay: int = 1,
         etermmsg_enable: bool = True,
         etermmsg_only_visible: bool = True,
         nodepmsg_enable: bool = True,
-        nortmsg_limit: Optional[int] = 20
-        ) -> type_depmsgdata:
+        nortmsg_limit: Optional[int] = 20,
+        http_options: Optional[Dict[str, Any]] = None,
+        getdeps_unchanged: bool = False
+        ) -> Union[type_depmsgdata, DepsUnchanged]:
+    # getdeps_unchanged: DepsUnchanged statt allem zurückgeben, wenn sich nur die countdowns geändert haben
+    global _lastreturned
+    last, _lastreturned = _lastreturned, None
     deps: List[Departure] = []
     messages: List[Meldung] = []
     data: type_data = {}
     nowtime = datetime.now(getdeps_timezone)
+    # Sessions (dm_http) bleiben im Abrufprozess bestehen
+    if http_options:
+        dm_http.configure(**http_options)
+    dm_http.stats.reset()
+    cycle = next(_cycles)
     with ThreadPoolExecutor() as tpe:
-        fs = {tpe.submit(_getdeps_depf_list, depf_list, path_name, getdeps_max_retries, getdeps_sleep_on_retry_factor): (path_name, end_all_on_fail)
+        fs = {tpe.submit(_getdeps_depf_list, depf_list, path_name, getdeps_max_retries, getdeps_sleep_on_retry_factor, getdeps_hedge_percentile,
+                         getdeps_breaker_failures, getdeps_breaker_cooldown, cycle): (path_name, end_all_on_fail)
               for ((path_name, end_all_on_fail), depf_list) in depfunctions.items()}
         for f in as_completed(fs):
             _result = f.result()
@@ -530,12 +902,13 @@ def getdeps(
                 #     logger.success(f"{_k}:\t{_v}")
                 logger.trace(f"'{path_name}' returned {len(_result_deps)} deps ({sum(dep.realtime for dep in _result_deps)} rt)"
                              + f", {len(_result_msgs)} msgs, {len(_result_data)} data items")
+    logger.debug(f"getdeps http: {dm_http.stats.summary(dm_http.stats.reset())}")
     extramsg_messageexists = bool(messages)
     # allg. Datenverschoenerung
     for dep in deps:
         # ggf. anders runden?
         # dep.disp_countdown = dep.disp_countdown if dep.disp_countdown is not None else int(round((dep.deptime-nowtime).total_seconds()/60))
-        dep.disp_countdown = dep.disp_countdown if dep.disp_countdown is not None else int((dep.deptime-nowtime.replace(second=0, microsecond=0)).total_seconds()/60)
+        dep.disp_countdown = dep.disp_countdown if dep.disp_countdown is not None else _countdown(dep, nowtime)
         dep.disp_linenum = (dep.disp_linenum or dep.linenum)
         if not dep.disp_direction:
             if dep.headsign:
@@ -549,16 +922,44 @@ def getdeps(
             dep.mot = MOT.BUS
         if dep.delay is None:
             dep.delay = 0
-    sorteddeps = sorted([dep for dep in deps if (dep.disp_countdown or 0) >= getdeps_mincountdown],
-                        key=lambda dep: (dep.disp_countdown, not dep.cancelled, -dep.delay, not dep.earlytermination))
+    sorteddeps = sorted([dep for dep in deps if (dep.disp_countdown or 0) >= getdeps_mincountdown], key=_depsortkey)
     if _makemessages(sorteddeps, getdeps_lines - 1): extramsg_messageexists = True
     messages.extend(_extramessages(sorteddeps, getdeps_lines, extramsg_messageexists,
                                    delaymsg_enable, delaymsg_mindelay,
                                    etermmsg_enable, etermmsg_only_visible,
                                    nodepmsg_enable, nortmsg_limit))  # erweitert selber schon die dep.messages
+    # Listen kopiert, falls der Aufrufer (ohne Prozessgrenze) sie erweitert
+    _lastreturned = (list(sorteddeps), list(messages), dict(data))
+    if getdeps_unchanged and last is not None and _sameexceptcountdowns(last, _lastreturned):
+        logger.trace("getdeps: only countdowns changed")
+        return DepsUnchanged([dep.disp_countdown for dep in sorteddeps])
     return sorteddeps, messages, data
 
 
+_lastreturned: Optional[type_depmsgdata] = None
+
+
+def _countdown(dep: Departure, nowtime: datetime) -> int:
+    return int((dep.deptime-nowtime.replace(second=0, microsecond=0)).total_seconds()/60)
+
+
+def _depsortkey(dep: Departure) -> Tuple:
+    return (dep.disp_countdown, not dep.cancelled, -dep.delay, not dep.earlytermination)
+
+
+def recountdown(deps: List[Departure], nowtime: datetime, mincountdown: int = -9) -> List[Departure]:
+    # fertige Abfahrten (von getdeps) mit countdowns neu aus deptime, als Kopien, neu sortiert und gefiltert wie in getdeps
+    deps = [replace(dep, messages=list(dep.messages), disp_countdown=_countdown(dep, nowtime)) for dep in deps]
+    return sorted([dep for dep in deps if dep.disp_countdown >= mincountdown], key=_depsortkey)
+
+
+def _sameexceptcountdowns(a: type_depmsgdata, b: type_depmsgdata) -> bool:
+    adeps, amessages, adata = a
+    bdeps, bmessages, bdata = b
+    return (len(adeps) == len(bdeps) and amessages == bmessages and adata == bdata
+            and all({**vars(x), 'disp_countdown': None} == {**vars(y), 'disp_countdown': None} for x, y in zip(adeps, bdeps)))
+
+
 def _makemessages(sorteddeps: List[Departure], linecount: int) -> bool:
     # Mehrfach vorkommende messages reduzieren, weiterhin doppelte vermeiden
     _msgsets: defaultdict = defaultdict(lambda: [set(), set()])
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
+from bisect import bisect_right
+from math import gcd
 import random
-from rgbmatrix import graphics
+from collections import OrderedDict
+from PIL import Image, ImageChops
+import dm_backend
+import dm_bdf
 
 
 def clockstr_tt(tt):
@@ -9,14 +14,68 @@ def clockstr_tt(tt):
 
 def colorppm(ppm, color, fromcolor=(255, 255, 255)):
     newppm = ppm.copy()
-    data = newppm.load()
-    for x in range(newppm.size[0]):
-        for y in range(newppm.size[1]):
-            if data[x, y] == fromcolor:
-                data[x, y] = (color.red, color.green, color.blue)
+    newppm.paste((color.red, color.green, color.blue), (0, 0) + newppm.size, colormask(newppm, fromcolor))
     return newppm
 
 
+def colormask(ppm, rgb):
+    # 255 wo ein Pixel genau rgb ist, sonst 0
+    r, g, b = ImageChops.difference(ppm, Image.new("RGB", ppm.size, rgb)).split()
+    diff = ImageChops.lighter(ImageChops.lighter(r, g), b)
+    # jede Abweichung auf 255 (2*diff*128), dann umkehren
+    return ImageChops.invert(ImageChops.add(diff, diff, scale=1/128))
+
+
+class TintCache:
+    # eingefärbte Varianten (colorppm) erst bei Bedarf erzeugen, Schlüssel (Bildname, Farbe),
+    # höchstens maxsize, danach werden die am längsten nicht genutzten verworfen
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.tinted = OrderedDict()
+
+    def get(self, name, ppm, color, fromcolor=(255, 255, 255)):
+        key = (name, color.red, color.green, color.blue, fromcolor)
+        tinted = self.tinted.get(key)
+        if tinted is None:
+            tinted = self.tinted[key] = colorppm(ppm, color, fromcolor)
+            if len(self.tinted) > self.maxsize:
+                self.tinted.popitem(last=False)
+        else:
+            self.tinted.move_to_end(key)
+        return tinted
+
+
+class ImageLayer:
+    # offscreen "canvas" fuer selten veraenderte inhalte, wird mit SetImage auf die FrameCanvas gebracht
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.image = Image.new("RGB", (width, height))
+        self.data = self.image.load()
+
+    def SetPixel(self, x, y, r, g, b):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.data[x, y] = (int(r), int(g), int(b))
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True, transp=False):
+        if transp:
+            self.image.paste(image, (offset_x, offset_y), transpmask(image))
+        else:
+            self.image.paste(image, (offset_x, offset_y))
+
+    def Fill(self, r, g, b):
+        self.image.paste((r, g, b), (0, 0, self.width, self.height))
+
+    def Clear(self):
+        self.Fill(0, 0, 0)
+
+
+def transpmask(ppm):
+    # schwarz ist transparent, wie bei SetImage(..., transp=True)
+    r, g, b = ppm.split()
+    return ImageChops.lighter(ImageChops.lighter(r, g), b).point(lambda v: 255 if v else 0)
+
+
 def drawppm_topcentered(canvas, ppm, cx, ty, unsafe=True, transp=False):
     halfwidth = ppm.size[0]//2
     canvas.SetImage(ppm, cx-halfwidth, ty, unsafe, transp)
@@ -39,9 +98,11 @@ def drawppm_bottomright(canvas, ppm, rx, by, unsafe=True, transp=False):
     return rx+1
 
 
-def drawsecpixels(canvas, coords, sec, maincolor, addcolor=None, offcolor=graphics.Color()):
+def drawsecpixels(canvas, coords, sec, maincolor, addcolor=None, offcolor=None):
     if addcolor is None:
         addcolor = maincolor
+    if offcolor is None:
+        offcolor = dm_backend.graphics.Color()
     groups = len(coords)
     groupsecs = 60 / groups
     for _i, (x, y) in enumerate(coords):
@@ -55,16 +116,26 @@ def drawsecpixels(canvas, coords, sec, maincolor, addcolor=None, offcolor=graphi
         canvas.SetPixel(x, y, _r, _g, _b)
 
 
-def drawverticaltime(canvas, font, x, y, color, hour, minute, sec=None, sec_mainc=None, sec_addc=None, sec_offc=graphics.Color()):
-    y = 1 + graphics.VerticalDrawText(canvas, font, x, y, color, f"{hour:02}")
+def drawverticaltime(canvas, font, x, y, color, hour, minute, sec=None, sec_mainc=None, sec_addc=None, sec_offc=None):
+    y = 1 + dm_backend.graphics.VerticalDrawText(canvas, font, x, y, color, f"{hour:02}")
     if sec is not None:
         drawsecpixels(canvas, ((x+2,y), (x+2,y+1), (x+1,y+1), (x+1,y)), sec, maincolor=(sec_mainc or color), addcolor=sec_addc, offcolor=sec_offc)
     y += 1 + font.height + 1
-    y += graphics.VerticalDrawText(canvas, font, x, y, color, f"{minute:02}")
+    y += dm_backend.graphics.VerticalDrawText(canvas, font, x, y, color, f"{minute:02}")
 
 
 def makechristmasfn(maxrgb, randspeed, ptrgb, ptspeed, ptlen, ptscale):
+    def period(x_min, x_max):
+        # nach so vielen Durchläufen wiederholt sich alles (Zufallsmuster beginnen dann von vorne),
+        # so gibt es nur endlich viele verschiedene Bilder, siehe ChristmasFrames
+        p = 1
+        for _s in (randspeed, ptspeed*(x_max-x_min)):
+            if _s:
+                p = p*_s//gcd(p, _s)
+        return p
+
     def drawchristmas(canvas, x_min, x_max, y_min, y_max, i):
+        i %= period(x_min, x_max)
         l = x_max+1-x_min
         bbness = 1
         if ptspeed:
@@ -88,4 +159,159 @@ def makechristmasfn(maxrgb, randspeed, ptrgb, ptspeed, ptlen, ptscale):
                 canvas.SetPixel(x_min+x%(tmp), y_min+1, ptrgb[0]*(not x%2), ptrgb[1]*(not x%2), ptrgb[2]*(not x%2))
                 canvas.SetPixel(x_min+(x_max-x)%(tmp), y_max-1, ptrgb[0]*bool(x%2), ptrgb[1]*bool(x%2), ptrgb[2]*bool(x%2))
                 canvas.SetPixel(x_min+(x_max-x)%(tmp), y_max, ptrgb[0]*(not x%2), ptrgb[1]*(not x%2), ptrgb[2]*(not x%2))
+
+    def framekey(x_min, x_max, i):
+        # alles, wovon ein Bild abhängt (außer der Geometrie)
+        i %= period(x_min, x_max)
+        return (randspeed and i//randspeed), (ptspeed and i//ptspeed)
+
+    def framesuntil(x_min, x_max, i):
+        # Bilder bis sich framekey ändert (die Periode ist ein Vielfaches beider), None: nie
+        p = period(x_min, x_max)
+        return min((s - i % s for s in (randspeed, ptspeed) if s and s < p), default=None)
+
+    drawchristmas.framekey = framekey
+    drawchristmas.framesuntil = framesuntil
     return drawchristmas
+
+
+class _PixelRecorder:
+    # nimmt SetPixel-Aufrufe auf (letzter Wert zählt), wie auf einer Canvas mit width x height
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = {}
+
+    def SetPixel(self, x, y, r, g, b):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[(x, y)] = (int(r), int(g), int(b))
+
+
+class ChristmasFrames:
+    # Bilder von drawchristmas nur einmal berechnen und danach mit SetImage(..., transp=True) übertragen.
+    # Ein Bild besteht aus Streifen (zusammenhängende Zeilen mit gesetzten Pixeln) und den schwarz gesetzten Pixeln,
+    # die bei transp ja sonst nicht übertragen würden, so ist das Ergebnis dasselbe wie mit drawchristmas direkt.
+    # light: schwarz gesetzte Pixel weglassen, also nur ein SetImage je Streifen (für große Flächen, nicht ganz exakt).
+    # Gespeichert werden höchstens maxbytes, danach werden die am längsten nicht genutzten Bilder verworfen.
+    def __init__(self, drawfn, maxbytes=4*1024*1024, light=False):
+        self.drawfn = drawfn
+        self.maxbytes = maxbytes
+        self.light = light
+        self.frames = OrderedDict()
+        self.bytes = 0
+        self.geometry = None
+        self.rendered = 0
+
+    def render(self, width, height, x_min, x_max, y_min, y_max, i):
+        recorder = _PixelRecorder(width, height)
+        self.drawfn(recorder, x_min, x_max, y_min, y_max, i)
+        self.rendered += 1
+        pixels = recorder.pixels
+        if not pixels:
+            return (), (), 0
+        bands = []
+        for y in sorted({y for _, y in pixels}):
+            if bands and bands[-1][1] == y-1:
+                bands[-1] = (bands[-1][0], y)
+            else:
+                bands.append((y, y))
+        strips = []
+        size = 0
+        for y0, y1 in bands:
+            bandpixels = [(x, y, rgb) for (x, y), rgb in pixels.items() if y0 <= y <= y1]
+            x0 = min(x for x, _, _ in bandpixels)
+            x1 = max(x for x, _, _ in bandpixels)
+            image = Image.new("RGB", (x1-x0+1, y1-y0+1))
+            data = image.load()
+            for x, y, rgb in bandpixels:
+                data[x-x0, y-y0] = rgb
+            strips.append((x0, y0, image))
+            size += image.size[0] * image.size[1] * 3
+        blacks = () if self.light else tuple(xy for xy, rgb in pixels.items() if rgb == (0, 0, 0))
+        return tuple(strips), blacks, size + 16 * len(blacks)
+
+    def __call__(self, canvas, x_min, x_max, y_min, y_max, i):
+        geometry = (canvas.width, canvas.height, x_min, x_max, y_min, y_max)
+        if geometry != self.geometry:
+            self.frames.clear()
+            self.bytes = 0
+            self.geometry = geometry
+        key = self.drawfn.framekey(x_min, x_max, i)
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self.frames[key] = self.render(*geometry, i)
+            self.bytes += frame[2]
+            while self.bytes > self.maxbytes and len(self.frames) > 1:
+                self.bytes -= self.frames.popitem(last=False)[1][2]
+        else:
+            self.frames.move_to_end(key)
+        strips, blacks, _ = frame
+        for x0, y0, image in strips:
+            canvas.SetImage(image, x0, y0, True, True)
+        for x, y in blacks:
+            canvas.SetPixel(x, y, 0, 0, 0)
+
+
+class TextStrips:
+    # Scrolltexte (dm_fontmetrics.TextLayout) einmal mit dm_bdf in Bilder zeichnen, beim Scrollen wird dann
+    # nur der sichtbare Ausschnitt mit SetImage(..., transp=True) übertragen statt jedes Mal DrawText.
+    # Lange Texte werden an Zeichengrenzen in Stücke von höchstens chunkpx Pixeln Breite geteilt.
+    # Gespeichert werden höchstens maxbytes, danach werden die am längsten nicht genutzten Texte verworfen.
+    def __init__(self, maxbytes=2*1024*1024, chunkpx=512):
+        self.maxbytes = maxbytes
+        self.chunkpx = chunkpx
+        self.strips = OrderedDict()
+        self.bytes = 0
+        self.rendered = 0
+
+    def render(self, font, layout, color):
+        bdffont = dm_bdf.fontfor(font)
+        dys = [dy for g in map(bdffont.glyph, map(ord, set(layout.text))) if g is not None for _, dy in g[1]]
+        if not dys:
+            return 0, (), (), 0
+        top = min(dys)
+        height = max(dys) - top + 1
+        offsets = layout.offsets
+        starts = []
+        images = []
+        first = 0
+        while first < len(layout):
+            last = min(len(layout), max(first + 1, bisect_right(offsets, offsets[first] + self.chunkpx, first) - 1))
+            layer = ImageLayer(max(1, offsets[last] - offsets[first]), height)
+            dm_bdf.DrawText(layer, bdffont, 0, -top, color, layout.text[first:last])
+            starts.append(first)
+            images.append(layer.image)
+            first = last
+        self.rendered += 1
+        return top, tuple(starts), tuple(images), sum(im.size[0] * im.size[1] * 3 for im in images)
+
+    def get(self, font, layout, color):
+        key = (font, layout.text, color.red, color.green, color.blue)
+        strip = self.strips.get(key)
+        if strip is None:
+            strip = self.strips[key] = self.render(font, layout, color)
+            self.bytes += strip[3]
+            while self.bytes > self.maxbytes and len(self.strips) > 1:
+                self.bytes -= self.strips.popitem(last=False)[1][3]
+        else:
+            self.strips.move_to_end(key)
+        return strip
+
+    def draw(self, canvas, font, x, y, color, layout, first, count):
+        # wie DrawText(canvas, font, x, y, color, layout.text[first:first+count])
+        top, starts, images, _ = self.get(font, layout, color)
+        offsets = layout.offsets
+        end = first + count
+        k = max(0, bisect_right(starts, first) - 1)
+        while k < len(starts) and starts[k] < end:
+            a = max(first, starts[k])
+            b = min(end, starts[k+1] if k+1 < len(starts) else len(layout))
+            image = images[k]
+            left = offsets[a] - offsets[starts[k]]
+            right = offsets[b] - offsets[starts[k]]
+            if right > left:
+                if left or right < image.size[0]:
+                    image = image.crop((left, 0, right, image.size[1]))
+                canvas.SetImage(image, x + offsets[a] - offsets[first], y + top, True, True)
+            k += 1
+        return offsets[end] - offsets[first]
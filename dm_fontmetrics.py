@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Zeichenbreiten der BDF-Schriften als dichtes Array (Index = Codepoint),
+# dazu je Text die Präfixsummen der Breiten:
+#   prefix[k] = Breite der ersten k Zeichen (ohne extra_spacing),
+# Textbreite ist dann prefix[-1], "wie viele Zeichen passen in n Pixel" ein bisect.
+# Fehlende Zeichen haben die Breite von U+FFFD (wie beim Zeichnen), fehlt auch das, 0.
+# Schriften, zu denen es keine BDF-Daten gibt, werden nur für tatsächlich vorkommende Zeichen abgefragt (QueriedFontMetrics).
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate, chain
+from typing import Any, Dict, Optional, Tuple
+
+import dm_bdf
+
+
+class FontMetrics:
+    def __init__(self, widths: Dict[int, int]):
+        self.fallback = widths.get(dm_bdf.REPLACEMENT_CODEPOINT, 0)
+        self.maxcp = max(widths, default=-1)
+        self.widths = array("H", [self.fallback]) * (self.maxcp + 1)
+        for cp, w in widths.items():
+            if cp >= 0:
+                self.widths[cp] = w
+        self.prefix = lru_cache(maxsize=1024)(self._prefix)
+
+    @classmethod
+    def fromfont(cls, font: dm_bdf.Font) -> "FontMetrics":
+        return cls({cp: g[0] for cp, g in font.glyphs.items()})
+
+    @classmethod
+    def fromfile(cls, path: str) -> "FontMetrics":
+        # nur ENCODING und DWIDTH, die Bitmaps werden hier nicht gebraucht
+        widths: Dict[int, int] = {}
+        codepoint = -1
+        with open(path, encoding="latin-1") as f:
+            for line in f:
+                if line.startswith("ENCODING"):
+                    codepoint = int(line.split()[1])
+                elif line.startswith("DWIDTH"):
+                    widths[codepoint] = int(line.split()[1])
+        return cls(widths)
+
+    def width(self, cp: int) -> int:
+        return self.widths[cp] if 0 <= cp <= self.maxcp else self.fallback
+
+    def _prefix(self, text: str) -> Tuple[int, ...]:
+        if text and ord(max(text)) > self.maxcp:
+            widths = map(self.width, map(ord, text))
+        else:
+            widths = map(self.widths.__getitem__, map(ord, text))
+        return tuple(accumulate(chain((0,), widths)))
+
+    def textwidth(self, text: str, first: int = 0, last: Optional[int] = None) -> int:
+        # Breite von text[first:last]
+        prefix = self.prefix(text)
+        return prefix[len(text) if last is None else last] - prefix[first]
+
+    def fit(self, text: str, pixel: int, first: int = 0) -> int:
+        # Anzahl der Zeichen ab first, die zusammen höchstens pixel breit sind
+        prefix = self.prefix(text)
+        return max(0, bisect_right(prefix, prefix[first] + pixel, first) - 1 - first)
+
+
+class QueriedFontMetrics(FontMetrics):
+    # Schrift ohne BDF-Daten (weder dm_bdf.Font noch registriert): Breiten erst, wenn ein Zeichen vorkommt,
+    # einzeln von font.CharacterWidth abfragen (wie sonst nur Codepoints bis U+FFFF)
+    def __init__(self, font: Any):
+        self.font = font
+        self.known: Dict[int, int] = {}
+        # fehlt auch U+FFFD, bleibt es bei 0
+        self.fallback = 0
+        self.fallback = self.width(dm_bdf.REPLACEMENT_CODEPOINT)
+        self.maxcp = -1
+        self.prefix = lru_cache(maxsize=1024)(self._prefix)
+
+    def width(self, cp: int) -> int:
+        w = self.known.get(cp)
+        if w is None:
+            w = self.font.CharacterWidth(cp) if 0 <= cp <= 0xffff else -1
+            if w == -1:
+                w = self.fallback
+            self.known[cp] = w
+        return w
+
+    def _prefix(self, text: str) -> Tuple[int, ...]:
+        return tuple(accumulate(chain((0,), map(self.width, map(ord, text)))))
+
+
+class TextLayout:
+    # fertig vermessener Text für die Scrollzeilen (beim update() erzeugt),
+    # offsets[k] = x-Position von Zeichen k relativ zum Textanfang, offsets[-1] = Breite
+    def __init__(self, font: Any, text: str):
+        metrics = fontmetrics(font)
+        self.source = text
+        # Zeichen ohne Breite werden nicht angezeigt
+        self.text = "".join(c for c in text if metrics.width(ord(c)))
+        self.offsets = metrics._prefix(self.text)
+        self.width = self.offsets[-1]
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def charwidth(self, i: int) -> int:
+        return self.offsets[i+1] - self.offsets[i]
+
+    def span(self, start: int, end: int, first: int = 0) -> int:
+        # wie viele Zeichen ab first von x=start bis x=end passen (wie dm_lines.propscroll)
+        offsets = self.offsets
+        return max(0, bisect_right(offsets, offsets[first] + end - start + 2, first) - 1 - first)
+
+
+_metrics: Dict[Any, FontMetrics] = {}
+
+
+def fontmetrics(font: Any) -> FontMetrics:
+    # font: dm_bdf.Font oder bei dm_bdf registrierte Schrift (rgbmatrix graphics.Font)
+    m = _metrics.get(font)
+    if m is None:
+        source = font if isinstance(font, dm_bdf.Font) else dm_bdf.registered(font)
+        if isinstance(source, dm_bdf.Font):
+            m = FontMetrics.fromfont(source)
+        elif source is not None:
+            m = FontMetrics.fromfile(source)
+        else:
+            m = QueriedFontMetrics(font)
+        _metrics[font] = m
+    return m
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# Ausgabe der Matrixbilder für andere Prozesse (Vorschau, ppmtools/ppmtest.py, ...)
+#
+# FrameSink: Ringpuffer in einer per mmap eingebundenen Datei (am besten auf tmpfs, z. B. /dev/shm/dm_frames).
+# Aufbau (little endian):
+#   Kopf (32 Bytes): magic b"DMFS", version (H), width (H), height (H), slots (H), framesize (I), latest (Q), Rest frei
+#   slots * (seq (Q), timestamp (d), framesize Bytes RGB)
+# Bild n (ab 1) liegt in Slot n % slots. Während des Schreibens ist seq des Slots 2n-1, danach 2n,
+# anschließend wird latest auf n gesetzt. Ein Leser ist konsistent, wenn seq vor und nach dem Lesen 2n ist.
+# Mit dm_softmatrix kommt jedes Bild direkt aus dem Puffer der Canvas. rgbmatrix gibt die Pixel nur über canvas.ppm()
+# heraus (Datei auf tmpfs schreiben und wieder lesen), dort deshalb nur alle interval Sekunden (--frame-sink-interval).
+#
+# PPMSnapshot: --write-ppm, nur noch alle paar Sekunden und atomar (temporäre Datei + os.replace).
+from mmap import mmap, ACCESS_READ
+from os import O_CREAT, O_RDWR, O_TRUNC, close, fstat, ftruncate, getpid, open as os_open, path, replace, stat, unlink
+from struct import Struct
+from tempfile import gettempdir
+from time import monotonic, time
+from typing import NamedTuple, Optional
+
+MAGIC = b"DMFS"
+VERSION = 1
+HEADER = Struct("<4sHHHHIQ")
+HEADERSIZE = 32
+LATEST_OFFSET = 16
+SLOTHEADER = Struct("<Qd")
+SEQ = Struct("<Q")
+
+
+def hasbuffer(canvas) -> bool:
+    # Pixel ohne Umweg lesbar (dm_softmatrix)
+    return getattr(canvas, "buffer", None) is not None
+
+
+def framebytes(canvas, tmpfile: str = ""):
+    # RGB-Daten einer Canvas. dm_softmatrix hat den Puffer direkt,
+    # bei rgbmatrix (pixelsvector) gibt es nur canvas.ppm(), also über eine Datei auf tmpfs
+    if hasbuffer(canvas):
+        return canvas.buffer
+    tmpfile = tmpfile or path.join("/dev/shm" if path.isdir("/dev/shm") else gettempdir(), f"dm_frame-{getpid()}.ppm")
+    canvas.ppm(tmpfile)
+    with open(tmpfile, "rb") as f:
+        data = f.read()
+    # Kopf "P6 w h 255\n"
+    return memoryview(data)[len(data) - canvas.width * canvas.height * 3:]
+
+
+class Throttle:
+    # höchstens alle interval Sekunden (0: jedes Mal).
+    # pending: ein gezeichnetes Bild wurde deswegen nicht ausgegeben, das aktuelle Bild muss also noch raus,
+    # sobald es wieder dran ist (auch wenn sich bis dahin nichts mehr ändert)
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last: Optional[float] = None
+        self.pending = False
+
+    def due(self) -> bool:
+        return self.last is None or monotonic() - self.last >= self.interval
+
+    def overdue(self) -> bool:
+        return self.pending and self.due()
+
+    def remaining(self) -> float:
+        # Sekunden, bis due() wieder gilt
+        return 0.0 if self.last is None else max(0.0, self.last + self.interval - monotonic())
+
+    def done(self) -> None:
+        self.last = monotonic()
+        self.pending = False
+
+
+class FrameSink(Throttle):
+    def __init__(self, filename: str, width: int, height: int, slots: int = 4, interval: float = 0.0):
+        super().__init__(interval)
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.framesize = width * height * 3
+        self.slotsize = SLOTHEADER.size + self.framesize
+        self.seq = 0
+        size = HEADERSIZE + slots * self.slotsize
+        # neu anlegen und erst fertig initialisiert an die Stelle der alten Datei setzen,
+        # Leser mit der alten Datei sehen dann einfach keine neuen Bilder mehr
+        tmpname = f"{filename}.{getpid()}.tmp"
+        fd = os_open(tmpname, O_RDWR | O_CREAT | O_TRUNC, 0o644)
+        try:
+            ftruncate(fd, size)
+            self.mm = mmap(fd, size)
+        except Exception:
+            unlink(tmpname)
+            raise
+        finally:
+            close(fd)
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, width, height, slots, self.framesize, 0)
+        replace(tmpname, filename)
+
+    def publish(self, data, timestamp: Optional[float] = None) -> int:
+        self.done()
+        n = self.seq + 1
+        offset = HEADERSIZE + (n % self.slots) * self.slotsize
+        mm = self.mm
+        SLOTHEADER.pack_into(mm, offset, 2*n - 1, time() if timestamp is None else timestamp)
+        start = offset + SLOTHEADER.size
+        mm[start:start+self.framesize] = data
+        SEQ.pack_into(mm, offset, 2*n)
+        SEQ.pack_into(mm, LATEST_OFFSET, n)
+        self.seq = n
+        return n
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class Frame(NamedTuple):
+    seq: int
+    timestamp: float
+    # Sicht direkt in den Ringpuffer (keine Kopie), nur gültig solange FrameSource.valid(seq)
+    data: memoryview
+
+
+class FrameSource:
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.inode = fstat(f.fileno()).st_ino
+            self.mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+        magic, version, self.width, self.height, self.slots, self.framesize, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"{filename} is not a frame sink (version {VERSION})")
+        self.slotsize = SLOTHEADER.size + self.framesize
+        self.view = memoryview(self.mm)
+
+    def latest(self) -> int:
+        return SEQ.unpack_from(self.mm, LATEST_OFFSET)[0]
+
+    def valid(self, n: int) -> bool:
+        # noch nicht überschrieben und nicht gerade im Schreiben
+        return n > 0 and SEQ.unpack_from(self.mm, HEADERSIZE + (n % self.slots) * self.slotsize)[0] == 2*n
+
+    def read(self, n: Optional[int] = None) -> Optional[Frame]:
+        if n is None:
+            n = self.latest()
+        if not self.valid(n):
+            return None
+        offset = HEADERSIZE + (n % self.slots) * self.slotsize
+        _, timestamp = SLOTHEADER.unpack_from(self.mm, offset)
+        start = offset + SLOTHEADER.size
+        frame = Frame(n, timestamp, self.view[start:start+self.framesize])
+        # Zeitstempel könnte inzwischen schon zu einem neueren Bild gehören
+        return frame if self.valid(n) else None
+
+    def copy(self, n: Optional[int] = None, retries: int = 3) -> Optional[Frame]:
+        # wie read, aber mit Kopie der Daten, die auch nach dem Überschreiben gültig bleibt
+        for _ in range(retries):
+            frame = self.read(n)
+            if frame is None:
+                if n is not None:
+                    return None
+                continue
+            data = bytes(frame.data)
+            if self.valid(frame.seq):
+                return frame._replace(data=memoryview(data))
+        return None
+
+    def replaced(self) -> bool:
+        # Schreiber neu gestartet (Datei ersetzt), dann neue FrameSource öffnen
+        try:
+            return stat(self.filename).st_ino != self.inode
+        except OSError:
+            return False
+
+    def close(self) -> None:
+        self.view.release()
+        self.mm.close()
+
+
+class PPMSnapshot(Throttle):
+    # --write-ppm: höchstens alle interval Sekunden, Leser sehen immer eine vollständige Datei
+    def __init__(self, filename: str, interval: float):
+        super().__init__(interval)
+        self.filename = filename
+        self.tmpname = f"{filename}.{getpid()}.tmp"
+
+    def write(self, canvas, data=None) -> None:
+        self.done()
+        if data is None:
+            canvas.ppm(self.tmpname)
+        else:
+            with open(self.tmpname, "wb") as f:
+                f.write(f"P6 {canvas.width} {canvas.height} 255\n".encode())
+                f.write(data)
+        replace(self.tmpname, self.filename)
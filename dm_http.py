@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# HTTP für die Datenquellen (dm_depdata): je Server (scheme://host[:port]) eine requests.Session mit
+# Connection-Pool und keep-alive, die im Abrufprozess über alle getdeps-Aufrufe hinweg bestehen bleibt,
+# so entfallen DNS, TCP- und TLS-Aufbau bei den meisten Abrufen.
+# Dazu ein DNS-Cache und Statistik pro Abruf: neue Verbindungen, Zeit für DNS+TCP, übertragene (gepackte) und entpackte Bytes.
+# Beides nur für die Verbindungen dieser Sessions (eigene urllib3-Verbindungsklassen über den HTTPAdapter),
+# der Rest des Prozesses löst Namen weiter normal auf.
+# validators() liefert die Header für bedingte Anfragen (ETag/Last-Modified), die Auswertung von 304 ist Sache des Aufrufers.
+import socket
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+pool_maxsize = 2
+dns_ttl = 300.0
+headers = {"Accept-Encoding": "gzip"}
+
+
+class DNSCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+    def resolve(self, host: str, port: int) -> str:
+        # erste Adresse von getaddrinfo (wie sie urllib3 zuerst versuchen würde)
+        key = (host, port)
+        e = self.entries.get(key)
+        now = monotonic()
+        if e is not None and now - e[0] < self.ttl:
+            return e[1]
+        t = perf_counter()
+        result = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        stats.add(dns=perf_counter() - t)
+        address = result[0][4][0]
+        self.entries[key] = (now, address)
+        return address
+
+    def forget(self, host: str) -> None:
+        keys = [key for key in self.entries if key[0] == host]
+        for key in keys:
+            self.entries.pop(key, None)
+        if keys:
+            logger.debug(f"DNS cache: dropped {len(keys)} entries for {host}")
+
+
+class FetchStats:
+    # über einen getdeps-Aufruf (mehrere Threads) aufsummiert
+    fields = ("requests", "notmodified", "connections", "connect", "dns", "wirebytes", "bytes", "time")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> Dict[str, float]:
+        with self.lock:
+            old = {f: getattr(self, f, 0) for f in self.fields}
+            for f in self.fields:
+                setattr(self, f, 0)
+        return old
+
+    def add(self, **kwargs) -> None:
+        with self.lock:
+            for f, v in kwargs.items():
+                setattr(self, f, getattr(self, f) + v)
+
+    def summary(self, s: Dict[str, float]) -> str:
+        return (f"{s['requests']} requests ({s['notmodified']} not modified), {s['connections']} new connections (DNS+TCP {s['connect']*1000:.0f} ms, DNS {s['dns']*1000:.0f} ms), "
+                f"{s['wirebytes']/1024:.1f} KiB transferred ({s['bytes']/1024:.1f} KiB unpacked), {s['time']*1000:.0f} ms")
+
+
+stats = FetchStats()
+_sessions: Dict[Tuple[str, str], Any] = {}
+_lock = Lock()
+_dnscache = DNSCache(dns_ttl)
+_adapterclass = None
+
+
+def configure(**kwargs) -> None:
+    # pool_maxsize, dns_ttl; bestehende Sessions werden bei Änderung neu aufgebaut
+    global pool_maxsize, dns_ttl
+    changed = False
+    for name, value in kwargs.items():
+        if name not in ("pool_maxsize", "dns_ttl"):
+            raise ValueError(f"unknown http option {name}")
+        if globals()[name] != value:
+            globals()[name] = value
+            changed = True
+    if changed:
+        if _sessions:
+            logger.debug(f"http options changed (pool_maxsize {pool_maxsize}, dns_ttl {dns_ttl}), rebuilding sessions")
+        close()
+        _dnscache.ttl = dns_ttl
+
+
+def _adapter():
+    # HTTPAdapter, dessen Verbindungen über den DNS-Cache aufgebaut und gemessen werden (Klassen einmal pro Prozess)
+    global _adapterclass
+    if _adapterclass is None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+        from urllib3.exceptions import NewConnectionError
+
+        class CachedDNSConnection:
+            def _new_conn(self):
+                # nur zum Verbinden die zwischengespeicherte Adresse, Host-Header und TLS (SNI, Zertifikat) bleiben beim Namen
+                t = perf_counter()
+                host = self._dns_host
+                try:
+                    try:
+                        self._dns_host = _dnscache.resolve(host, self.port)
+                    except socket.gaierror as e:
+                        raise NewConnectionError(self, f"Failed to resolve {host}: {e}") from e
+                    return super()._new_conn()
+                finally:
+                    self._dns_host = host
+                    stats.add(connections=1, connect=perf_counter() - t)
+
+        class CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = type("CachedDNSHTTPConnection", (CachedDNSConnection, HTTPConnection), {})
+
+        class CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = type("CachedDNSHTTPSConnection", (CachedDNSConnection, HTTPSConnection), {})
+
+        class CachedDNSAdapter(HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": CachedDNSHTTPConnectionPool, "https": CachedDNSHTTPSConnectionPool}
+
+        _adapterclass = CachedDNSAdapter
+    return _adapterclass
+
+
+def session(url: str):
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    s = _sessions.get(key)
+    if s is None:
+        with _lock:
+            s = _sessions.get(key)
+            if s is None:
+                import requests
+                s = requests.Session()
+                s.headers.update(headers)
+                s.mount(f"{parts.scheme}://", _adapter()(pool_connections=1, pool_maxsize=pool_maxsize))
+                _sessions[key] = s
+                logger.debug(f"new session for {parts.scheme}://{parts.netloc} (pool_maxsize {pool_maxsize})")
+    return s
+
+
+def get(url: str, **kwargs):
+    # wie requests.get, aber über die Session des Servers
+    from requests.exceptions import ConnectionError
+    t = perf_counter()
+    try:
+        r = session(url).get(url, **kwargs)
+    except ConnectionError:
+        # evtl. veraltete Adresse
+        _dnscache.forget(urlsplit(url).hostname)
+        raise
+    wirebytes = r.raw.tell() if r.raw is not None else len(r.content)
+    stats.add(requests=1, notmodified=int(r.status_code == 304), wirebytes=wirebytes, bytes=len(r.content), time=perf_counter() - t)
+    return r
+
+
+def validators(r) -> Dict[str, str]:
+    # Header, um dieselbe Anfrage nur bei Änderungen neu zu bekommen (sonst 304)
+    h: Dict[str, str] = {}
+    etag = r.headers.get("ETag")
+    if etag:
+        h["If-None-Match"] = etag
+    lastmodified = r.headers.get("Last-Modified")
+    if lastmodified:
+        h["If-Modified-Since"] = lastmodified
+    return h
+
+
+def close() -> None:
+    with _lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
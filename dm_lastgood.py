@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Letztes erfolgreiches Ergebnis von getdeps als Datei (--last-good): nach einem Neustart (nächtlicher Reboot,
+# reload, Absturz) wird es sofort angezeigt, bis die ersten neuen Daten da sind, und es springt ein, wenn alle
+# Datenquellen ausfallen. Die countdowns werden dabei aus deptime neu berechnet. Eine Meldung mit dem Datenstand kommt
+# dazu, solange in diesem Prozess noch kein Abruf geklappt hat (die Uhr kann direkt nach dem Start noch falsch gehen,
+# z. B. ohne RTC mit der Zeit von fake-hwclock, dann sähen alte Daten wie aktuelle aus), danach ab staleafter Sekunden Alter.
+# pickle (Version, Zeitpunkt, Ergebnis), höchstens alle interval Sekunden und atomar (temporäre Datei + os.replace).
+import pickle
+from datetime import datetime, timezone
+from os import getpid, replace
+from time import monotonic, time
+from typing import Optional, Union
+
+from loguru import logger
+
+from dm_depdata import DepsUnchanged, Meldung, recountdown, type_depmsgdata
+
+VERSION = 1
+
+
+class LastGood:
+    def __init__(self, filename: str, interval: float = 60.0):
+        self.filename = filename
+        self.tmpname = f"{filename}.{getpid()}.tmp"
+        self.interval = interval
+        self.last: Optional[float] = None
+        self.saved: Optional[float] = None
+        self.result: Optional[type_depmsgdata] = None
+        # schon ein erfolgreicher Abruf in diesem Prozess
+        self.live = False
+
+    def update(self, result: Union[type_depmsgdata, DepsUnchanged]) -> None:
+        # bei DepsUnchanged bleibt das Ergebnis, nur der Zeitpunkt ist neu
+        if not isinstance(result, DepsUnchanged):
+            deps, messages, data = result
+            self.result = (list(deps), list(messages), dict(data))
+        if self.result is None:
+            return
+        self.live = True
+        self.saved = time()
+        if self.last is None or monotonic() - self.last >= self.interval:
+            self.write()
+
+    def write(self) -> None:
+        self.last = monotonic()
+        try:
+            with open(self.tmpname, "wb") as f:
+                pickle.dump((VERSION, self.saved, self.result), f, pickle.HIGHEST_PROTOCOL)
+            replace(self.tmpname, self.filename)
+        except OSError as e:
+            logger.warning(f"could not write {self.filename}: {e}")
+
+    def load(self) -> bool:
+        try:
+            with open(self.filename, "rb") as f:
+                version, saved, result = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.opt(exception=True).warning(f"could not read {self.filename}")
+            return False
+        if version != VERSION:
+            return False
+        if saved > time() + 60:
+            # Uhr geht (noch) falsch, z. B. direkt nach dem Start ohne RTC
+            logger.warning(f"{self.filename} is newer than the system clock, ignoring it")
+            return False
+        self.saved, self.result = saved, result
+        logger.info(f"loaded data from {datetime.fromtimestamp(saved):%H:%M:%S} ({len(result[0])} deps) from {self.filename}")
+        return True
+
+    def restore(self, tz: timezone, mincountdown: int, staleafter: float) -> Optional[type_depmsgdata]:
+        if self.result is None:
+            return None
+        deps, messages, data = self.result
+        messages = list(messages)
+        if not self.live or time() - self.saved > staleafter:
+            messages.insert(0, Meldung(symbol="warn", text=f"Stand {datetime.fromtimestamp(self.saved, tz):%H:%M} Uhr, Daten evtl. nicht aktuell. Bitte Aushangfahrpläne beachten."))
+        return recountdown(deps, datetime.now(tz), mincountdown), messages, dict(data)
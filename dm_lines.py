@@ -1,20 +1,23 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
 from dataclasses import dataclass, field
-from functools import lru_cache
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
+from loguru import logger
 from PIL import Image
-from rgbmatrix import graphics
-from rgbmatrix.core import FrameCanvas
+import dm_backend
+if TYPE_CHECKING:
+    from dm_backend import FrameCanvas, graphics
 
-from dm_drawstuff import drawppm_bottomleft
+from dm_drawstuff import TextStrips, drawppm_bottomleft
+from dm_fontmetrics import TextLayout, fontmetrics
 from dm_depdata import Meldung
 
 
 class MultisymbolScrollline:
     @dataclass
     class __Element:
-        text: str
+        layout: TextLayout
         symbol: Image.Image
         initial_pretext: int
         initial_posttext: int
@@ -33,7 +36,7 @@ class MultisymbolScrollline:
             self.letters_passed = 0
             self.curr_textxoffset = 0
 
-    def __init__(self, lx, rx, symoffset, font, textcolor, symdict, bgcolor_t=None, initial_pretext=2, initial_posttext=5, pretext_zero_if_no_symbol=True, add_end_spacer=True):
+    def __init__(self, lx, rx, symoffset, font, textcolor, symdict, bgcolor_t=None, initial_pretext=2, initial_posttext=5, pretext_zero_if_no_symbol=True, add_end_spacer=True, strips: Optional[TextStrips] = None):
         # attributes
         self.lx = lx
         self.rx = rx
@@ -41,11 +44,12 @@ class MultisymbolScrollline:
         self.font = font
         self.textcolor = textcolor
         self.symdict = symdict
-        self.bgcolor = graphics.Color(*bgcolor_t) if bgcolor_t else graphics.Color()
+        self.bgcolor = dm_backend.graphics.Color(*bgcolor_t) if bgcolor_t else dm_backend.graphics.Color()
         self.initial_posttext = initial_posttext
         self.initial_pretext = initial_pretext
         self.pretext_zero_if_no_symbol = pretext_zero_if_no_symbol
         self.add_end_spacer = add_end_spacer
+        self.strips = strips
         # self.staticleftsymtextspacing = staticleftsymtextspacing
         # self.forcescroll = forcescroll
         # self.noscroll = noscroll
@@ -57,34 +61,88 @@ class MultisymbolScrollline:
         self.currlastelemi = None
         self.shownelems = 0
         self.startpos = rx
+        # Statistik zu update() (nur wenn vorher schon etwas gescrollt hat)
+        self.updates = 0
+        self.kept = 0
+        self.visiblechanges = 0
 
     def update(self, meldungs: List[Meldung]) -> None:
         if meldungs == self.meldungs:
             return
-        ...  # todo: schlaue anpassung je nach davor angezeigter meldung; dabei alle anderen zeilen hier anpassen
-        self.meldungs = meldungs
-        self.elements = []
-        self.currfirstelemi = None
-        self.currlastelemi = None
-        self.shownelems = 0
-        self.startpos = self.rx
+        # Elemente unveränderter Meldungen samt Scrollzustand behalten, nur neue aufbauen.
+        # Ist das gerade linke Element noch dabei, geht es an derselben Stelle weiter, sonst von vorne.
+        leftelem = self.elements[self.currfirstelemi] if self.elements and self.currfirstelemi is not None else None
+        visiblebefore = self.visibleelements()
+        old = list(zip(self.meldungs, self.elements))
+        layouts = {elem.layout.source: elem.layout for elem in self.elements}
+        elements = []
         for meldung in meldungs:
-            _symbol = self.symdict and self.symdict.get(meldung.symbol) or None
-            self.elements.append(self.__class__.__Element(text=''.join(_char for _char in meldung.text if characterwidth(self.font, ord(_char))),
-                                                          symbol=_symbol,
-                                                          initial_pretext=self.initial_pretext if (_symbol is not None or not self.pretext_zero_if_no_symbol) else 0,
-                                                          initial_posttext=self.initial_posttext))
-        if self.elements:
-            if self.elements[0].symbol is not None:
-                self.startpos -= (self.elements[0].symbol.size[0] - 1)
+            for k, (_meldung, elem) in enumerate(old):
+                if _meldung == meldung:
+                    del old[k]
+                    break
+            else:
+                _symbol = self.symdict and self.symdict.get(meldung.symbol) or None
+                elem = self.__class__.__Element(layout=layouts.get(meldung.text) or TextLayout(self.font, meldung.text),
+                                                symbol=_symbol,
+                                                initial_pretext=self.initial_pretext if (_symbol is not None or not self.pretext_zero_if_no_symbol) else 0,
+                                                initial_posttext=self.initial_posttext)
+            elements.append(elem)
+        startpos = self.rx
+        if elements:
+            if elements[0].symbol is not None:
+                startpos -= (elements[0].symbol.size[0] - 1)
+            for elem in elements:
+                elem.initial_posttext = self.initial_posttext
             if self.add_end_spacer:
-                self.elements[-1].initial_posttext = 0
-                self.elements[-1].posttext = 0
-                self.elements.append(self.__class__.__Element(text='', symbol=None, initial_pretext=0, initial_posttext=self.startpos-self.lx))
+                elements[-1].initial_posttext = 0
+                spacer = self.elements[-1] if self.elements and self.elements[-1] is leftelem else None
+                if spacer is None:
+                    spacer = self.__class__.__Element(layout=TextLayout(self.font, ''), symbol=None, initial_pretext=0, initial_posttext=0)
+                spacer.initial_posttext = startpos - self.lx
+                elements.append(spacer)
+        self.meldungs = meldungs
+        self.elements = elements
+        keep = any(elem is leftelem for elem in elements)
+        for elem in elements:
+            if not (keep and elem is leftelem):
+                elem.reset()
+        if keep:
+            self.currfirstelemi = next(k for k, elem in enumerate(elements) if elem is leftelem)
+        else:
+            self.currfirstelemi = None
+            self.currlastelemi = None
+            self.shownelems = 0
+            self.startpos = startpos
+        if self.strips is not None:
+            for elem in self.elements:
+                self.strips.get(self.font, elem.layout, self.textcolor)
+        if leftelem is None:
+            return
+        visibleafter = self.visibleelements()
+        self.updates += 1
+        self.kept += keep
+        changed = len(visiblebefore) != len(visibleafter) or any(a is not b for a, b in zip(visiblebefore, visibleafter))
+        self.visiblechanges += changed
+        logger.debug(f"meldungs updated, {'position kept' if keep else 'restarted'}, visible content {'changed' if changed else 'unchanged'} "
+                     f"({self.kept}/{self.updates} kept, {self.visiblechanges}/{self.updates} visibly changed)")
+
+    def visibleelements(self) -> tuple:
+        # zuletzt sichtbare Elemente, von links
+        if not self.elements or self.currfirstelemi is None:
+            return ()
+        return tuple(self.elements[(self.currfirstelemi + k) % len(self.elements)] for k in range(self.shownelems))
 
-    def render(self, canvas: FrameCanvas, texty: int) -> None:
+    def render(self, canvas: FrameCanvas, texty: int, steps: int = 1) -> None:
+        # erst steps Pixel weiterscrollen, dann zeichnen (steps 0: dasselbe wie zuletzt)
         if not self.elements:
             return
+        for _ in range(steps):
+            self._walk(None, texty, True)
+        self._walk(canvas, texty, False)
+
+    def _walk(self, canvas: Optional[FrameCanvas], texty: int, advance: bool) -> None:
+        # sichtbare Elemente durchgehen, zeichnen (canvas) oder um einen Pixel weiterschieben (advance)
         currx = self.startpos
         if self.currfirstelemi is None:
             self.currfirstelemi = 0
@@ -96,53 +154,56 @@ class MultisymbolScrollline:
             if currx + (elem.symbol is not None and (elem.symbol.size[0] - 1)) <= self.rx:
                 self.shownelems += 1
                 self.currlastelemi = elemi
-                if elem.symbol is not None: currx = drawppm_bottomleft(canvas, elem.symbol, currx, texty+self.symoffset, transp=True)
+                if elem.symbol is not None:
+                    currx = drawppm_bottomleft(canvas, elem.symbol, currx, texty+self.symoffset, transp=True) if canvas is not None else currx + elem.symbol.size[0]
                 if isleftelem:
                     currx += elem.pretext
-                    text_max = propscroll(self.font, elem.text[elem.letters_passed:], currx+elem.curr_textxoffset, self.rx)
+                    text_max = elem.layout.span(currx+elem.curr_textxoffset, self.rx, elem.letters_passed)
                 else:
                     currx += elem.initial_pretext
-                    text_max = propscroll(self.font, elem.text, currx, self.rx)
-                if text_max or (not elem.text) or (isleftelem and elem.letters_passed == len(elem.text)):
+                    text_max = elem.layout.span(currx, self.rx)
+                if text_max or (not elem.layout) or (isleftelem and elem.letters_passed == len(elem.layout)):
                     if isleftelem:
                         currx += elem.curr_textxoffset
                     if text_max:
                         if isleftelem:
-                            currx += graphics.DrawText(canvas, self.font, currx, texty, self.textcolor, elem.text[elem.letters_passed:elem.letters_passed+text_max]) - 1
-                            if not elem.pretext:
-                                elem.curr_textxoffset -= 1
-                            if elem.curr_textxoffset < 0:
-                                elem.curr_textxoffset = characterwidth(self.font, ord(elem.text[elem.letters_passed])) - 1
-                                elem.letters_passed += 1
+                            currx += drawlayout(canvas, self.font, currx, texty, self.textcolor, elem.layout, elem.letters_passed, text_max, self.strips) - 1
+                            if advance:
+                                if not elem.pretext:
+                                    elem.curr_textxoffset -= 1
+                                if elem.curr_textxoffset < 0:
+                                    elem.curr_textxoffset = elem.layout.charwidth(elem.letters_passed) - 1
+                                    elem.letters_passed += 1
                         else:
-                            currx += graphics.DrawText(canvas, self.font, currx, texty, self.textcolor, elem.text[:text_max]) - 1
-                    else:  # if ((not elem.text) or (isleftelem and elem.letters_passed = len(elem.text))):
-                        if isleftelem and elem.posttext < 0 and elem.symbol is not None:
+                            currx += drawlayout(canvas, self.font, currx, texty, self.textcolor, elem.layout, 0, text_max, self.strips) - 1
+                    else:  # if ((not elem.layout) or (isleftelem and elem.letters_passed = len(elem.layout))):
+                        if canvas is not None and isleftelem and elem.posttext < 0 and elem.symbol is not None:
                             _thissize = elem.symbol.size[0]
                             for _y in range(texty+self.symoffset-elem.symbol.size[1], texty+self.symoffset+1):
-                                graphics.DrawLine(canvas, self.lx+_thissize+elem.posttext, _y, self.lx+_thissize-1, _y, self.bgcolor)
+                                dm_backend.graphics.DrawLine(canvas, self.lx+_thissize+elem.posttext, _y, self.lx+_thissize-1, _y, self.bgcolor)
                     if isleftelem:
                         currx += elem.posttext
-                        if elem.letters_passed == len(elem.text):
-                            if elem.curr_textxoffset:
-                                elem.curr_textxoffset -= 1
-                            elif not elem.pretext:
-                                elem.posttext -= 1
-                        if elem.pretext: elem.pretext -= 1
-                        if elem.posttext <= ((elem.symbol is not None and -elem.symbol.size[0]) or 0):
-                            elem.reset()
-                            self.currfirstelemi = (self.currfirstelemi + 1) % len(self.elements)
-                            self.shownelems -= 1
+                        if advance:
+                            if elem.letters_passed == len(elem.layout):
+                                if elem.curr_textxoffset:
+                                    elem.curr_textxoffset -= 1
+                                elif not elem.pretext:
+                                    elem.posttext -= 1
+                            if elem.pretext: elem.pretext -= 1
+                            if elem.posttext <= ((elem.symbol is not None and -elem.symbol.size[0]) or 0):
+                                elem.reset()
+                                self.currfirstelemi = (self.currfirstelemi + 1) % len(self.elements)
+                                self.shownelems -= 1
                     else:
                         currx += elem.initial_posttext
                     elemi = (elemi + 1) % len(self.elements)
                 else: break
             else: break
-        if self.startpos > self.lx: self.startpos -= 1
+        if advance and self.startpos > self.lx: self.startpos -= 1
 
 
 class SimpleScrollline:
-    def __init__(self, lx, rx, symoffset, font, textcolor, symtextspacing=1, forcescroll=False, noscroll=False):
+    def __init__(self, lx, rx, symoffset, font, textcolor, symtextspacing=1, forcescroll=False, noscroll=False, strips: Optional[TextStrips] = None):
         self.lx = lx
         self.rx = rx
         self.symoffset = symoffset
@@ -151,10 +212,12 @@ class SimpleScrollline:
         self.symtextspacing = symtextspacing
         self.forcescroll = forcescroll
         self.noscroll = noscroll
+        self.strips = strips
 
         self.currx = rx
         self.letters_passed = 0
         self.symbol = None
+        self.layout = TextLayout(font, "")
         self.text = ""
         self.textlen = 0
         self.base_start = lx
@@ -163,57 +226,64 @@ class SimpleScrollline:
         self.willscroll = forcescroll
 
     def update(self, symbol: Optional[Image.Image], text: str) -> None:
-        if symbol == self.symbol and text == self.text:
+        if symbol == self.symbol and text == self.layout.source:
             return
         self.symbol = symbol
-        self.text = ''.join(_char for _char in text if characterwidth(self.font, ord(_char)))
+        self.layout = TextLayout(self.font, text)
+        self.text = self.layout.text
         self.textlen = len(self.text)
         self.base_start = self.lx + (self.symbol is not None and self.symbol.size[0])
         self.base_start_static = self.base_start + (self.symbol is not None and self.symtextspacing)
-        self.text_max_theoretical = propscroll(self.font, self.text, self.base_start_static, self.rx)
+        self.text_max_theoretical = self.layout.span(self.base_start_static, self.rx)
         self.willscroll = (not self.noscroll) and (self.forcescroll or self.textlen > self.text_max_theoretical)
+        if self.willscroll and self.strips is not None:
+            self.strips.get(self.font, self.layout, self.textcolor)
+
+    def _wrap(self) -> None:
+        # nach dem letzten Zeichen wieder von rechts
+        if self.letters_passed >= self.textlen:
+            self.letters_passed = 0
+            self.currx = self.rx
 
-    def render(self, canvas: FrameCanvas, texty: int) -> None:
+    def render(self, canvas: FrameCanvas, texty: int, gfx=None, steps: int = 1) -> None:
+        # gfx: für nicht scrollende Zeilen auch dm_bdf möglich (statischer Layer)
+        # steps: vor dem Zeichnen so viele Pixel weiterscrollen
+        if gfx is None:
+            gfx = dm_backend.graphics
         if self.symbol: drawppm_bottomleft(canvas, self.symbol, self.lx, texty+self.symoffset, transp=True)
         if not self.text: return
         if self.willscroll:
-            if self.letters_passed >= self.textlen:
-                self.letters_passed = 0
-                self.currx = self.rx
-            text_max = propscroll(self.font, self.text[self.letters_passed:], self.currx, self.rx)
-            scrolllen = graphics.DrawText(canvas, self.font, self.currx, texty, self.textcolor, self.text[self.letters_passed:self.letters_passed+text_max])
-            self.currx -= 1
-            if self.currx < self.base_start:
-                self.currx = self.base_start + characterwidth(self.font, ord(self.text[self.letters_passed])) - 1
-                self.letters_passed += 1
-        else: graphics.DrawText(canvas, self.font, self.base_start_static, texty, self.textcolor, self.text[:self.text_max_theoretical])
+            for _ in range(steps):
+                self._wrap()
+                self.currx -= 1
+                if self.currx < self.base_start:
+                    self.currx = self.base_start + self.layout.charwidth(self.letters_passed) - 1
+                    self.letters_passed += 1
+            self._wrap()
+            text_max = self.layout.span(self.currx, self.rx, self.letters_passed)
+            drawlayout(canvas, self.font, self.currx, texty, self.textcolor, self.layout, self.letters_passed, text_max, self.strips)
+        else: gfx.DrawText(canvas, self.font, self.base_start_static, texty, self.textcolor, self.text[:self.text_max_theoretical])
+
+
+def drawlayout(canvas: Optional[FrameCanvas], font: graphics.Font, x: int, y: int, color: graphics.Color, layout: TextLayout, first: int, count: int, strips: Optional[TextStrips] = None) -> int:
+    # layout.text[first:first+count] zeichnen, aus den vorberechneten Bildern wenn vorhanden
+    # (schwarzer Text würde dort als transparent gelten), ohne canvas nur die Breite
+    if canvas is None:
+        return layout.offsets[first+count] - layout.offsets[first]
+    if strips is not None and (color.red or color.green or color.blue):
+        return strips.draw(canvas, font, x, y, color, layout, first, count)
+    return dm_backend.graphics.DrawText(canvas, font, x, y, color, layout.text[first:first+count])
 
 
 # beides ohne extra_spacing
-@lru_cache(maxsize=4096)
-def propscroll(font: graphics.Font, text: str, start: int, end: int) -> int:
-    c = 0
-    cpx = 0
-    pixel = end - start + 1 + 1  # + 1 wegen space am ende jedes zeichens, was am ende egal ist
-    while c < len(text):
-        _cpx = cpx + characterwidth(font, ord(text[c]))
-        if _cpx > pixel:
-            break
-        c += 1
-        cpx = _cpx
-    return c
-
-
-@lru_cache(maxsize=64)
+def propscroll(font: graphics.Font, text: str, start: int, end: int, first: int = 0) -> int:
+    # Anzahl Zeichen von text[first:], die von start bis end passen
+    return fontmetrics(font).fit(text, end - start + 1 + 1, first)  # + 1 wegen space am ende jedes zeichens, was am ende egal ist
+
+
 def textpx(font: graphics.Font, text: str) -> int:
-    return sum(characterwidth(font, ord(c)) for c in text) - 1
+    return fontmetrics(font).textwidth(text) - 1
 
 
-@lru_cache(maxsize=None)
 def characterwidth(font: graphics.Font, cp: int) -> int:
-    _cw = font.CharacterWidth(cp)
-    if _cw == -1:
-        _cw = font.CharacterWidth(65533)
-        if _cw == -1:
-            _cw = 0
-    return _cw
+    return fontmetrics(font).width(cp)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from json import dumps
+from time import perf_counter, time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# Histogramm-Buckets: obere Grenzen in Sekunden, 2^k µs (1 µs .. ~8 s)
+BUCKETS = tuple((1 << k) / 1e6 for k in range(24))
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "n", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.n = 0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        b = 0
+        while b < len(BUCKETS) and value > BUCKETS[b]:
+            b += 1
+        self.counts[b] += 1
+        self.total += value
+        self.n += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        # obere Bucketgrenze, also eher etwas zu hoch
+        if not self.n:
+            return 0.0
+        limit = p / 100 * self.n
+        c = 0
+        for b, count in enumerate(self.counts):
+            c += count
+            if c >= limit:
+                return min(BUCKETS[b], self.max) if b < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {"n": self.n,
+                "mean_ms": round(self.total / self.n * 1000, 3) if self.n else 0.0,
+                "p50_ms": round(self.percentile(50) * 1000, 3),
+                "p95_ms": round(self.percentile(95) * 1000, 3),
+                "p99_ms": round(self.percentile(99) * 1000, 3),
+                "max_ms": round(self.max * 1000, 3)}
+
+
+class PhaseProfiler:
+    # Zeit je Phase eines Durchlaufs in loop(), gesammelt in Histogrammen über jeweils log_interval Sekunden.
+    # Danach eine kompakte Zusammenfassung per logger oder als JSON-Zeile in statsfile, dann neues Fenster.
+    enabled = True
+
+    def __init__(self, log_interval: float = 60.0, statsfile: str = ""):
+        self.log_interval = log_interval
+        self.statsfile = statsfile
+        self.phases: Dict[str, Histogram] = {}
+        self.order: List[str] = []
+        self.frametime = Histogram()
+        self.jitter = Histogram()
+        self.t = perf_counter()
+        self.framestart = self.t
+        self.lastframestart: Optional[float] = None
+        self.lastslots = 1
+        self.windowstart = self.t
+
+    def start(self) -> None:
+        # Beginn eines Durchlaufs
+        self.t = self.framestart = perf_counter()
+
+    def mark(self, phase: str) -> None:
+        # Ende einer Phase (seit start bzw. letztem mark)
+        now = perf_counter()
+        h = self.phases.get(phase)
+        if h is None:
+            h = self.phases[phase] = Histogram()
+            self.order.append(phase)
+        h.add(now - self.t)
+        self.t = now
+
+    def end(self, target_interval: float, slots: int = 1) -> None:
+        # nach dem Warten auf den nächsten Durchlauf: Renderzeit und Abweichung vom Soll-Abstand
+        now = perf_counter()
+        self.frametime.add(self.t - self.framestart)
+        if self.lastframestart is not None and target_interval > 0:
+            self.jitter.add(abs((self.framestart - self.lastframestart) - target_interval * self.lastslots))
+        self.lastframestart = self.framestart
+        self.lastslots = slots
+        if now - self.windowstart >= self.log_interval:
+            self.flush(now)
+
+    def flush(self, now: float) -> None:
+        if self.statsfile:
+            stats = {"time": round(time(), 3),
+                     "window_s": round(now - self.windowstart, 3),
+                     "frame": self.frametime.summary(),
+                     "jitter": self.jitter.summary(),
+                     "phases": {phase: self.phases[phase].summary() for phase in self.order}}
+            with open(self.statsfile, "a") as f:
+                f.write(dumps(stats) + "\n")
+        else:
+            _f = self.frametime.summary()
+            _j = self.jitter.summary()
+            logger.info(f"frames: {_f['n']} in {now - self.windowstart:.0f}s, render p50/p95/max {_f['p50_ms']}/{_f['p95_ms']}/{_f['max_ms']} ms"
+                        + f", jitter p50/p95/max {_j['p50_ms']}/{_j['p95_ms']}/{_j['max_ms']} ms\n"
+                        + " ".join(f"{phase} {h.percentile(50)*1000:.3g}/{h.percentile(95)*1000:.3g}/{h.max*1000:.3g}"
+                                   for phase, h in ((phase, self.phases[phase]) for phase in self.order)))
+        self.phases = {}
+        self.order = []
+        self.frametime = Histogram()
+        self.jitter = Histogram()
+        self.windowstart = now
+
+
+class NullProfiler:
+    # wenn nicht aktiviert: nur leere Aufrufe
+    enabled = False
+
+    def start(self) -> None:
+        pass
+
+    def mark(self, phase: str) -> None:
+        pass
+
+    def end(self, target_interval: float, slots: int = 1) -> None:
+        pass
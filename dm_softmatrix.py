@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Software-Matrix mit NumPy-Framebuffer, gleiche Schnittstelle wie rgbmatrix (soweit hier genutzt).
+# Zum Profilen/Benchmarken ohne Raspberry Pi/GPIO, Auswahl über dm_backend.
+from types import SimpleNamespace
+from typing import Optional
+
+import numpy as np
+
+import dm_bdf
+
+
+class Color:
+    def __init__(self, red: int = 0, green: int = 0, blue: int = 0):
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+
+graphics = SimpleNamespace(Color=Color,
+                           Font=dm_bdf.Font,
+                           DrawText=dm_bdf.DrawText,
+                           VerticalDrawText=dm_bdf.VerticalDrawText,
+                           DrawLine=dm_bdf.DrawLine)
+
+
+class FrameCanvas:
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray(width * height * 3)
+        self.pixels = np.frombuffer(self.buffer, dtype=np.uint8).reshape((height, width, 3))
+
+    def SetPixel(self, x, y, r, g, b) -> None:
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 3
+            self.buffer[i:i+3] = bytes((int(r), int(g), int(b)))
+
+    def SetImage(self, image, offset_x: int = 0, offset_y: int = 0, unsafe: bool = True, transp: bool = False) -> None:
+        img = np.asarray(image)
+        img_h, img_w = img.shape[:2]
+        x0, y0 = max(0, offset_x), max(0, offset_y)
+        x1, y1 = min(self.width, offset_x + img_w), min(self.height, offset_y + img_h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        src = img[y0-offset_y:y1-offset_y, x0-offset_x:x1-offset_x, :3]
+        if transp:
+            mask = src.any(axis=2)
+            self.pixels[y0:y1, x0:x1][mask] = src[mask]
+        else:
+            self.pixels[y0:y1, x0:x1] = src
+
+    def Fill(self, r, g, b) -> None:
+        self.pixels[:] = (r, g, b)
+
+    def Clear(self) -> None:
+        self.pixels.fill(0)
+
+    def ppm(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(f"P6 {self.width} {self.height} 255\n".encode())
+            f.write(self.buffer)
+
+
+class RGBMatrixOptions:
+    def __init__(self):
+        self.hardware_mapping = "regular"
+        self.rows = 32
+        self.cols = 32
+        self.chain_length = 1
+        self.parallel = 1
+        self.row_address_type = 0
+        self.multiplexing = 0
+        self.pwm_bits = 11
+        self.brightness = 100
+        self.pwm_lsb_nanoseconds = 130
+        self.led_rgb_sequence = "RGB"
+        self.pixel_mapper_config = ""
+        self.show_refresh_rate = 0
+        self.gpio_slowdown = 1
+        self.disable_hardware_pulsing = False
+        self.daemon = 0
+        self.drop_privileges = 1
+        self.pixelsvector = False
+
+
+class RGBMatrix:
+    def __init__(self, options: Optional[RGBMatrixOptions] = None):
+        options = options or RGBMatrixOptions()
+        self.width = options.cols * options.chain_length
+        self.height = options.rows * options.parallel
+        self.brightness = options.brightness
+        # zuletzt "angezeigte" Canvas
+        self.frontcanvas = FrameCanvas(self.width, self.height)
+        self.swaps = 0
+
+    def CreateFrameCanvas(self, *args) -> FrameCanvas:
+        return FrameCanvas(self.width, self.height)
+
+    def SwapOnVSync(self, canvas: FrameCanvas, framerate_fraction: int = 1) -> FrameCanvas:
+        previous = self.frontcanvas
+        self.frontcanvas = canvas
+        self.swaps += 1
+        return previous
+
+    def Clear(self) -> None:
+        self.frontcanvas.Clear()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import Future, wait as futures_wait
+from math import ceil, floor
+from time import monotonic, sleep, time
+from typing import Optional
+
+from loguru import logger
+
+
+class FrameScheduler:
+    # Durchläufe anhand von monotonic()-Deadlines takten, Renderzeit wird also abgezogen.
+    # policy "skip": verpasste Slots werden übersprungen (und gezählt), Raster bleibt erhalten
+    # policy "catchup": verpasste Slots werden ohne Pause nachgeholt, höchstens max_catchup, danach neu ansetzen
+    # Durchläufe ohne Änderung (nichts gezeichnet) werden über unchanged() mitgezählt
+    # idle() statt wait(): mehrere Slots am Stück schlafen, wenn sich vorher sicher nichts ändert
+    policies = ("skip", "catchup")
+
+    def __init__(self, interval: float, policy: str = "skip", max_catchup: int = 5, log_interval: float = 60.0):
+        if policy not in self.policies:
+            raise ValueError(f"unknown frame policy {policy}")
+        self.interval = interval
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.log_interval = log_interval
+
+        self.deadline = monotonic() + interval
+        self.frames = 0
+        self.dropped = 0
+        self.dropped_total = 0
+        self.skipped = 0
+        self.skipped_total = 0
+        self.idled = 0
+        self.lastlog = monotonic()
+
+    def wait(self) -> int:
+        # nach jedem Durchlauf aufrufen, gibt zurück, wie viele Slots seit dem letzten Aufruf vergangen sind
+        self.frames += 1
+        now = monotonic()
+        if now - self.lastlog >= self.log_interval:
+            self._log(now)
+        if self.interval <= 0:
+            return 1
+        if now < self.deadline:
+            sleep(self.deadline - now)
+            self.deadline += self.interval
+            return 1
+        # zu spät, missed: zusätzlich komplett verpasste Slots
+        missed = int((now - self.deadline) // self.interval)
+        if self.policy == "catchup" and missed < self.max_catchup:
+            # direkt weiter, nächste Deadline bleibt im Raster
+            self.deadline += self.interval
+            return 1
+        # direkt weiter, aber im Raster neu ansetzen
+        self._drop(missed)
+        self.deadline += (missed + 1) * self.interval
+        return missed + 1
+
+    def idle(self, slots: int, walltime: Optional[float] = None, future: Optional[Future] = None) -> int:
+        # wie wait(), aber bis zu slots Slots, höchstens bis zum ersten Slot ab walltime (time()),
+        # oder bis future fertig ist (dann ohne auf den nächsten Slot zu warten).
+        # gibt ebenso die Anzahl vergangener Slots zurück
+        if self.interval <= 0 or slots <= 1:
+            return self.wait()
+        self.frames += 1
+        now = monotonic()
+        if now - self.lastlog >= self.log_interval:
+            self._log(now)
+        target = self.deadline + (slots - 1) * self.interval
+        if walltime is not None:
+            _wt = now + (walltime - time())
+            if _wt < target:
+                target = self.deadline + max(0, ceil((_wt - self.deadline) / self.interval)) * self.interval
+        if target > now:
+            if future is not None:
+                futures_wait((future,), timeout=target - now)
+            else:
+                sleep(target - now)
+            now = monotonic()
+        if future is None or not future.done():
+            # pünktlich zum Slot weiter
+            if now < self.deadline:
+                sleep(self.deadline - now)
+                now = self.deadline
+        passed = max(1, int((now - self.deadline) // self.interval) + 1)
+        self.deadline += passed * self.interval
+        self.idled += passed - 1
+        return passed
+
+    def _drop(self, n: int) -> None:
+        self.dropped += n
+        self.dropped_total += n
+
+    def unchanged(self) -> None:
+        self.skipped += 1
+        self.skipped_total += 1
+
+    def _log(self, now: float) -> None:
+        if self.dropped:
+            logger.info(f"dropped {self.dropped} frames in the last {now - self.lastlog:.0f}s ({self.frames - self.skipped} rendered, {self.dropped_total} dropped since start)")
+        if self.skipped or self.idled:
+            logger.info(f"skipped {self.skipped} unchanged frames and slept through {self.idled} idle slots in the last {now - self.lastlog:.0f}s ({self.frames} wake-ups, {self.frames - self.skipped} rendered, {self.skipped_total} skipped since start)")
+        self.dropped = 0
+        self.skipped = 0
+        self.idled = 0
+        self.frames = 0
+        self.lastlog = now
+
+
+class AnimationClock:
+    # Animationen (Scrollen, Blinken, ...) nach der Zeit statt nach der Anzahl gezeichneter Bilder,
+    # damit sie bei jeder Bildrate gleich schnell sind. Zeit ist slot * interval, slot wie i in loop()
+    # (vom FrameScheduler im monotonic-Raster gezählt). Bei interval <= 0 (ohne Pause, z. B. Benchmark)
+    # zählt jeder Slot als nominal Sekunden, so bleibt es reproduzierbar.
+    eps = 1e-6
+
+    def __init__(self, interval: float, nominal: float = 0.03):
+        self.slotlen = interval if interval > 0 else nominal
+        self.nominal = nominal
+
+    def seconds(self, slot: int) -> float:
+        return slot * self.slotlen
+
+    def count(self, rate: float, slot: int) -> int:
+        # wie oft etwas mit rate pro Sekunde bis slot passiert ist, z. B. gescrollte Pixel
+        return floor(slot * self.slotlen * rate + self.eps)
+
+    def frame(self, slot: int) -> int:
+        # Bildnummer für Animationen, die in Bildern zu nominal Sekunden gedacht sind (christmas)
+        return self.count(1 / self.nominal, slot)
+
+    def blink(self, period: float, slot: int) -> bool:
+        # erste Hälfte der Periode an
+        return not self.count(2 / period, slot) % 2
+
+    def slotsuntil(self, rate: float, slot: int, steps: int = 1) -> int:
+        # Slots, bis count(rate, ...) um steps weiter ist (steps=1: bis zur nächsten Änderung)
+        n = self.count(rate, slot) + steps
+        return max(1, ceil((n - self.eps) / (rate * self.slotlen)) - slot)
+
+    def slots(self, seconds: float) -> int:
+        return max(1, round(seconds / self.slotlen))
@@ -1,696 +1,1014 @@
 #!/usr/bin/env python3.7
 # -*- coding: utf-8 -*-
-from argparse import ArgumentParser
+from __future__ import annotations
+from argparse import ArgumentParser, Namespace
 from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 # from subprocess import check_output
 from sys import stderr
-from time import localtime, sleep  # , monotonic
-from typing import List, Tuple, Dict, Callable, Any, Iterable
+from math import floor
+from time import localtime, sleep, time
+from typing import TYPE_CHECKING, List, Tuple, Dict, Callable, Any, Iterable, Optional
 
 from loguru import logger
 from PIL import Image
-from rgbmatrix import RGBMatrix, RGBMatrixOptions, graphics
+import dm_backend
+if TYPE_CHECKING:
+    from dm_backend import graphics
 
-from dm_drawstuff import clockstr_tt, colorppm, drawppm_centered, drawppm_bottomleft, drawppm_bottomright, drawverticaltime, makechristmasfn
-from dm_areas import rightbar_wide, rightbar_tmp, rightbar_verticalclock, startscreen
+import dm_bdf
+from dm_drawstuff import ChristmasFrames, ImageLayer, TextStrips, TintCache, clockstr_tt, colorppm, drawppm_centered, drawppm_bottomleft, drawppm_bottomright, drawverticaltime, makechristmasfn
+from dm_areas import rightbar_wide, rightbar_tmp, rightbar_verticalclock, rightbar_wide_state, rightbar_wide_slots, rightbar_tmp_state, rightbar_verticalclock_state, startscreen
 from dm_lines import MultisymbolScrollline, SimpleScrollline, propscroll, textpx
-from dm_depdata import Departure, Meldung, MOT, linenumpattern, GetdepsEndAll, type_depfnlist, type_depfns, getdeps, getefadeps, getdbrestdeps, getd3d9msgdata
+from dm_timing import AnimationClock, FrameScheduler
+from dm_profile import NullProfiler, PhaseProfiler
+from dm_framesink import FrameSink, PPMSnapshot, framebytes, hasbuffer
+from dm_assets import DEFAULT_BUNDLE, Assets
+from dm_depdata import Departure, DepsUnchanged, Meldung, MOT, linenumpattern, GetdepsEndAll, type_depfnlist, type_depfns, getdeps, getefadeps, getdbrestdeps, getd3d9msgdata
+from dm_lastgood import LastGood
 
 
 ### Logging
 
 datafilelog = False
-logger.remove(0)
-logger.add(sink=stderr, level="TRACE", backtrace=False, enqueue=True)
-logger.add(sink="./log/log.txt", level="DEBUG", backtrace=False, enqueue=True)
-if datafilelog:
-    logger.add(sink="./log/data.txt", level="TRACE", backtrace=False, enqueue=True, compression="gz", rotation="50 MB", filter=lambda r: r["level"] == "TRACE")
+
+
+def setuplogging() -> None:
+    logger.remove(0)
+    logger.add(sink=stderr, level="TRACE", backtrace=False, enqueue=True)
+    logger.add(sink="./log/log.txt", level="DEBUG", backtrace=False, enqueue=True)
+    if datafilelog:
+        logger.add(sink="./log/data.txt", level="TRACE", backtrace=False, enqueue=True, compression="gz", rotation="50 MB", filter=lambda r: r["level"] == "TRACE")
+
 
 ### Arguments
 
-parser = ArgumentParser()
-parser.add_argument("-s", "--stop-ifopt", action="store", help="IFOPT reference of stop or area or platform. Default: de:05914:2114:0:1", default="de:05914:2114:0:1", type=str)
-parser.add_argument("--ibnr", action="store", help="IBNR. With this set, there will be train data only from DB and others only from EFA. (temporary parameter)", default="", type=str)
-parser.add_argument("--test-d3d9", action="store", help="Try to get data from d3d9.xyz like messages, brightness (test)", default="", type=str)
-parser.add_argument("-e", "--enable-efamessages", action="store_true", help="Enable line messages. (still overwritten by -m option)")
-parser.add_argument("-m", "--message", action="store", help="Message to scroll at the bottom. Default: none", default="", type=str)
-parser.add_argument("-r", "--rightbar", action="store", help="Enable sidebar on the right side with additional info. Disables header clock. Value: type of rightbar (1: vertical clock (default if just -r); 2: clock with icon, wide; 3: clock with progress, VRR icon, allows scrolling through it", nargs="?", const=1, default=0, type=int)
-parser.add_argument("-t", "--enable-top", action="store_true", help="Enable header with stop name and current time")
-parser.add_argument("-p", "--proportional", action="store_true", help="Use proportional font")
-parser.add_argument("-n", "--show-zero", action="store_false", help="Show a zero instead of a bus when countdown is 0")
-parser.add_argument("-d", "--daemon", action="store_true", help="Run as daemon")
-parser.add_argument("-l", "--line-height", action="store", help="Departure line height. Default: 8", default=8, type=int)
-parser.add_argument("-f", "--firstrow-y", action="store", help="(text_startr) Where to start with the rows vertically (bottom pixel). Default: 6", default=6, type=int)
-parser.add_argument("-w", "--linenum-width", action="store", help="pixels for line number. Default: 20", default=20, type=int)
-parser.add_argument("--place-string", action="append", help="Strings that are usually at the beginning of stop names, to be filtered out (for example (default:) \"Hagen \", \"HA-\")", default=[], type=str, dest="place_strings")
-parser.add_argument("--ignore-infotype", action="append", help="EFA: ignore this 'infoType' (can be used multiple times)", default=[], type=str)
-parser.add_argument("--ignore-infoid", action="append", help="EFA: ignore this 'infoID' (can be used multiple times)", default=[], type=str)
-parser.add_argument("--no-rt-msg", action="store", help="Show warning if no realtime departures are returned, value of this parameter is the maximum countdown up to which one would usually expect a RT departure. Default: 20", default=20, type=int)
-parser.add_argument("--show-start", action="store_true", help="Show startscreen with IFOPT and IP")
-parser.add_argument("--disable-mintext", action="store_false", help="Don't show \"min\" after the countdown & a larger bus")
-parser.add_argument("--min-delay", action="store", help="Minimum minutes of delay for the time to be shown in red color. 1-99. Default: 4", default=4, choices=range(1, 100), type=int)
-parser.add_argument("--min-slightdelay", action="store", help="Minimum minutes of delay for the time to be shown in yellow color (set to same as --min-delay to ignore). 1-99. Default: 2", default=2, choices=range(1, 100), type=int)
-parser.add_argument("--max-minutes", action="store", help="Maximum countdown minutes to show time in minutes instead of absolute time. -1-99. Default: 59", default=59, choices=range(-1, 100), type=int)
-parser.add_argument("--disable-blink", action="store_false", help="Disable blinking of bus/zero when countdown is 0")
-parser.add_argument("--stop-name", action="store", help="Override header (-t) stop name returned by the API. Default: none", default="", type=str)
-parser.add_argument("--christmas", action="store_true", help="green/red lights at top and bottom (height 2), test")
-parser.add_argument("--show-progress", action="store_true", help="Show progress bar at the bottom")
-parser.add_argument("--disable-topscroll", action="store_false", help="Disable scrolling of stop name in the header (-t)")
-parser.add_argument("--small", action="store_true", help="enable --small-text, --small-countdown, --small-linenum.")
-# small_text doch aufteilen? small_auto hinzufuegen?
-parser.add_argument("--small-text", action="store_true", help="Show destination, stop name, message with smaller letters")
-parser.add_argument("--small-countdown", action="store_true", help="Show countdown with smaller numbers")
-parser.add_argument("--small-linenum", action="store_true", help="Show line number with smaller characters")
-parser.add_argument("--update-steps", action="store", help="Loop steps until reload of data. Default: 600", default=600, type=int)
-parser.add_argument("--sleep-interval", action="store", help="Sleep interval (inside the main loop). Default: 0.03", default=0.03, type=float)
-parser.add_argument("--limit-multiplier", action="store", help="How many extra departures (value * actual limit) to load (useful for stops with a lot of departures where a few delays might \"hide\" earlier departures. Default: 3", default=3, type=int)
-# matrix settings
-parser.add_argument("-c", "--led-chain", action="store", help="Daisy-chained boards. Default: 2.", default=2, type=int)
-parser.add_argument("-b", "--led-brightness", action="store", help="Sets brightness level. Default: 30. Range: 1..100", default=30, type=int)
-parser.add_argument("--write-ppm", action="store", help="Write binary ppm to given file name every loop", default="", type=str)
-parser.add_argument("--led-rows", action="store", help="Display rows. 16 for 16x32, 32 for 32x32. Default: 32", default=32, type=int)
-parser.add_argument("--led-cols", action="store", help="Panel columns. Typically 32 or 64. (Default: 64)", default=64, type=int)
-parser.add_argument("--led-parallel", action="store", help="For Plus-models or RPi2: parallel chains. 1..3. Default: 1", default=1, type=int)
-parser.add_argument("--led-pwm-bits", action="store", help="Bits used for PWM. Something between 1..11. Default: 11", default=11, type=int)
-parser.add_argument("--led-gpio-mapping", help="Hardware Mapping: regular, adafruit-hat, adafruit-hat-pwm", choices=['regular', 'adafruit-hat', 'adafruit-hat-pwm'], type=str)
-parser.add_argument("--led-scan-mode", action="store", help="Progressive or interlaced scan. 0 Progressive, 1 Interlaced (default)", default=1, choices=range(2), type=int)
-parser.add_argument("--led-pwm-lsb-nanoseconds", action="store", help="Base time-unit for the on-time in the lowest significant bit in nanoseconds. Default: 130", default=130, type=int)
-parser.add_argument("--led-show-refresh", action="store_true", help="Shows the current refresh rate of the LED panel")
-parser.add_argument("--led-slowdown-gpio", action="store", help="Slow down writing to GPIO. Range: 1..100. Default: 1", choices=range(3), type=int)
-parser.add_argument("--led-no-hardware-pulse", action="store", help="Don't use hardware pin-pulse generation")
-parser.add_argument("--led-rgb-sequence", action="store", help="Switch if your matrix has led colors swapped. Default: RGB", default="RGB", type=str)
-parser.add_argument("--led-pixel-mapper", action="store", help="Apply pixel mappers. e.g \"Rotate:90\"", default="", type=str)
-parser.add_argument("--led-row-addr-type", action="store", help="0 = default; 1=AB-addressed panels;2=row direct", default=0, type=int, choices=[0, 1, 2])
-parser.add_argument("--led-multiplexing", action="store", help="Multiplexing type: 0=direct; 1=strip; 2=checker; 3=spiral; 4=ZStripe; 5=ZnMirrorZStripe; 6=coreman; 7=Kaler2Scan; 8=ZStripeUneven (Default: 0)", default=0, type=int)
-
-args = parser.parse_args()
-
-options = RGBMatrixOptions()
-if args.led_gpio_mapping is not None:
-    options.hardware_mapping = args.led_gpio_mapping
-options.rows = args.led_rows
-options.cols = args.led_cols
-options.chain_length = args.led_chain
-options.parallel = args.led_parallel
-options.row_address_type = args.led_row_addr_type
-options.multiplexing = args.led_multiplexing
-options.pwm_bits = args.led_pwm_bits
-options.brightness = args.led_brightness
-options.pwm_lsb_nanoseconds = args.led_pwm_lsb_nanoseconds
-options.led_rgb_sequence = args.led_rgb_sequence
-options.pixel_mapper_config = args.led_pixel_mapper
-if args.led_show_refresh:
-    options.show_refresh_rate = 1
-if args.led_slowdown_gpio is not None:
-    options.gpio_slowdown = args.led_slowdown_gpio
-if args.led_no_hardware_pulse:
-    options.disable_hardware_pulsing = True
-options.daemon = args.daemon
-options.drop_privileges = 0
-
-writeppm = bool(args.write_ppm)
-ppmfile = args.write_ppm
-options.pixelsvector = writeppm
-
-gpiotest = False
-gpiotest_minb = 10
-gpiotest_maxb = 65
-
-if gpiotest:
-    available_inputs = matrix.GPIORequestInputs(0xffffffff)
-
-### Fonts
-
-fontdir = "./bdf/"
-fontmin = graphics.Font()
-fontmin.LoadFont(fontdir+"tom-thumb.bdf")
-fontnum = graphics.Font()
-fontnum.LoadFont(fontdir+"4x6.bdf")
-fontlargernum = graphics.Font()
-fontlargernum.LoadFont(fontdir+"5x7-mod.bdf")
-propfont = graphics.Font()
-propfont.LoadFont(fontdir+"uwe_prop_mod.bdf")
-proptest = args.proportional
-
-if args.small or args.small_text:
-    fonttext = fontnum
-else:
-    if proptest:
-        fonttext = propfont
-    else:
-        fonttext = fontlargernum
-
-if args.small or args.small_countdown:
-    fontcountdown = fontnum
-else:
-    if proptest:
-        fontcountdown = propfont
-    else:
-        fontcountdown = fontlargernum
-
-if args.small or args.small_linenum:
-    fontlinenum = fontnum
-else:
-    if proptest:
-        fontlinenum = propfont
-    else:
-        fontlinenum = fontlargernum
-
-### Colors
-
-# matrixbgColor_t = (0, 16, 19)
-matrixbgColor_t = None
-textColor = graphics.Color(255, 65, 0)
-texthighlightColor = graphics.Color(255, 30, 0)
-rtnoColor = graphics.Color(190, 190, 190)
-rtColor = graphics.Color(0, 255, 0)
-rtslightColor = graphics.Color(255, 255, 0)
-rtlateColor = graphics.Color(255, 0, 0)
-rtnegativeColor = graphics.Color(0, 255, 255)
-lighttextColor = graphics.Color(100, 100, 100)
-barColor = graphics.Color(8, 8, 8)
-if options.brightness < 15:
-    linebgColor = graphics.Color(0, 12, 12)
-    barColor = graphics.Color(12, 12, 12)
-else:
-    linebgColor = graphics.Color(0, 8, 9)
-linefgColor = textColor
-
-### linenum
-
-linenum_width = args.linenum_width
-linenumheight = fontlinenum.height - 1
-linenum_normalsmalloffset = 1  # in zukunft einfach nur vertikal zentrieren?
-linenum_drawbg = True
-
-### PPM
-
-ppmdir = "./ppm/"
-ppm_info = Image.open(ppmdir+"icon-info.ppm")
-ppm_warn = Image.open(ppmdir+"icon-warn.ppm")
-ppm_stop = Image.open(ppmdir+"icon-stop.ppm")
-ppm_smile = Image.open(ppmdir+"icon-smile.ppm")
-ppm_ad = Image.open(ppmdir+"icon-ad.ppm")
-ppm_delay = Image.open(ppmdir+"icon-delay.ppm")
-ppm_earlyterm = Image.open(ppmdir+"icon-earlyterm.ppm")
-ppm_no_rt = Image.open(ppmdir+"icon-no-rt.ppm")
-ppm_no_deps = Image.open(ppmdir+"icon-no-deps.ppm")
-
-meldungicons = {"info": ppm_info,
-                "warn": ppm_warn,
-                "stop": ppm_stop,
-                "smile": ppm_smile,
-                "ad": ppm_ad,
-                "delay": ppm_delay,
-                "earlyterm": ppm_earlyterm,
-                "nort": ppm_no_rt,
-                "nodeps": ppm_no_deps,
-                }
-
-symtextoffset = fonttext.height-fonttext.baseline
-
-'''
-# erstmal nicht mehr weiter verfolgt.
-nolinenumicons = False
-
-supportedlnlhs = (6, 7)
-defaultppmlnlh = 6
-ppmlinenumh = linenumheight if linenumheight in supportedlnlhs else defaultppmlnlh
-linenumicons = (not nolinenumicons) and linenumheight in supportedlnlhs
-
-ppm_whiteice = Image.open(f"{ppmdir}icon-ice{ppmlinenumh}.ppm")
-ppm_whiteic = Image.open(f"{ppmdir}icon-ic{ppmlinenumh}.ppm")
-ppm_whitene = Image.open(f"{ppmdir}icon-ne{ppmlinenumh}.ppm")
-ppm_whitenethin = Image.open(f"{ppmdir}icon-ne-thin{ppmlinenumh}.ppm")
-ppm_ice = colorppm(ppm_whiteice, linefgColor)
-ppm_ic = colorppm(ppm_whiteic, linefgColor)
-ppm_ne = colorppm(ppm_whitene, linefgColor)
-ppm_nethin = colorppm(ppm_whitenethin, linefgColor)
-'''
-
-longausfall = True
-ppm_ausfall = Image.open(ppmdir+"red-ausfall"+("-long" if longausfall else "")+".ppm")
-
-ppm_whitesofort = Image.open(ppmdir+"white-sofort.ppm")
-sofort = False
-
-minoffset = 1
-ppm_whitemin = Image.open(ppmdir+"white-min.ppm")
-ppmmincolordict = {}
-for _color in (rtnoColor, rtColor, rtslightColor, rtlateColor, rtnegativeColor):
-    ppmmincolordict[_color] = colorppm(ppm_whitemin, _color)
-
-supportedcdlhs = (6, 7)
-defaultppmcdlh = 6
-ppmcdh = fontcountdown.height - 1
-ppmcdh = ppmcdh if ppmcdh in supportedcdlhs else defaultppmcdlh
-ppm_whitebus = Image.open(f"{ppmdir}white-bus{ppmcdh}.ppm")
-ppm_whitetrain = Image.open(f"{ppmdir}white-train{ppmcdh}.ppm")
-ppm_whitehispeed = Image.open(f"{ppmdir}white-hispeed{ppmcdh}.ppm")
-ppm_whitetram = Image.open(f"{ppmdir}white-tram{ppmcdh}.ppm")
-ppm_whitehanging = Image.open(f"{ppmdir}white-hanging{ppmcdh}.ppm")
-
-if sofort:
-    ppmmotdict = dict.fromkeys((MOT.BUS, MOT.TRAIN, MOT.HISPEED, MOT.TRAM, MOT.HANGING), ppm_whitesofort)
-else:
-    ppmmotdict = {MOT.BUS: ppm_whitebus,
-                  MOT.TRAIN: ppm_whitetrain,
-                  MOT.HISPEED: ppm_whitehispeed,
-                  MOT.TRAM: ppm_whitetram,
-                  MOT.HANGING: ppm_whitehanging,
-                  }
-
-ppmmotcolordict = dict.fromkeys(ppmmotdict.keys())
-
-for mot, ppm in ppmmotdict.items():
-    ppmmotcolordict[mot] = dict()
-    for _color in (rtnoColor, rtColor, rtslightColor, rtlateColor, rtnegativeColor):
-        ppmmotcolordict[mot][_color] = colorppm(ppm, _color)
-
-ppm_vrr = Image.open("./ppm/matrix13x13vrr-engebuchstaben-2.ppm").convert('RGB')
-ppm_db11 = Image.open("./ppm/dbkeks.ppm").convert('RGB')
-ppm_sonne11 = Image.open("./ppm/sonne.ppm").convert('RGB')
-ppm_wolke11 = Image.open("./ppm/wolke.ppm").convert('RGB')
-ppm_wolkesonne11 = Image.open("./ppm/wolke mit sonne.ppm").convert('RGB')
-ppm_wolkeregen11 = Image.open("./ppm/wolke mit regen.ppm").convert('RGB')
-
-### Display configuration
-
-lineheight = args.line_height
-text_startr = args.firstrow_y
-
-placelist = args.place_strings
-if not placelist:
-    placelist = ["Hagen ", "HA-"]
-ifopt = args.stop_ifopt
-step = args.update_steps
-interval = args.sleep_interval
-efamenabled = args.enable_efamessages
-header = args.enable_top
-headername = args.stop_name
-headerscroll = args.disable_topscroll
-mindelay = args.min_delay
-minslightdelay = args.min_slightdelay
-maxmin = args.max_minutes
-mintext = args.disable_mintext
-christmas = args.christmas
-progress = args.show_progress
-blink = args.disable_blink
-zerobus = args.show_zero
-# zur config (und alles andere eigentlich auch):
-stopsymbol = True
-melsymbol = True
-
-rightbar = bool(args.rightbar)
-rightbarcolor = rtnoColor
-scrollmsg_through_rightbar = False
-rightbarargs: Iterable
-
-if args.rightbar == 1:
-    rightbarfn, rightbarwidth, rightbarargs, rightbarfont = rightbar_verticalclock, 6, (True,), fontlargernum
-elif args.rightbar in {2, 3}:
-    currenttime = localtime()
-    rightbarfont = fonttext
-    rightbarwidth = textpx(rightbarfont, clockstr_tt(currenttime))  # muss eigentlich laufend angepasst werden
-    if args.rightbar == 2:
-        rightbarfn = rightbar_wide
-        rightbarargs = ((ppm_vrr, ppm_vrr, ppm_vrr, ppm_sonne11, ppm_wolkesonne11, ppm_wolke11, ppm_wolkeregen11, ppm_db11),)
-    elif args.rightbar == 3:
-        rightbarfn = rightbar_tmp
-        _width = args.led_cols*args.led_chain
-        # r_scroller = SimpleScrollline(_width-rightbarwidth, _width-1, symtextoffset, fonttext, lighttextColor)
-        # r_scroller.update(None, "Fahrplanauskünfte werden durch den Lizenzgeber zur Verfügung gestellt. Alle Angaben ohne Gewähr.")
-        rightbarargs = (ppm_vrr, graphics.Color(50, 50, 50))  # , r_scroller)
-        scrollmsg_through_rightbar = True
-
-# Abstand Ziel - Zeit
-spacedt = 1
-# Abstand Liniennummer - Ziel
-spaceld = 2
-# Abstand Zeit - rechter Bereich
-spacetr = 1
-
-header_spacest = 1
-
-countdownlowerlimit = -9
-
-min_timeout = 10
-servertimeout = max(min_timeout, (interval*step)/2)
-tz = datetime.utcnow().astimezone().tzinfo
-maxkwaretries = 3
-
-efaserver = 'https://openservice.vrr.de/vrr/XML_DM_REQUEST'
-efaserver_backup = 'http://www.efa-bw.de/nvbw/XML_DM_REQUEST'
-
-d3d9id = args.test_d3d9  # tmp
-d3d9server = 'https://d3d9.xyz/dfi'
-
-# z. B. Aufzugsmeldungen
-# ignore_infoTypes = {"stopInfo"}
-ignore_infoTypes = set(args.ignore_infotype) if args.ignore_infotype else None
-
-# z. B. Umleitung Wetter; Ausfall Eckeseyer Br.; Sonderburgstr.:
-# ignore_infoIDs = {"41354_HST", "28748_HST", "45828_HST"}
-ignore_infoIDs = set(args.ignore_infoid) if args.ignore_infoid else None
-
-content_for_short_titles = True
-
-trainTMOTefa = {0, 1, 13, 14, 15, 16, 18}
-trainMOT = {MOT.TRAIN, MOT.HISPEED}
-
-dbrestserver = 'http://d3d9.xyz:3000'
-dbrestserver_backup = 'https://2.db.transport.rest'
-dbrestibnr = args.ibnr
-
-delaymsg_enable = True
-delaymsg_mindelay = 2
-etermmsg_enable = True
-etermmsg_only_visible = True
-nortmsg_limit = args.no_rt_msg
-
-### christmas fn
-
-randspeed = 8
-maxrgb = (130, 150, 35)
-# maxrgb = (150, 150, 0)
-ptspeed = 4
-ptlen = 3
-ptscale = 0.8
-ptrgb = (77, 65, 0)
-# ptrgb = (153, 130, 0)
-drawchristmas = makechristmasfn(maxrgb, randspeed, ptrgb, ptspeed, ptlen, ptscale)
+
+def makeparser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument("-s", "--stop-ifopt", action="store", help="IFOPT reference of stop or area or platform. Default: de:05914:2114:0:1", default="de:05914:2114:0:1", type=str)
+    parser.add_argument("--ibnr", action="store", help="IBNR. With this set, there will be train data only from DB and others only from EFA. (temporary parameter)", default="", type=str)
+    parser.add_argument("--test-d3d9", action="store", help="Try to get data from d3d9.xyz like messages, brightness (test)", default="", type=str)
+    parser.add_argument("-e", "--enable-efamessages", action="store_true", help="Enable line messages. (still overwritten by -m option)")
+    parser.add_argument("-m", "--message", action="store", help="Message to scroll at the bottom. Default: none", default="", type=str)
+    parser.add_argument("-r", "--rightbar", action="store", help="Enable sidebar on the right side with additional info. Disables header clock. Value: type of rightbar (1: vertical clock (default if just -r); 2: clock with icon, wide; 3: clock with progress, VRR icon, allows scrolling through it", nargs="?", const=1, default=0, type=int)
+    parser.add_argument("-t", "--enable-top", action="store_true", help="Enable header with stop name and current time")
+    parser.add_argument("-p", "--proportional", action="store_true", help="Use proportional font")
+    parser.add_argument("-n", "--show-zero", action="store_false", help="Show a zero instead of a bus when countdown is 0")
+    parser.add_argument("-d", "--daemon", action="store_true", help="Run as daemon")
+    parser.add_argument("-l", "--line-height", action="store", help="Departure line height. Default: 8", default=8, type=int)
+    parser.add_argument("-f", "--firstrow-y", action="store", help="(text_startr) Where to start with the rows vertically (bottom pixel). Default: 6", default=6, type=int)
+    parser.add_argument("-w", "--linenum-width", action="store", help="pixels for line number. Default: 20", default=20, type=int)
+    parser.add_argument("--place-string", action="append", help="Strings that are usually at the beginning of stop names, to be filtered out (for example (default:) \"Hagen \", \"HA-\")", default=[], type=str, dest="place_strings")
+    parser.add_argument("--ignore-infotype", action="append", help="EFA: ignore this 'infoType' (can be used multiple times)", default=[], type=str)
+    parser.add_argument("--ignore-infoid", action="append", help="EFA: ignore this 'infoID' (can be used multiple times)", default=[], type=str)
+    parser.add_argument("--no-rt-msg", action="store", help="Show warning if no realtime departures are returned, value of this parameter is the maximum countdown up to which one would usually expect a RT departure. Default: 20", default=20, type=int)
+    parser.add_argument("--show-start", action="store_true", help="Show startscreen with IFOPT and IP")
+    parser.add_argument("--disable-mintext", action="store_false", help="Don't show \"min\" after the countdown & a larger bus")
+    parser.add_argument("--min-delay", action="store", help="Minimum minutes of delay for the time to be shown in red color. 1-99. Default: 4", default=4, choices=range(1, 100), type=int)
+    parser.add_argument("--min-slightdelay", action="store", help="Minimum minutes of delay for the time to be shown in yellow color (set to same as --min-delay to ignore). 1-99. Default: 2", default=2, choices=range(1, 100), type=int)
+    parser.add_argument("--max-minutes", action="store", help="Maximum countdown minutes to show time in minutes instead of absolute time. -1-99. Default: 59", default=59, choices=range(-1, 100), type=int)
+    parser.add_argument("--disable-blink", action="store_false", help="Disable blinking of bus/zero when countdown is 0")
+    parser.add_argument("--stop-name", action="store", help="Override header (-t) stop name returned by the API. Default: none", default="", type=str)
+    parser.add_argument("--christmas", action="store_true", help="green/red lights at top and bottom (height 2), test")
+    parser.add_argument("--christmas-light", action="store_true", help="draw --christmas only with image blits, without the black pixels (less exact, for large displays)")
+    parser.add_argument("--scroll-strips", action="store_true", help="draw scrolling texts from images rendered once per text instead of drawing the glyphs every frame (faster with the software matrix)")
+    parser.add_argument("--show-progress", action="store_true", help="Show progress bar at the bottom")
+    parser.add_argument("--disable-topscroll", action="store_false", help="Disable scrolling of stop name in the header (-t)")
+    parser.add_argument("--small", action="store_true", help="enable --small-text, --small-countdown, --small-linenum.")
+    # small_text doch aufteilen? small_auto hinzufuegen?
+    parser.add_argument("--small-text", action="store_true", help="Show destination, stop name, message with smaller letters")
+    parser.add_argument("--small-countdown", action="store_true", help="Show countdown with smaller numbers")
+    parser.add_argument("--small-linenum", action="store_true", help="Show line number with smaller characters")
+    parser.add_argument("--update-steps", action="store", help="Loop steps until reload of data. Default: 600", default=600, type=int)
+    parser.add_argument("--update-interval", action="store", help="Seconds until reload of data, overrides --update-steps. Default: none", default=0, type=float)
+    parser.add_argument("--sleep-interval", action="store", help="Target frame interval (inside the main loop, render time is subtracted). Default: 0.03", default=0.03, type=float)
+    parser.add_argument("--fps", action="store", help="Target frames per second, overrides --sleep-interval. Default: none", default=0, type=float)
+    parser.add_argument("--hedge-percentile", action="store", help="Also ask the next data server when the current one takes longer than this percentile of its response times (0: off). Default: 0.9", default=0.9, type=float)
+    parser.add_argument("--http-pool-size", action="store", help="Kept-alive connections per data server. Default: 2", default=2, type=int)
+    parser.add_argument("--dns-ttl", action="store", help="Seconds to cache DNS results of data servers. Default: 300", default=300, type=float)
+    parser.add_argument("--scroll-speed", action="store", help="Scrolling speed in pixels per second, independent of the frame rate. Default: 33.3 (1 pixel per 0.03 s)", default=1/0.03, type=float)
+    parser.add_argument("--blink-period", action="store", help="Seconds for one on/off cycle of blinking countdowns. Default: 1.2", default=1.2, type=float)
+    parser.add_argument("--frame-policy", action="store", help="What to do when frames are late. skip: skip missed frames, catchup: render missed frames without pause (up to 5 frames behind). Default: skip", default="skip", choices=FrameScheduler.policies, type=str)
+    parser.add_argument("--profile", action="store", help="Measure the time of each phase of the main loop and log a summary every N seconds. Default: 0 (disabled)", default=0, type=float)
+    parser.add_argument("--profile-file", action="store", help="Append --profile summaries as JSON lines to this file instead of logging them", default="", type=str)
+    parser.add_argument("--redraw-unchanged", action="store_true", help="Draw and swap every frame, even if nothing has changed since the last one (also disables sleeping until the next change)")
+    parser.add_argument("--asset-bundle", action="store", help=f"Load images and fonts from this bundle (built with dm_assets.py), if it exists. Empty to always use the single files. Default: {DEFAULT_BUNDLE}", default=DEFAULT_BUNDLE, type=str)
+    parser.add_argument("--limit-multiplier", action="store", help="How many extra departures (value * actual limit) to load (useful for stops with a lot of departures where a few delays might \"hide\" earlier departures. Default: 3", default=3, type=int)
+    parser.add_argument("--last-good", action="store", help="Keep the last successfully loaded data in this file, show it right after start and when all data sources fail (empty: off). Default: last-good.pickle", default="last-good.pickle", type=str)
+    parser.add_argument("--stale-after", action="store", help="Show a note with the data time when data from --last-good is older than this many seconds. Default: 300", default=300, type=float)
+    parser.add_argument("--efa-horizon", action="store", help="Stop reading an EFA response after 3 departures in a row with a countdown above this many minutes (saves parse time for large stops). Default: off", default=None, type=int)
+    # matrix settings
+    parser.add_argument("-c", "--led-chain", action="store", help="Daisy-chained boards. Default: 2.", default=2, type=int)
+    parser.add_argument("-b", "--led-brightness", action="store", help="Sets brightness level. Default: 30. Range: 1..100", default=30, type=int)
+    parser.add_argument("--write-ppm", action="store", help="Write binary ppm snapshot to given file name (replaced atomically, see --ppm-interval)", default="", type=str)
+    parser.add_argument("--ppm-interval", action="store", help="Seconds between --write-ppm snapshots, 0 for every frame. Default: 1", default=1.0, type=float)
+    parser.add_argument("--frame-sink", action="store", help="Publish every frame into a memory-mapped ring buffer at given file name (preferably on tmpfs, e.g. /dev/shm/dm_frames), see dm_framesink.py. With rgbmatrix only every --frame-sink-interval seconds", default="", type=str)
+    parser.add_argument("--frame-sink-interval", action="store", help="Seconds between --frame-sink frames with rgbmatrix (pixels only via canvas.ppm(), i. e. a file on tmpfs written and read back per frame; the software matrix publishes every frame). Default: 0.25", default=0.25, type=float)
+    parser.add_argument("--led-rows", action="store", help="Display rows. 16 for 16x32, 32 for 32x32. Default: 32", default=32, type=int)
+    parser.add_argument("--led-cols", action="store", help="Panel columns. Typically 32 or 64. (Default: 64)", default=64, type=int)
+    parser.add_argument("--led-parallel", action="store", help="For Plus-models or RPi2: parallel chains. 1..3. Default: 1", default=1, type=int)
+    parser.add_argument("--led-pwm-bits", action="store", help="Bits used for PWM. Something between 1..11. Default: 11", default=11, type=int)
+    parser.add_argument("--led-gpio-mapping", help="Hardware Mapping: regular, adafruit-hat, adafruit-hat-pwm", choices=['regular', 'adafruit-hat', 'adafruit-hat-pwm'], type=str)
+    parser.add_argument("--led-scan-mode", action="store", help="Progressive or interlaced scan. 0 Progressive, 1 Interlaced (default)", default=1, choices=range(2), type=int)
+    parser.add_argument("--led-pwm-lsb-nanoseconds", action="store", help="Base time-unit for the on-time in the lowest significant bit in nanoseconds. Default: 130", default=130, type=int)
+    parser.add_argument("--led-show-refresh", action="store_true", help="Shows the current refresh rate of the LED panel")
+    parser.add_argument("--led-slowdown-gpio", action="store", help="Slow down writing to GPIO. Range: 1..100. Default: 1", choices=range(3), type=int)
+    parser.add_argument("--led-no-hardware-pulse", action="store", help="Don't use hardware pin-pulse generation")
+    parser.add_argument("--led-rgb-sequence", action="store", help="Switch if your matrix has led colors swapped. Default: RGB", default="RGB", type=str)
+    parser.add_argument("--led-pixel-mapper", action="store", help="Apply pixel mappers. e.g \"Rotate:90\"", default="", type=str)
+    parser.add_argument("--led-row-addr-type", action="store", help="0 = default; 1=AB-addressed panels;2=row direct", default=0, type=int, choices=[0, 1, 2])
+    parser.add_argument("--led-multiplexing", action="store", help="Multiplexing type: 0=direct; 1=strip; 2=checker; 3=spiral; 4=ZStripe; 5=ZnMirrorZStripe; 6=coreman; 7=Kaler2Scan; 8=ZStripeUneven (Default: 0)", default=0, type=int)
+
+    return parser
+
+
+### Configuration
+
+
+class Context:
+    # Einstellungen aus den Kommandozeilenparametern und alles, was dafür geladen wird (Matrix-Optionen, Schriften,
+    # Bilder, Farben, Caches, ...). Erst makecontext() baut das, import dm_tomatrixled lädt also weder Backend noch Dateien.
+    def __init__(self, args: Namespace):
+        from dm_backend import RGBMatrixOptions, graphics
+        self.args = args
+
+        options = self.options = RGBMatrixOptions()
+        if args.led_gpio_mapping is not None:
+            options.hardware_mapping = args.led_gpio_mapping
+        options.rows = args.led_rows
+        options.cols = args.led_cols
+        options.chain_length = args.led_chain
+        options.parallel = args.led_parallel
+        options.row_address_type = args.led_row_addr_type
+        options.multiplexing = args.led_multiplexing
+        options.pwm_bits = args.led_pwm_bits
+        options.brightness = args.led_brightness
+        options.pwm_lsb_nanoseconds = args.led_pwm_lsb_nanoseconds
+        options.led_rgb_sequence = args.led_rgb_sequence
+        options.pixel_mapper_config = args.led_pixel_mapper
+        if args.led_show_refresh:
+            options.show_refresh_rate = 1
+        if args.led_slowdown_gpio is not None:
+            options.gpio_slowdown = args.led_slowdown_gpio
+        if args.led_no_hardware_pulse:
+            options.disable_hardware_pulsing = True
+        options.daemon = args.daemon
+        options.drop_privileges = 0
+
+        self.writeppm = bool(args.write_ppm)
+        self.ppmfile = args.write_ppm
+        self.ppminterval = args.ppm_interval
+        self.framesinkfile = args.frame_sink
+        self.framesinkinterval = args.frame_sink_interval
+        # rgbmatrix liefert die Pixel nur mit pixelsvector
+        options.pixelsvector = self.writeppm or bool(self.framesinkfile)
+
+        self.gpiotest = False
+        self.gpiotest_minb = 10
+        self.gpiotest_maxb = 65
+
+        ### Fonts
+
+        # Bilder und Schriften, wenn möglich aus dem Bundle (dm_assets.py)
+        self.assets = Assets(args.asset_bundle)
+
+        self.fontdir = "./bdf/"
+
+        self.fontmin = self.loadfont("tom-thumb.bdf")
+        self.fontnum = self.loadfont("4x6.bdf")
+        self.fontlargernum = self.loadfont("5x7-mod.bdf")
+        self.propfont = self.loadfont("uwe_prop_mod.bdf")
+        self.proptest = args.proportional
+
+        if args.small or args.small_text:
+            self.fonttext = self.fontnum
+        else:
+            if self.proptest:
+                self.fonttext = self.propfont
+            else:
+                self.fonttext = self.fontlargernum
+
+        if args.small or args.small_countdown:
+            self.fontcountdown = self.fontnum
+        else:
+            if self.proptest:
+                self.fontcountdown = self.propfont
+            else:
+                self.fontcountdown = self.fontlargernum
+
+        if args.small or args.small_linenum:
+            self.fontlinenum = self.fontnum
+        else:
+            if self.proptest:
+                self.fontlinenum = self.propfont
+            else:
+                self.fontlinenum = self.fontlargernum
+
+        ### Colors
+
+        # matrixbgColor_t = (0, 16, 19)
+        self.matrixbgColor_t = None
+        self.textColor = graphics.Color(255, 65, 0)
+        self.texthighlightColor = graphics.Color(255, 30, 0)
+        self.rtnoColor = graphics.Color(190, 190, 190)
+        self.rtColor = graphics.Color(0, 255, 0)
+        self.rtslightColor = graphics.Color(255, 255, 0)
+        self.rtlateColor = graphics.Color(255, 0, 0)
+        self.rtnegativeColor = graphics.Color(0, 255, 255)
+        self.lighttextColor = graphics.Color(100, 100, 100)
+        self.barColor = graphics.Color(8, 8, 8)
+        if options.brightness < 15:
+            self.linebgColor = graphics.Color(0, 12, 12)
+            self.barColor = graphics.Color(12, 12, 12)
+        else:
+            self.linebgColor = graphics.Color(0, 8, 9)
+        self.linefgColor = self.textColor
+
+        ### linenum
+
+        self.linenum_width = args.linenum_width
+        self.linenumheight = self.fontlinenum.height - 1
+        self.linenum_normalsmalloffset = 1  # in zukunft einfach nur vertikal zentrieren?
+        self.linenum_drawbg = True
+
+        ### PPM
+
+        self.ppmdir = "./ppm/"
+        self.ppm_info = self.assets.image(self.ppmdir+"icon-info.ppm")
+        self.ppm_warn = self.assets.image(self.ppmdir+"icon-warn.ppm")
+        self.ppm_stop = self.assets.image(self.ppmdir+"icon-stop.ppm")
+        self.ppm_smile = self.assets.image(self.ppmdir+"icon-smile.ppm")
+        self.ppm_ad = self.assets.image(self.ppmdir+"icon-ad.ppm")
+        self.ppm_delay = self.assets.image(self.ppmdir+"icon-delay.ppm")
+        self.ppm_earlyterm = self.assets.image(self.ppmdir+"icon-earlyterm.ppm")
+        self.ppm_no_rt = self.assets.image(self.ppmdir+"icon-no-rt.ppm")
+        self.ppm_no_deps = self.assets.image(self.ppmdir+"icon-no-deps.ppm")
+
+        self.meldungicons = {"info": self.ppm_info,
+                             "warn": self.ppm_warn,
+                             "stop": self.ppm_stop,
+                             "smile": self.ppm_smile,
+                             "ad": self.ppm_ad,
+                             "delay": self.ppm_delay,
+                             "earlyterm": self.ppm_earlyterm,
+                             "nort": self.ppm_no_rt,
+                             "nodeps": self.ppm_no_deps,
+                             }
+
+        self.symtextoffset = self.fonttext.height-self.fonttext.baseline
+
+        '''
+        # erstmal nicht mehr weiter verfolgt.
+        nolinenumicons = False
+
+        supportedlnlhs = (6, 7)
+        defaultppmlnlh = 6
+        ppmlinenumh = linenumheight if linenumheight in supportedlnlhs else defaultppmlnlh
+        linenumicons = (not nolinenumicons) and linenumheight in supportedlnlhs
+
+        ppm_whiteice = assets.image(f"{ppmdir}icon-ice{ppmlinenumh}.ppm")
+        ppm_whiteic = assets.image(f"{ppmdir}icon-ic{ppmlinenumh}.ppm")
+        ppm_whitene = assets.image(f"{ppmdir}icon-ne{ppmlinenumh}.ppm")
+        ppm_whitenethin = assets.image(f"{ppmdir}icon-ne-thin{ppmlinenumh}.ppm")
+        ppm_ice = colorppm(ppm_whiteice, linefgColor)
+        ppm_ic = colorppm(ppm_whiteic, linefgColor)
+        ppm_ne = colorppm(ppm_whitene, linefgColor)
+        ppm_nethin = colorppm(ppm_whitenethin, linefgColor)
+        '''
+
+        self.longausfall = True
+        self.ppm_ausfall = self.assets.image(self.ppmdir+"red-ausfall"+("-long" if self.longausfall else "")+".ppm")
+
+        self.ppm_whitesofort = self.assets.image(self.ppmdir+"white-sofort.ppm")
+        self.sofort = False
+
+        self.minoffset = 1
+        self.ppm_whitemin = self.assets.image(self.ppmdir+"white-min.ppm")
+
+        self.supportedcdlhs = (6, 7)
+        self.defaultppmcdlh = 6
+        self.ppmcdh = self.fontcountdown.height - 1
+        self.ppmcdh = self.ppmcdh if self.ppmcdh in self.supportedcdlhs else self.defaultppmcdlh
+        self.ppm_whitebus = self.assets.image(f"{self.ppmdir}white-bus{self.ppmcdh}.ppm")
+        self.ppm_whitetrain = self.assets.image(f"{self.ppmdir}white-train{self.ppmcdh}.ppm")
+        self.ppm_whitehispeed = self.assets.image(f"{self.ppmdir}white-hispeed{self.ppmcdh}.ppm")
+        self.ppm_whitetram = self.assets.image(f"{self.ppmdir}white-tram{self.ppmcdh}.ppm")
+        self.ppm_whitehanging = self.assets.image(f"{self.ppmdir}white-hanging{self.ppmcdh}.ppm")
+
+        if self.sofort:
+            self.ppmmotdict = dict.fromkeys((MOT.BUS, MOT.TRAIN, MOT.HISPEED, MOT.TRAM, MOT.HANGING), self.ppm_whitesofort)
+        else:
+            self.ppmmotdict = {MOT.BUS: self.ppm_whitebus,
+                               MOT.TRAIN: self.ppm_whitetrain,
+                               MOT.HISPEED: self.ppm_whitehispeed,
+                               MOT.TRAM: self.ppm_whitetram,
+                               MOT.HANGING: self.ppm_whitehanging,
+                               }
+
+        # eingefärbte Varianten von ppm_whitemin und ppmmotdict, erst bei Bedarf
+        self.tintcache = TintCache()
+
+        self.ppm_vrr = self.assets.image("./ppm/matrix13x13vrr-engebuchstaben-2.ppm").convert('RGB')
+        self.ppm_db11 = self.assets.image("./ppm/dbkeks.ppm").convert('RGB')
+        self.ppm_sonne11 = self.assets.image("./ppm/sonne.ppm").convert('RGB')
+        self.ppm_wolke11 = self.assets.image("./ppm/wolke.ppm").convert('RGB')
+        self.ppm_wolkesonne11 = self.assets.image("./ppm/wolke mit sonne.ppm").convert('RGB')
+        self.ppm_wolkeregen11 = self.assets.image("./ppm/wolke mit regen.ppm").convert('RGB')
+
+        ### Display configuration
+
+        self.lineheight = args.line_height
+        self.text_startr = args.firstrow_y
+
+        self.placelist = args.place_strings
+        if not self.placelist:
+            self.placelist = ["Hagen ", "HA-"]
+        self.ifopt = args.stop_ifopt
+        self.interval = (1 / args.fps) if args.fps > 0 else args.sleep_interval
+        # Scrollen, Blinken usw. nach der Zeit, nicht nach der Anzahl der Bilder
+        self.clock = AnimationClock(self.interval)
+        self.step = self.clock.slots(args.update_interval) if args.update_interval > 0 else args.update_steps
+        self.scrollspeed = args.scroll_speed
+        self.blinkperiod = args.blink_period
+        self.efamenabled = args.enable_efamessages
+        self.header = args.enable_top
+        self.headername = args.stop_name
+        self.headerscroll = args.disable_topscroll
+        self.mindelay = args.min_delay
+        self.minslightdelay = args.min_slightdelay
+        self.maxmin = args.max_minutes
+        self.mintext = args.disable_mintext
+        self.christmas = args.christmas
+        self.progress = args.show_progress
+        self.blink = args.disable_blink
+        self.redraw_unchanged = args.redraw_unchanged
+        self.zerobus = args.show_zero
+        # zur config (und alles andere eigentlich auch):
+        self.stopsymbol = True
+        self.melsymbol = True
+
+        self.rightbar = bool(args.rightbar)
+        self.rightbarcolor = self.rtnoColor
+        self.scrollmsg_through_rightbar = False
+        self.rightbarfn: Optional[Callable] = None
+        self.rightbarstatefn: Optional[Callable] = None
+        self.rightbarslotsfn: Optional[Callable] = None
+        self.rightbarwidth = 0
+        self.rightbarargs: Iterable = ()
+        self.rightbarfont: Optional[graphics.Font] = None
+        self.rightbarseconds = False
+
+        if args.rightbar == 1:
+            self.rightbarfn, self.rightbarwidth, self.rightbarargs, self.rightbarfont = rightbar_verticalclock, 6, (True,), self.fontlargernum
+            self.rightbarstatefn = rightbar_verticalclock_state
+            self.rightbarseconds = self.rightbarargs[0]
+        elif args.rightbar in {2, 3}:
+            currenttime = localtime()
+            self.rightbarfont = self.fonttext
+            self.rightbarwidth = textpx(self.rightbarfont, clockstr_tt(currenttime))  # muss eigentlich laufend angepasst werden
+            if args.rightbar == 2:
+                self.rightbarfn = rightbar_wide
+                self.rightbarstatefn = rightbar_wide_state
+                self.rightbarslotsfn = rightbar_wide_slots
+                self.rightbarseconds = False
+                self.rightbarargs = ((self.ppm_vrr, self.ppm_vrr, self.ppm_vrr, self.ppm_sonne11, self.ppm_wolkesonne11, self.ppm_wolke11, self.ppm_wolkeregen11, self.ppm_db11),)
+            elif args.rightbar == 3:
+                self.rightbarfn = rightbar_tmp
+                self.rightbarstatefn = rightbar_tmp_state
+                self.rightbarseconds = True
+                _width = args.led_cols*args.led_chain
+                # r_scroller = SimpleScrollline(_width-rightbarwidth, _width-1, symtextoffset, fonttext, lighttextColor)
+                # r_scroller.update(None, "Fahrplanauskünfte werden durch den Lizenzgeber zur Verfügung gestellt. Alle Angaben ohne Gewähr.")
+                self.rightbarargs = (self.ppm_vrr, graphics.Color(50, 50, 50))  # , r_scroller)
+                self.scrollmsg_through_rightbar = True
+
+        # Abstand Ziel - Zeit
+        self.spacedt = 1
+        # Abstand Liniennummer - Ziel
+        self.spaceld = 2
+        # Abstand Zeit - rechter Bereich
+        self.spacetr = 1
+
+        self.header_spacest = 1
+
+        self.countdownlowerlimit = -9
+
+        self.min_timeout = 10
+        self.servertimeout = max(self.min_timeout, (self.interval*self.step)/2)
+        self.tz = datetime.utcnow().astimezone().tzinfo
+        self.maxkwaretries = 3
+        # Server nach so vielen fehlgeschlagenen Abfragen in Folge für breakercooldown Sekunden überspringen (verdoppelt sich, solange er ausfällt)
+        self.breakerfailures = 3
+        self.breakercooldown = 60
+        # letzte gute Daten (--last-good) höchstens so oft schreiben (Sekunden)
+        self.lastgoodinterval = 60
+        self.lastgood = LastGood(args.last_good, self.lastgoodinterval) if args.last_good else None
+        # Connection-Pools der Datenquellen (dm_http), bleiben im Abrufprozess erhalten
+        self.httpoptions = {'pool_maxsize': args.http_pool_size, 'dns_ttl': args.dns_ttl}
+
+        self.efaserver = 'https://openservice.vrr.de/vrr/XML_DM_REQUEST'
+        self.efaserver_backup = 'http://www.efa-bw.de/nvbw/XML_DM_REQUEST'
+
+        self.d3d9id = args.test_d3d9  # tmp
+        self.d3d9server = 'https://d3d9.xyz/dfi'
+
+        # z. B. Aufzugsmeldungen
+        # ignore_infoTypes = {"stopInfo"}
+        self.ignore_infoTypes = set(args.ignore_infotype) if args.ignore_infotype else None
+
+        # z. B. Umleitung Wetter; Ausfall Eckeseyer Br.; Sonderburgstr.:
+        # ignore_infoIDs = {"41354_HST", "28748_HST", "45828_HST"}
+        self.ignore_infoIDs = set(args.ignore_infoid) if args.ignore_infoid else None
+
+        self.content_for_short_titles = True
+
+        self.trainTMOTefa = {0, 1, 13, 14, 15, 16, 18}
+        self.trainMOT = {MOT.TRAIN, MOT.HISPEED}
+
+        self.dbrestserver = 'http://d3d9.xyz:3000'
+        self.dbrestserver_backup = 'https://2.db.transport.rest'
+        self.dbrestibnr = args.ibnr
+
+        self.delaymsg_enable = True
+        self.delaymsg_mindelay = 2
+        self.etermmsg_enable = True
+        self.etermmsg_only_visible = True
+        self.nortmsg_limit = args.no_rt_msg
+
+        ### christmas fn
+
+        self.randspeed = 8
+        self.maxrgb = (130, 150, 35)
+        # maxrgb = (150, 150, 0)
+        self.ptspeed = 4
+        self.ptlen = 3
+        self.ptscale = 0.8
+        self.ptrgb = (77, 65, 0)
+        # ptrgb = (153, 130, 0)
+        # Speicher für vorberechnete Bilder (Bytes)
+        self.christmascache = 4*1024*1024
+        self.drawchristmas = ChristmasFrames(makechristmasfn(self.maxrgb, self.randspeed, self.ptrgb, self.ptspeed, self.ptlen, self.ptscale), self.christmascache, args.christmas_light)
+
+        ### Scrollzeilen
+
+        # Speicher für vorgezeichnete Scrolltexte (Bytes), nur mit --scroll-strips
+        self.scrollstripcache = 2*1024*1024
+        self.textstrips = TextStrips(self.scrollstripcache) if args.scroll_strips else None
+
+    def loadfont(self, filename: str) -> graphics.Font:
+        if dm_backend.graphics.Font is dm_bdf.Font:
+            return self.assets.font(self.fontdir+filename)
+        font = dm_backend.graphics.Font()
+        with self.assets.fontfile(self.fontdir+filename) as fontfile:
+            font.LoadFont(fontfile)
+        # für den statischen Layer, da wird mit dm_bdf gezeichnet
+        dm_bdf.register(font, self.assets.font(self.fontdir+filename, parse=False) or self.fontdir+filename)
+        return font
+
+
+def makecontext(argv: Optional[List[str]] = None) -> Context:
+    # argv ohne Programmname, None: sys.argv
+    return Context(makeparser().parse_args(argv))
+
 
 ### End of configuration
 
 
-def loop(matrix, pe):
+# Abfahrtszeile, vorberechnet bei neuen Daten bzw. zur vollen Minute
+@dataclass
+class RowState:
+    direction_text: str
+    direction_color: graphics.Color
+    time_ppm: Optional[Image.Image] = None
+    time_text: str = ""
+    time_x: int = 0
+    time_color: Optional[graphics.Color] = None
+    min_ppm: Optional[Image.Image] = None
+
+
+@dataclass
+class RowPlan:
+    y: int
+    linenum_font: graphics.Font
+    linenum_x: int
+    linenum_y: int
+    linenum_text: str
+    blink: bool
+    on: RowState
+    off: RowState  # blinkender Countdown gerade aus, sonst dasselbe wie on
+
+
+def loop(ctx: Context, matrix, pe):
+    graphics = dm_backend.graphics
     i = 0
     # canvas und loop setup
-    canvas = matrix.CreateFrameCanvas(writeppm)
+    canvas = matrix.CreateFrameCanvas(ctx.options.pixelsvector)
     x_min = 0
     y_min = 0
-    x_max = canvas.width - 1 - (rightbar and (rightbarwidth + spacetr))
+    x_max = canvas.width - 1 - (ctx.rightbar and (ctx.rightbarwidth + ctx.spacetr))
     y_max = canvas.height - 1
 
     linenum_min = x_min
-    linenum_max = linenum_min + linenum_width - 1
-    limit = (y_max - y_min + 1 - text_startr - fonttext.height + fonttext.baseline + lineheight) // lineheight
+    linenum_max = linenum_min + ctx.linenum_width - 1
+    limit = (y_max - y_min + 1 - ctx.text_startr - ctx.fonttext.height + ctx.fonttext.baseline + ctx.lineheight) // ctx.lineheight
     x_pixels = x_max - x_min + 1
 
     currenttime = localtime()
     # xmax hier muss man eigentlich immer neu berechnen
-    scrollx_stop_xmax = x_max-((not rightbar) and header_spacest+textpx(fonttext, clockstr_tt(currenttime)))
-    stop_scroller = SimpleScrollline(x_min, scrollx_stop_xmax, symtextoffset, fonttext, lighttextColor, noscroll=not headerscroll)
+    scrollx_stop_xmax = x_max-((not ctx.rightbar) and ctx.header_spacest+textpx(ctx.fonttext, clockstr_tt(currenttime)))
+    stop_scroller = SimpleScrollline(x_min, scrollx_stop_xmax, ctx.symtextoffset, ctx.fonttext, ctx.lighttextColor, noscroll=not ctx.headerscroll, strips=ctx.textstrips)
 
     # tmp
     deptime_x_max = x_max
+    direction_x = linenum_max + 1 + ctx.spaceld
 
     deps: List[Departure] = []
     meldungs: List[Meldung] = []
 
-    scrollx_msg_xmax = (canvas.width - 1) if scrollmsg_through_rightbar else x_max
-    meldung_scroller = MultisymbolScrollline(x_min, scrollx_msg_xmax, symtextoffset, fonttext, lighttextColor, meldungicons, bgcolor_t=matrixbgColor_t, initial_pretext=2, initial_posttext=10)
+    scrollx_msg_xmax = (canvas.width - 1) if ctx.scrollmsg_through_rightbar else x_max
+    meldung_scroller = MultisymbolScrollline(x_min, scrollx_msg_xmax, ctx.symtextoffset, ctx.fonttext, ctx.lighttextColor, ctx.meldungicons, bgcolor_t=ctx.matrixbgColor_t, initial_pretext=2, initial_posttext=10, strips=ctx.textstrips)
 
     # tmp
-    if args.message:
-        meldungs.append(Meldung(symbol="ad", text=args.message))
+    if ctx.args.message:
+        meldungs.append(Meldung(symbol="ad", text=ctx.args.message))
+
+    def takeresult(result: Tuple[List[Departure], List[Meldung], Dict[str, Any]]) -> Tuple[List[Departure], List[Meldung]]:
+        _deps, _meldungs, _add_data = result
+        if ctx.args.message:
+            _meldungs.append(Meldung(symbol="ad", text=ctx.args.message))
+        for di, dep in enumerate(_deps):
+            for _mel in dep.messages:
+                if _mel not in _meldungs and ((not _mel.efa) or (ctx.efamenabled and di < limit-ctx.header-1)):
+                    _meldungs.append(_mel)
+        _brightness = _add_data.get("brightness")
+        if _brightness is not None and _brightness != matrix.brightness:
+            matrix.brightness = _brightness
+        return _deps, _meldungs
+
+    # bis die ersten Daten da sind, die zuletzt gespeicherten
+    if ctx.lastgood is not None and (ctx.lastgood.result is not None or ctx.lastgood.load()):
+        deps, meldungs = takeresult(ctx.lastgood.restore(ctx.tz, ctx.countdownlowerlimit, ctx.args.stale_after))
+        meldung_scroller.update(meldungs)
 
     pe_f = None
     joined = True
+    fetchslot = -1
 
     # "volles" Beispiel in dm_depdata.py
     depfun_efa: type_depfns = {
-        ("efa-main", True): [(getefadeps, [{'serverurl': efaserver,
-                                            'timeout': servertimeout,
-                                            'ifopt': ifopt,
-                                            'limit': limit*args.limit_multiplier,
-                                            'tz': tz,
-                                            'ignore_infoTypes': ignore_infoTypes,
-                                            'ignore_infoIDs': ignore_infoIDs,
-                                            'content_for_short_titles': content_for_short_titles,
+        ("efa-main", True): [(getefadeps, [{'serverurl': ctx.efaserver,
+                                            'timeout': ctx.servertimeout,
+                                            'ifopt': ctx.ifopt,
+                                            'limit': limit*ctx.args.limit_multiplier,
+                                            'tz': ctx.tz,
+                                            'ignore_infoTypes': ctx.ignore_infoTypes,
+                                            'ignore_infoIDs': ctx.ignore_infoIDs,
+                                            'content_for_short_titles': ctx.content_for_short_titles,
+                                            'maxcountdown': ctx.args.efa_horizon,
                                            },
-                                           {'serverurl': efaserver_backup,
-                                            'timeout': servertimeout,
-                                            'ifopt': ifopt,
-                                            'limit': limit*args.limit_multiplier,
-                                            'tz': tz,
-                                            'ignore_infoTypes': ignore_infoTypes,
-                                            'ignore_infoIDs': ignore_infoIDs,
-                                            'content_for_short_titles': content_for_short_titles,
+                                           {'serverurl': ctx.efaserver_backup,
+                                            'timeout': ctx.servertimeout,
+                                            'ifopt': ctx.ifopt,
+                                            'limit': limit*ctx.args.limit_multiplier,
+                                            'tz': ctx.tz,
+                                            'ignore_infoTypes': ctx.ignore_infoTypes,
+                                            'ignore_infoIDs': ctx.ignore_infoIDs,
+                                            'content_for_short_titles': ctx.content_for_short_titles,
+                                            'maxcountdown': ctx.args.efa_horizon,
                                            },
                                           ])
                             ],
         }
 
     depfun_efadb: type_depfns = {
-        ("efa-notr", True): [(getefadeps, [{'serverurl': efaserver,
-                                            'timeout': servertimeout,
-                                            'ifopt': ifopt,
-                                            'limit': limit*args.limit_multiplier,
-                                            'tz': tz,
-                                            'exclMOT': trainTMOTefa,
-                                            'ignore_infoTypes': ignore_infoTypes,
-                                            'ignore_infoIDs': ignore_infoIDs,
-                                            'content_for_short_titles': content_for_short_titles,
+        ("efa-notr", True): [(getefadeps, [{'serverurl': ctx.efaserver,
+                                            'timeout': ctx.servertimeout,
+                                            'ifopt': ctx.ifopt,
+                                            'limit': limit*ctx.args.limit_multiplier,
+                                            'tz': ctx.tz,
+                                            'exclMOT': ctx.trainTMOTefa,
+                                            'ignore_infoTypes': ctx.ignore_infoTypes,
+                                            'ignore_infoIDs': ctx.ignore_infoIDs,
+                                            'content_for_short_titles': ctx.content_for_short_titles,
+                                            'maxcountdown': ctx.args.efa_horizon,
                                            },
-                                           {'serverurl': efaserver_backup,
-                                            'timeout': servertimeout,
-                                            'ifopt': ifopt,
-                                            'limit': limit*args.limit_multiplier,
-                                            'tz': tz,
-                                            'exclMOT': trainTMOTefa,
-                                            'ignore_infoTypes': ignore_infoTypes,
-                                            'ignore_infoIDs': ignore_infoIDs,
-                                            'content_for_short_titles': content_for_short_titles,
+                                           {'serverurl': ctx.efaserver_backup,
+                                            'timeout': ctx.servertimeout,
+                                            'ifopt': ctx.ifopt,
+                                            'limit': limit*ctx.args.limit_multiplier,
+                                            'tz': ctx.tz,
+                                            'exclMOT': ctx.trainTMOTefa,
+                                            'ignore_infoTypes': ctx.ignore_infoTypes,
+                                            'ignore_infoIDs': ctx.ignore_infoIDs,
+                                            'content_for_short_titles': ctx.content_for_short_titles,
+                                            'maxcountdown': ctx.args.efa_horizon,
                                            },
                                           ])
                             ],
-        ("dbre-tr", True): [(getdbrestdeps, [{'serverurl': dbrestserver,
-                                               'timeout': servertimeout,
-                                               'ibnr': dbrestibnr,
-                                               'limit': limit*args.limit_multiplier,
-                                               'inclMOT': trainMOT,
+        ("dbre-tr", True): [(getdbrestdeps, [{'serverurl': ctx.dbrestserver,
+                                               'timeout': ctx.servertimeout,
+                                               'ibnr': ctx.dbrestibnr,
+                                               'limit': limit*ctx.args.limit_multiplier,
+                                               'inclMOT': ctx.trainMOT,
                                              },
-                                             {'serverurl': dbrestserver_backup,
-                                               'timeout': servertimeout,
-                                               'ibnr': dbrestibnr,
-                                               'limit': limit*args.limit_multiplier,
-                                               'inclMOT': trainMOT,
+                                             {'serverurl': ctx.dbrestserver_backup,
+                                               'timeout': ctx.servertimeout,
+                                               'ibnr': ctx.dbrestibnr,
+                                               'limit': limit*ctx.args.limit_multiplier,
+                                               'inclMOT': ctx.trainMOT,
                                              }
                                             ]),
-                            (getefadeps, [{'serverurl': efaserver,
-                                           'timeout': servertimeout,
-                                           'ifopt': ifopt,
-                                           'limit': limit*args.limit_multiplier,
-                                           'tz': tz,
-                                           'inclMOT': trainTMOTefa,
-                                           'ignore_infoTypes': ignore_infoTypes,
-                                           'ignore_infoIDs': ignore_infoIDs,
-                                           'content_for_short_titles': content_for_short_titles,
+                            (getefadeps, [{'serverurl': ctx.efaserver,
+                                           'timeout': ctx.servertimeout,
+                                           'ifopt': ctx.ifopt,
+                                           'limit': limit*ctx.args.limit_multiplier,
+                                           'tz': ctx.tz,
+                                           'inclMOT': ctx.trainTMOTefa,
+                                           'ignore_infoTypes': ctx.ignore_infoTypes,
+                                           'ignore_infoIDs': ctx.ignore_infoIDs,
+                                           'content_for_short_titles': ctx.content_for_short_titles,
+                                           'maxcountdown': ctx.args.efa_horizon,
                                           },
-                                          {'serverurl': efaserver_backup,
-                                           'timeout': servertimeout,
-                                           'ifopt': ifopt,
-                                           'limit': limit*args.limit_multiplier,
-                                           'tz': tz,
-                                           'inclMOT': trainTMOTefa,
-                                           'ignore_infoTypes': ignore_infoTypes,
-                                           'ignore_infoIDs': ignore_infoIDs,
-                                           'content_for_short_titles': content_for_short_titles,
+                                          {'serverurl': ctx.efaserver_backup,
+                                           'timeout': ctx.servertimeout,
+                                           'ifopt': ctx.ifopt,
+                                           'limit': limit*ctx.args.limit_multiplier,
+                                           'tz': ctx.tz,
+                                           'inclMOT': ctx.trainTMOTefa,
+                                           'ignore_infoTypes': ctx.ignore_infoTypes,
+                                           'ignore_infoIDs': ctx.ignore_infoIDs,
+                                           'content_for_short_titles': ctx.content_for_short_titles,
+                                           'maxcountdown': ctx.args.efa_horizon,
                                           }
                                          ])
                            ],
         }
 
-    depfunctions = depfun_efadb if dbrestibnr else depfun_efa
-    if d3d9id:
-        depfnlist_d3d9: type_depfnlist = [(getd3d9msgdata, [{'serverurl': d3d9server, 'timeout': servertimeout, 'dfi_id': d3d9id}])]
+    depfunctions = depfun_efadb if ctx.dbrestibnr else depfun_efa
+    if ctx.d3d9id:
+        depfnlist_d3d9: type_depfnlist = [(getd3d9msgdata, [{'serverurl': ctx.d3d9server, 'timeout': ctx.servertimeout, 'dfi_id': ctx.d3d9id}])]
         depfunctions.update({('d3d9-m+d', False): depfnlist_d3d9})
 
+    def makerowplan(dep: Departure, r: int) -> RowPlan:
+        _lnfont = ctx.fontlinenum
+        linenumstr = dep.disp_linenum
+        linenumpx = textpx(_lnfont, linenumstr)
+        _roff = 0
+        if linenumpx > ctx.linenum_width:
+            shownchars_normal = propscroll(ctx.fontlinenum, linenumstr, linenum_min, linenum_max)
+            shownchars_small = propscroll(ctx.fontnum, linenumstr, linenum_min, linenum_max)
+            _search = linenumpattern.search(linenumstr)
+            if _search is not None:
+                linenumstr = _search.group(1)+_search.group(2)
+                shownchars_normal = propscroll(ctx.fontlinenum, linenumstr, linenum_min, linenum_max)
+                shownchars_small = propscroll(ctx.fontnum, linenumstr, linenum_min, linenum_max)
+                if shownchars_small < len(linenumstr):
+                    linenumstr = _search.group(1)
+                    shownchars_normal = propscroll(ctx.fontlinenum, linenumstr, linenum_min, linenum_max)
+                    shownchars_small = propscroll(ctx.fontnum, linenumstr, linenum_min, linenum_max)
+            if shownchars_small > shownchars_normal and not linenumstr[shownchars_small-1] in {'(', '/'}:
+                linenumstr = linenumstr[:shownchars_small]
+                _lnfont = ctx.fontnum
+                _roff = ctx.linenum_normalsmalloffset
+            else:
+                linenumstr = linenumstr[:shownchars_normal]
+                _lnfont = ctx.fontlinenum
+            linenumpx = textpx(_lnfont, linenumstr)
+
+        color = ctx.rtnoColor
+        if dep.realtime:
+            if dep.delay >= ctx.mindelay or dep.cancelled:
+                color = ctx.rtlateColor
+            elif dep.delay >= ctx.minslightdelay:
+                color = ctx.rtslightColor
+            elif dep.delay < 0:
+                color = ctx.rtnegativeColor
+            else:
+                color = ctx.rtColor
+
+        # erweiterbar
+        if dep.earlytermination:
+            dirtextcolor = ctx.texthighlightColor
+        else:
+            dirtextcolor = ctx.textColor
+
+        isblinking = ctx.blink and ctx.maxmin >= 0 and dep.disp_countdown == 0 and not dep.cancelled
+        on = makerowstate(dep, color, dirtextcolor, True)
+        return RowPlan(y=r,
+                       linenum_font=_lnfont,
+                       linenum_x=linenum_max - linenumpx + (linenumpx == ctx.linenum_width),
+                       linenum_y=r-_roff,
+                       linenum_text=linenumstr,
+                       blink=isblinking,
+                       on=on,
+                       off=makerowstate(dep, color, dirtextcolor, False) if isblinking else on)
+
+    def makerowstate(dep: Departure, color: graphics.Color, dirtextcolor: graphics.Color, blinkon: bool) -> RowState:
+        state = RowState(direction_text="", direction_color=dirtextcolor)
+        directionpixel = deptime_x_max - direction_x
+        timeoffset = 0
+
+        if dep.cancelled:
+            state.time_ppm = ctx.ppm_ausfall
+            timeoffset += ctx.ppm_ausfall.size[0]
+        elif dep.disp_countdown > ctx.maxmin:
+            timestr = clockstr_tt(dep.deptime.timetuple())
+            timestrpx = textpx(ctx.fontcountdown, timestr)
+            state.time_text, state.time_x, state.time_color = timestr, deptime_x_max - timestrpx + 1, color
+            timeoffset += timestrpx
+        elif blinkon and dep.disp_countdown == 0 and ctx.zerobus:
+            state.time_ppm = ctx.tintcache.get(dep.mot, ctx.ppmmotdict[dep.mot], color)
+            timeoffset += ctx.ppmmotdict[dep.mot].size[0]
+        elif dep.disp_countdown or blinkon:
+            timestr = str(dep.disp_countdown)
+            timestrpx = textpx(ctx.fontcountdown, timestr)
+            state.time_text, state.time_x, state.time_color = timestr, deptime_x_max - timestrpx - ((ctx.ppm_whitemin.size[0]-1+ctx.minoffset) if ctx.mintext else -1), color
+            timeoffset += timestrpx
+            if ctx.mintext:
+                state.min_ppm = ctx.tintcache.get("min", ctx.ppm_whitemin, color)
+                timeoffset += ctx.ppm_whitemin.size[0] + ctx.minoffset
+
+        directionpixel -= (timeoffset + ctx.spacedt*bool(timeoffset))
+        directionlimit = propscroll(ctx.fonttext, dep.disp_direction, direction_x, direction_x+directionpixel)
+        state.direction_text = dep.disp_direction[:directionlimit]
+        return state
+
+    def drawlinenum(cv, gfx, plan: RowPlan) -> None:
+        if ctx.linenum_drawbg:
+            for y in range(plan.y-ctx.linenumheight, plan.y):
+                gfx.DrawLine(cv, linenum_min, y, linenum_max, y, ctx.linebgColor)
+        gfx.DrawText(cv, plan.linenum_font, plan.linenum_x, plan.linenum_y, ctx.linefgColor, plan.linenum_text)
+
+    def drawtimedirection(cv, gfx, plan: RowPlan, blinkon: bool) -> None:
+        state = plan.on if blinkon else plan.off
+        if state.time_ppm is not None:
+            drawppm_bottomright(cv, state.time_ppm, deptime_x_max, plan.y, transp=True)
+        if state.time_text:
+            gfx.DrawText(cv, ctx.fontcountdown, state.time_x, plan.y, state.time_color, state.time_text)
+        if state.min_ppm is not None:
+            drawppm_bottomright(cv, state.min_ppm, deptime_x_max, plan.y, transp=True)
+        gfx.DrawText(cv, ctx.fonttext, direction_x, plan.y, state.direction_color, state.direction_text)
+
+    def makerowplans(deps: List[Departure], meldungs: List[Meldung]) -> List[RowPlan]:
+        r = y_min + ctx.text_startr + ctx.header*ctx.lineheight
+        plans = []
+        for dep in deps[:(limit-bool(meldungs)-ctx.header)]:
+            plans.append(makerowplan(dep, r))
+            r += ctx.lineheight
+        return plans
+
+    def drawstaticlayer(layer: ImageLayer, rowplans: List[RowPlan], currenttime) -> None:
+        # alles, was sich nur mit neuen Daten oder zur vollen Minute ändert.
+        # Abfahrten mit blinkendem Countdown werden weiterhin in jedem Durchlauf gezeichnet (Zeit + Ziel)
+        layer.Fill(*ctx.matrixbgColor_t) if ctx.matrixbgColor_t else layer.Clear()
+        r = y_min + ctx.text_startr
+
+        if ctx.header:
+            if not stop_scroller.willscroll:
+                stop_scroller.render(layer, r, dm_bdf)
+            if not ctx.rightbar:
+                dm_bdf.DrawText(layer, ctx.fonttext, scrollx_stop_xmax+1+ctx.header_spacest, r, ctx.rtnoColor, clockstr_tt(currenttime))
+
+        for plan in rowplans:
+            drawlinenum(layer, dm_bdf, plan)
+            if not plan.blink:
+                drawtimedirection(layer, dm_bdf, plan, True)
+
+    def slotstate(j: int, currenttime):
+        # was sich allein mit i ändert, außer Blinken und Abruf
+        return (ctx.rightbar and ctx.rightbarstatefn(j, ctx.step, currenttime, *ctx.rightbarargs),
+                ctx.progress and int(x_pixels-1 - ((j % ctx.step)*((x_pixels-1)/ctx.step))),
+                ctx.christmas and ctx.drawchristmas.drawfn.framekey(x_min, x_max, ctx.clock.frame(j)))
+
+    def idleslots(i: int, currenttime) -> int:
+        # Slots bis zur frühesten möglichen Änderung, wenn nichts scrollt (höchstens bis zum nächsten Abruf).
+        # Uhrzeit kommt über nextclockchange, hier nur was von i abhängt, jeweils ausgerechnet wie bei clock.slotsuntil
+        r = i % ctx.step
+        kmax = ctx.step - r
+        if blinkplans and ctx.blink:
+            kmax = min(kmax, ctx.clock.slotsuntil(2 / ctx.blinkperiod, i))
+        if ctx.rightbar and ctx.rightbarslotsfn:
+            kmax = min(kmax, ctx.rightbarslotsfn(i, ctx.step, currenttime, *ctx.rightbarargs))
+        if ctx.progress and x_pixels > 1:
+            # x_progress wird kleiner, sobald r*(x_pixels-1)/step über x_pixels-1 - x_progress kommt
+            x_progress = int(x_pixels-1 - (r*((x_pixels-1)/ctx.step)))
+            kmax = min(kmax, max(1, (x_pixels-1 - x_progress)*ctx.step//(x_pixels-1) + 1 - r))
+        if ctx.christmas:
+            frames = ctx.drawchristmas.drawfn.framesuntil(x_min, x_max, ctx.clock.frame(i))
+            if frames:
+                kmax = min(kmax, ctx.clock.slotsuntil(1 / ctx.clock.nominal, i, frames))
+        if kmax > 1 and (ctx.rightbarslotsfn or ctx.progress or ctx.christmas):
+            # Rundung (float) kann eins danebenliegen: zu früh aufwachen schadet nicht, zu spät schon
+            current = slotstate(i, currenttime)
+            while kmax > 1 and slotstate(i+kmax-1, currenttime) != current:
+                kmax -= 1
+        return kmax
+
+    def nextclockchange(now: float) -> float:
+        # Uhrzeit in der rightbar ggf. mit Sekunden, sonst ändert sich nur zur vollen Minute etwas
+        return floor(now) + 1 if ctx.rightbar and ctx.rightbarseconds else (floor(now / 60) + 1) * 60
+
+    staticlayer = ImageLayer(canvas.width, canvas.height)
+    staticlayer_dirty = True
+    staticlayer_min = -1
+    staticlayer_version = 0
+    # Zustand des zuletzt gezeichneten Bildes, None wenn etwas scrollt/animiert ist
+    lastframestate = None
+    lastscrollpx = 0
+    wasanimated = True
+    rowplans: List[RowPlan] = []
+    blinkplans: List[RowPlan] = []
+    meldung_r = y_min + ctx.text_startr
+    stop_scroller.update(ctx.ppm_stop if ctx.stopsymbol else None, ctx.headername or (deps and deps[0].stopname) or "")
+
+    scheduler = FrameScheduler(ctx.interval, ctx.args.frame_policy)
+    framesink = FrameSink(ctx.framesinkfile, canvas.width, canvas.height, interval=0.0 if hasbuffer(canvas) else ctx.framesinkinterval) if ctx.framesinkfile else None
+    ppmsnapshot = PPMSnapshot(ctx.ppmfile, ctx.ppminterval) if ctx.writeppm else None
+    profiler = PhaseProfiler(ctx.args.profile, ctx.args.profile_file) if ctx.args.profile > 0 else NullProfiler()
+    exports = [e for e in (framesink, ppmsnapshot) if e is not None]
+
     logger.info(f"started loop with depfunctions {', '.join(x[0] for x in depfunctions.keys())}")
     while True:
-        # time_measure = monotonic()
-        canvas.Fill(*matrixbgColor_t) if matrixbgColor_t else canvas.Clear()
-        if joined and not i % step:
-            joined = False
-            pe_f = pe.submit(getdeps,
-                             depfunctions=depfunctions,
-                             getdeps_timezone=tz,
-                             getdeps_lines=limit-header,
-                             getdeps_placelist=placelist,
-                             getdeps_mincountdown=countdownlowerlimit,
-                             getdeps_max_retries=maxkwaretries,
-                             extramsg_messageexists=bool(args.message),  # ob es *bereits* eine Meldung geben wird - aktuell nur durch args.message so.
-                             delaymsg_enable=delaymsg_enable,
-                             delaymsg_mindelay=delaymsg_mindelay,
-                             etermmsg_enable=etermmsg_enable,
-                             etermmsg_only_visible=etermmsg_only_visible,
-                             nodepmsg_enable=True,
-                             nortmsg_limit=nortmsg_limit)
+        profiler.start()
+        # i kann durch den scheduler auch springen, deswegen nicht "not i % step"
+        if i // ctx.step != fetchslot:
+            fetchslot = i // ctx.step
+            if joined:
+                joined = False
+                pe_f = pe.submit(getdeps,
+                                 depfunctions=depfunctions,
+                                 getdeps_timezone=ctx.tz,
+                                 getdeps_lines=limit-ctx.header,
+                                 getdeps_placelist=ctx.placelist,
+                                 getdeps_mincountdown=ctx.countdownlowerlimit,
+                                 getdeps_max_retries=ctx.maxkwaretries,
+                                 getdeps_hedge_percentile=ctx.args.hedge_percentile,
+                                 getdeps_breaker_failures=ctx.breakerfailures,
+                                 getdeps_breaker_cooldown=ctx.breakercooldown,
+                                 extramsg_messageexists=bool(ctx.args.message),  # ob es *bereits* eine Meldung geben wird - aktuell nur durch args.message so.
+                                 delaymsg_enable=ctx.delaymsg_enable,
+                                 delaymsg_mindelay=ctx.delaymsg_mindelay,
+                                 etermmsg_enable=ctx.etermmsg_enable,
+                                 etermmsg_only_visible=ctx.etermmsg_only_visible,
+                                 nodepmsg_enable=True,
+                                 nortmsg_limit=ctx.nortmsg_limit,
+                                 http_options=ctx.httpoptions,
+                                 getdeps_unchanged=True)
+                profiler.mark("fetch")
 
         if pe_f.done() and not joined:
+            joined = True
+            _result = None
             try:
-                deps, meldungs, _add_data = pe_f.result()
+                _result = pe_f.result()
             except Exception as e:
                 if e.__class__ != GetdepsEndAll:
                     logger.exception("exception from getdeps")
-                deps = []
-                meldungs = [Meldung(symbol="warn", text="Fehler bei Datenabruf. Bitte Aushangfahrpläne beachten.")]
+                # alle Quellen ausgefallen: letzte gute Daten, sonst nur der Hinweis
+                if ctx.lastgood is not None:
+                    _result = ctx.lastgood.restore(ctx.tz, ctx.countdownlowerlimit, ctx.args.stale_after)
+                if _result is None:
+                    deps = []
+                    meldungs = [Meldung(symbol="warn", text="Fehler bei Datenabruf. Bitte Aushangfahrpläne beachten.")]
             else:
-                if args.message:
-                    meldungs.append(Meldung(symbol="ad", text=args.message))
-                for di, dep in enumerate(deps):
-                    for _mel in dep.messages:
-                        if _mel not in meldungs and ((not _mel.efa) or (efamenabled and di < limit-header-1)):
-                            meldungs.append(_mel)
-                _brightness = _add_data.get("brightness")
-                if _brightness is not None and _brightness != matrix.brightness:
-                    matrix.brightness = _brightness
-            finally:
-                joined = True
-                meldung_scroller.update(meldungs)
-
-        blinkstep = i % 40 < 20
-        blinkon = blinkstep or not blink
-        if rightbar or header:
-            currenttime = localtime()
-        r = y_min + text_startr
-
-        if rightbar:
-            # x_min, y_min usw. fehlen
-            rightbarfn(canvas, x_max+1+spacetr, 0, rightbarwidth, rightbarfont, rightbarcolor, i, step, currenttime, *rightbarargs)
-
-        if header:
-            stop_scroller.update(ppm_stop if stopsymbol else None, headername or (deps and deps[0].stopname) or "")
-            stop_scroller.render(canvas, r)
-
-            if not rightbar:
-                graphics.DrawText(canvas, fonttext, scrollx_stop_xmax+1+header_spacest, r, rtnoColor, clockstr_tt(currenttime))
-
-            r += lineheight
-
-        for dep in deps[:(limit-bool(meldungs)-header)]:
-            if linenum_drawbg:
-                for y in range(r-linenumheight, r):
-                    graphics.DrawLine(canvas, linenum_min, y, linenum_max, y, linebgColor)
-
-            _lnfont = fontlinenum
-            linenumstr = dep.disp_linenum
-            linenumpx = textpx(_lnfont, linenumstr)
-            _roff = 0
-            if linenumpx > linenum_width:
-                shownchars_normal = propscroll(fontlinenum, linenumstr, linenum_min, linenum_max)
-                shownchars_small = propscroll(fontnum, linenumstr, linenum_min, linenum_max)
-                _search = linenumpattern.search(linenumstr)
-                if _search is not None:
-                    linenumstr = _search.group(1)+_search.group(2)
-                    shownchars_normal = propscroll(fontlinenum, linenumstr, linenum_min, linenum_max)
-                    shownchars_small = propscroll(fontnum, linenumstr, linenum_min, linenum_max)
-                    if shownchars_small < len(linenumstr):
-                        linenumstr = _search.group(1)
-                        shownchars_normal = propscroll(fontlinenum, linenumstr, linenum_min, linenum_max)
-                        shownchars_small = propscroll(fontnum, linenumstr, linenum_min, linenum_max)
-                if shownchars_small > shownchars_normal and not linenumstr[shownchars_small-1] in {'(', '/'}:
-                    linenumstr = linenumstr[:shownchars_small]
-                    _lnfont = fontnum
-                    _roff = linenum_normalsmalloffset
-                else:
-                    linenumstr = linenumstr[:shownchars_normal]
-                    _lnfont = fontlinenum
-                linenumpx = textpx(_lnfont, linenumstr)
-            graphics.DrawText(canvas, _lnfont, linenum_max - linenumpx + (linenumpx == linenum_width), r-_roff, linefgColor, linenumstr)
-
-            color = rtnoColor
-            if dep.realtime:
-                if dep.delay >= mindelay or dep.cancelled:
-                    color = rtlateColor
-                elif dep.delay >= minslightdelay:
-                    color = rtslightColor
-                elif dep.delay < 0:
-                    color = rtnegativeColor
-                else:
-                    color = rtColor
-
-            direction_x = linenum_max + 1 + spaceld
-            directionpixel = deptime_x_max - direction_x
-            timeoffset = 0
-
-            if dep.cancelled:
-                drawppm_bottomright(canvas, ppm_ausfall, deptime_x_max, r, transp=True)
-                timeoffset += ppm_ausfall.size[0]
-            elif dep.disp_countdown > maxmin:
-                timestr = clockstr_tt(dep.deptime.timetuple())
-                timestrpx = textpx(fontcountdown, timestr)
-                graphics.DrawText(canvas, fontcountdown, deptime_x_max - timestrpx + 1, r, color, timestr)
-                timeoffset += timestrpx
-            elif blinkon and dep.disp_countdown == 0 and zerobus:
-                drawppm_bottomright(canvas, ppmmotcolordict[dep.mot][color], deptime_x_max, r, transp=True)
-                timeoffset += ppmmotdict[dep.mot].size[0]
-            elif dep.disp_countdown or blinkon:
-                timestr = str(dep.disp_countdown)
-                timestrpx = textpx(fontcountdown, timestr)
-                graphics.DrawText(canvas, fontcountdown, deptime_x_max - timestrpx - ((ppm_whitemin.size[0]-1+minoffset) if mintext else -1), r, color, timestr)
-                timeoffset += timestrpx
-                if mintext:
-                    drawppm_bottomright(canvas, ppmmincolordict[color], deptime_x_max, r, transp=True)
-                    timeoffset += ppm_whitemin.size[0] + minoffset
-
-            # erweiterbar
-            if dep.earlytermination:
-                dirtextcolor = texthighlightColor
+                if ctx.lastgood is not None:
+                    ctx.lastgood.update(_result)
+            if isinstance(_result, DepsUnchanged):
+                # bis auf die countdowns alles wie zuletzt: Meldungen und Scrollzeilen bleiben
+                if _result.apply(deps):
+                    staticlayer_dirty = True
             else:
-                dirtextcolor = textColor
-
-            directionpixel -= (timeoffset + spacedt*bool(timeoffset))
-            directionlimit = propscroll(fonttext, dep.disp_direction, direction_x, direction_x+directionpixel)
-            graphics.DrawText(canvas, fonttext, direction_x, r, dirtextcolor, dep.disp_direction[:directionlimit])
-
-            r += lineheight
-
-        if meldungs:
-            meldung_scroller.render(canvas, r)
-            r += lineheight
-
-        if progress:
-            x_progress = int(x_pixels-1 - ((i % step)*((x_pixels-1)/step)))
-            graphics.DrawLine(canvas, x_min, y_max, x_min+x_progress, y_max, barColor)
-
-        if christmas:
-            drawchristmas(canvas, x_min, x_max, y_min, y_max, i)
-
-        if writeppm:
-            canvas.ppm(ppmfile)
-
-        canvas = matrix.SwapOnVSync(canvas)
-
-        if gpiotest:
+                if _result is not None:
+                    deps, meldungs = takeresult(_result)
+                meldung_scroller.update(meldungs)
+                stop_scroller.update(ctx.ppm_stop if ctx.stopsymbol else None, ctx.headername or (deps and deps[0].stopname) or "")
+                staticlayer_dirty = True
+            profiler.mark("data")
+
+        blinkstep = ctx.clock.blink(ctx.blinkperiod, i)
+        blinkon = blinkstep or not ctx.blink
+        currenttime = localtime()
+
+        if staticlayer_dirty or currenttime.tm_min != staticlayer_min:
+            rowplans = makerowplans(deps, meldungs)
+            blinkplans = [plan for plan in rowplans if plan.blink]
+            meldung_r = y_min + ctx.text_startr + (ctx.header+len(rowplans))*ctx.lineheight
+            drawstaticlayer(staticlayer, rowplans, currenttime)
+            staticlayer_dirty = False
+            staticlayer_min = currenttime.tm_min
+            staticlayer_version += 1
+            profiler.mark("layer")
+
+        if ctx.progress:
+            x_progress = int(x_pixels-1 - ((i % ctx.step)*((x_pixels-1)/ctx.step)))
+
+        # wenn nichts scrollt und sich sonst auch nichts geändert hat, ist das Bild dasselbe wie zuletzt:
+        # dann weder zeichnen noch tauschen/ausgeben
+        animated = ctx.redraw_unchanged or (ctx.header and stop_scroller.willscroll) or bool(meldungs)
+        framestate = None if animated else (staticlayer_version,
+                                            matrix.brightness,
+                                            ctx.rightbar and ctx.rightbarstatefn(i, ctx.step, currenttime, *ctx.rightbarargs),
+                                            bool(blinkplans) and blinkon,
+                                            ctx.progress and x_progress,
+                                            ctx.christmas and ctx.drawchristmas.drawfn.framekey(x_min, x_max, ctx.clock.frame(i)))
+        # Pixel seit dem letzten Bild, nach einer Pause ohne Scrollen nicht nachholen
+        scrollpx = ctx.clock.count(ctx.scrollspeed, i)
+        scrollsteps = scrollpx - lastscrollpx if wasanimated else 0
+        lastscrollpx = scrollpx
+        wasanimated = animated
+        # ein übersprungenes Bild (--ppm-interval, --frame-sink-interval) ist jetzt dran: das aktuelle Bild nochmal zeichnen
+        exportoverdue = any(e.overdue() for e in exports)
+        if framestate is not None and framestate == lastframestate and not exportoverdue:
+            scheduler.unchanged()
+            profiler.mark("unchanged")
+        else:
+            lastframestate = framestate
+            canvas.SetImage(staticlayer.image, 0, 0)
+            profiler.mark("blit")
+
+            if ctx.rightbar:
+                # x_min, y_min usw. fehlen
+                ctx.rightbarfn(canvas, x_max+1+ctx.spacetr, 0, ctx.rightbarwidth, ctx.rightbarfont, ctx.rightbarcolor, i, ctx.step, currenttime, *ctx.rightbarargs)
+                profiler.mark("rightbar")
+
+            if ctx.header and stop_scroller.willscroll:
+                stop_scroller.render(canvas, y_min + ctx.text_startr, steps=scrollsteps)
+                profiler.mark("header")
+
+            if blinkplans:
+                for plan in blinkplans:
+                    drawtimedirection(canvas, graphics, plan, blinkon)
+                profiler.mark("rows")
+
+            if meldungs:
+                meldung_scroller.render(canvas, meldung_r, scrollsteps)
+                profiler.mark("meldungs")
+
+            if ctx.progress:
+                graphics.DrawLine(canvas, x_min, y_max, x_min+x_progress, y_max, ctx.barColor)
+                profiler.mark("progress")
+
+            if ctx.christmas:
+                ctx.drawchristmas(canvas, x_min, x_max, y_min, y_max, ctx.clock.frame(i))
+                profiler.mark("christmas")
+
+            if exports:
+                framedata = None
+                if framesink is not None:
+                    if framesink.due():
+                        framedata = framebytes(canvas)
+                        framesink.publish(framedata)
+                    else:
+                        framesink.pending = True
+                if ppmsnapshot is not None:
+                    if ppmsnapshot.due():
+                        ppmsnapshot.write(canvas, framedata)
+                    else:
+                        ppmsnapshot.pending = True
+                profiler.mark("export")
+
+            canvas = matrix.SwapOnVSync(canvas)
+            profiler.mark("swap")
+
+        if ctx.gpiotest:
             inputs = matrix.AwaitInputChange(0)
             if inputs & (1 << 21):
                 # check_output(["/sbin/shutdown", "now"])
-                matrix.brightness = ((matrix.brightness - gpiotest_minb + 1) % (gpiotest_maxb - gpiotest_minb + 1)) + gpiotest_minb
+                matrix.brightness = ((matrix.brightness - ctx.gpiotest_minb + 1) % (ctx.gpiotest_maxb - ctx.gpiotest_minb + 1)) + ctx.gpiotest_minb
 
-        # _st = interval-monotonic()+time_measure
-        # if _st > 0:
-        #     sleep(_st)
-        if interval > 0:
-            sleep(interval)
-        i += 1
+        if framestate is not None:
+            # nichts animiert: bis zur nächsten möglichen Änderung schlafen (oder bis Daten da sind)
+            # höchstens bis ein noch nicht ausgegebenes Bild dran ist
+            now = time()
+            wake = min([nextclockchange(now)] + [now + e.remaining() for e in exports if e.pending])
+            slots = scheduler.idle(idleslots(i, currenttime), wake, None if joined else pe_f)
+        else:
+            slots = scheduler.wait()
+        profiler.end(ctx.interval, slots)
+        i += slots
 
 
 if __name__ == "__main__":
+    # Sinks nur, wenn als Programm gestartet (nicht beim Import, z. B. aus Tests oder Tools)
+    setuplogging()
+    ctx = makecontext()
     logger.info("started")
-    matrix = RGBMatrix(options=options)
-    if args.show_start:
-        startcanvas = matrix.CreateFrameCanvas(writeppm)
-        startscreen(startcanvas, fontnum, lighttextColor, ifopt, ppm_smile)
+    logger.info(ctx.assets.summary())
+    matrix = dm_backend.RGBMatrix(options=ctx.options)
+    if ctx.gpiotest:
+        available_inputs = matrix.GPIORequestInputs(0xffffffff)
+    # mit gespeicherten Daten gleich los
+    if ctx.args.show_start and not (ctx.lastgood is not None and ctx.lastgood.load()):
+        startcanvas = matrix.CreateFrameCanvas(ctx.options.pixelsvector)
+        startscreen(startcanvas, ctx.fontnum, ctx.lighttextColor, ctx.ifopt, ctx.ppm_smile)
         matrix.SwapOnVSync(startcanvas)
         sleep(5)
     while True:
         try:
             with ProcessPoolExecutor(max_workers=1) as ppe:
-                loop(matrix, ppe)
+                loop(ctx, matrix, ppe)
         except KeyboardInterrupt:
             break
         except Exception:
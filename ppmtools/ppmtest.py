@@ -1,32 +1,60 @@
-from PIL import Image, ImageFile
+from os import path
+import sys
+from time import sleep
+
+from PIL import Image
 from image_to_ansi import rgb2short
-from sys import argv
 
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+from dm_framesink import MAGIC, FrameSource
+
 colors = {}
-filename = argv[1] if len(argv) > 1 else '/tmp/out.ppm'
+filename = sys.argv[1] if len(sys.argv) > 1 else '/tmp/out.ppm'
+
+
+def show(im):
+    _ppmstr = ""
+    for y in range(im.size[1]):
+        for x in range(im.size[0]):
+            p = im.getpixel((x,y))
+            h = "%2x%2x%2x" % (p[0],p[1],p[2])
+            short = colors.get(h)
+            if short is None:
+                short = rgb2short(h)[0]
+                colors[h] = short
+            _ppmstr += "\033[48;5;%sm  " % short
+        _ppmstr += "\033[0m\n"
+    _ppmstr += "\n"
+    print(_ppmstr)
+
 
 with open(filename, 'rb') as f:
-    while True:
-        s = False
-        while not s:
-            try:
-                im = Image.open(f)
-            except Exception as e:
-                print(e)
-            else:
-                s = True
-        _ppmstr = ""
-        for y in range(im.size[1]):
-            for x in range(im.size[0]):
-                p = im.getpixel((x,y))
-                h = "%2x%2x%2x" % (p[0],p[1],p[2])
-                short = colors.get(h)
-                if short is None:
-                    short = rgb2short(h)[0]
-                    colors[h] = short
-                _ppmstr += "\033[48;5;%sm  " % short
-            _ppmstr += "\033[0m\n"
-        _ppmstr += "\n"
-        print(_ppmstr)
+    framesink = f.read(len(MAGIC)) == MAGIC
 
+if framesink:
+    # --frame-sink: jedes neue Bild aus dem Ringpuffer
+    source = FrameSource(filename)
+    last = 0
+    while True:
+        if source.replaced():
+            source.close()
+            source = FrameSource(filename)
+            last = 0
+        frame = source.copy()
+        if frame is None or frame.seq == last:
+            sleep(0.01)
+            continue
+        last = frame.seq
+        show(Image.frombuffer("RGB", (source.width, source.height), frame.data, "raw", "RGB", 0, 1))
+else:
+    # --write-ppm: Datei wird jeweils komplett ersetzt, also immer neu öffnen
+    while True:
+        try:
+            im = Image.open(filename)
+            im.load()
+        except Exception as e:
+            print(e)
+            sleep(0.1)
+        else:
+            show(im)
+            sleep(0.5)
@@ -12,9 +12,15 @@ if [ -z "$selection" ]; then
   exit 1
 fi
 
-# warten wegen Netzwerk usw.
+# warten wegen Netzwerk, Uhrzeit usw.
 # besser wäre es, wenn systemd-time-wait-sync.service verfügbar wäre
-if [[ ! ( -z "$sleeptime" || $sleeptime -eq 0 )]]; then
+# nicht nötig, wenn es gespeicherte Daten (--last-good) gibt und die Uhr schon synchronisiert ist: die Daten werden
+# angezeigt, bis Netzwerk und neue Daten da sind. Ohne RTC läuft die Uhr bis zur Synchronisation mit der Zeit von
+# fake-hwclock (ungefähr die vom Herunterfahren), dann also weiter warten.
+clocksynced() {
+  [ "$(timedatectl show -p NTPSynchronized --value 2>/dev/null)" = "yes" ]
+}
+if [[ ! ( -z "$sleeptime" || $sleeptime -eq 0 ) ]] && ! { [ -f last-good.pickle ] && clocksynced; }; then
   echo "sleeping $sleeptime s"
   sleep $sleeptime
   addsleep=3